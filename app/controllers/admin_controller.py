@@ -0,0 +1,62 @@
+from fastapi import APIRouter, status
+from typing import Dict, Any
+from app.monitoring.slow_queries import slow_query_log
+from app.repositories.compuesto_repo import CompuestoRepository
+from app.repositories.medicamentos_repo import MedicamentoRepository
+from app.repositories.views_repo import MaterializedViewRepository
+from app.services.stats_service import StatsService
+from app.services.admission import LIMITERS, admit
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+@router.get("/cache", status_code=status.HTTP_200_OK)
+async def get_cache_stats() -> Dict[str, Any]:
+    """Endpoint para consultar los contadores de la cache y del loader de get_by_id"""
+    return {
+        "medicamentos": {**MedicamentoRepository.cache.stats(), "loader": MedicamentoRepository.loader.stats()},
+        "compuestos": {
+            **CompuestoRepository.cache.stats(),
+            "loader": CompuestoRepository.loader.stats(),
+            "snapshot": CompuestoRepository.snapshot.stats() if CompuestoRepository.snapshot is not None else None
+        }
+    }
+
+@router.delete("/cache", status_code=status.HTTP_200_OK)
+async def clear_cache() -> Dict[str, Any]:
+    """Endpoint para vaciar la cache de get_by_id"""
+    MedicamentoRepository.cache.clear()
+    CompuestoRepository.cache.clear()
+    return {"cleared": True}
+
+
+@router.post("/views/rebuild", status_code=status.HTTP_200_OK, dependencies=[admit("heavy")])
+async def rebuild_views() -> Dict[str, Any]:
+    """Endpoint para reconstruir las vistas materializadas desde las colecciones fuente"""
+    return {
+        "enabled": MaterializedViewRepository.enabled,
+        "documents": await MaterializedViewRepository.rebuild()
+    }
+
+@router.post("/stats/recompute", status_code=status.HTTP_200_OK, dependencies=[admit("heavy")])
+async def recompute_stats() -> Dict[str, Any]:
+    """Endpoint para recalcular los contadores de /api/stats desde las colecciones fuente"""
+    return await StatsService.recompute()
+
+@router.get("/admission", status_code=status.HTTP_200_OK)
+async def get_admission_stats() -> Dict[str, Any]:
+    """Endpoint para consultar los limites de concurrencia por clase de ruta y su ocupacion en este worker"""
+    return {name: limiter.stats() for name, limiter in LIMITERS.items()}
+
+@router.get("/slow-queries", status_code=status.HTTP_200_OK)
+async def get_slow_queries() -> Dict[str, Any]:
+    """Endpoint para consultar las consultas lentas registradas, con su explain cuando se capturo"""
+    return {
+        "threshold_ms": slow_query_log.threshold * 1000,
+        "records": slow_query_log.records()
+    }
+
+@router.delete("/slow-queries", status_code=status.HTTP_200_OK)
+async def clear_slow_queries() -> Dict[str, Any]:
+    """Endpoint para vaciar el registro de consultas lentas"""
+    slow_query_log.clear()
+    return {"cleared": True}
@@ -1,38 +1,124 @@
-from fastapi import APIRouter, status, Response
-from typing import List, Dict, Any
+from fastapi import APIRouter, status, Response, Query, Body, Header
+from fastapi.responses import ORJSONResponse
+from typing import List, Dict, Any, Optional
 from app.models.compuesto import Compuesto
+from app.models.page import CompuestoPage
 from app.services.compuesto_service import CompuestoService
+from app.services.conditional import document_headers, etag_matches, make_etag, not_modified, validator_headers
+from app.services.job_service import JobService
+from app.services.admission import admit, admitted_stream
 
 
 router = APIRouter(prefix="/api/compuestos", tags=["compuestos"])
 
-@router.get("/",response_model=List[Compuesto],status_code=status.HTTP_200_OK)
-async def get_all_compuestos() -> List[Compuesto]:
-    """Endpoint para obtener todos los compuestos"""
-    return await CompuestoService.get_all_compuestos()
+@router.get("/",response_model=CompuestoPage,status_code=status.HTTP_200_OK,dependencies=[admit("list")])
+async def get_all_compuestos(
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = None,
+    sort: str = Query("_id", pattern="^(_id|nombre)$"),
+    ids: Optional[str] = Query(None, description="IDs separados por coma; se resuelven en una sola consulta"),
+    fields: Optional[str] = Query(None, description="Campos a devolver separados por coma, p. ej. nombre")
+) -> CompuestoPage:
+    """Endpoint para obtener los compuestos paginados por cursor o por lista de IDs"""
+    id_list = [id.strip() for id in ids.split(",") if id.strip()] if ids else None
+    # respuesta directa: los documentos ya vienen con la forma del modelo
+    return ORJSONResponse(await CompuestoService.get_all_compuestos(limit, after, sort, id_list, fields))
 
-@router.get("/{compuesto_id}", response_model=Compuesto, status_code=status.HTTP_200_OK)
-async def get_compuesto_by_id(compuesto_id: str) -> Compuesto:
+@router.get("/export", status_code=status.HTTP_200_OK)
+async def export_compuestos(batch_size: int = Query(1000, ge=1, le=10000)):
+    """Endpoint para exportar todos los compuestos como NDJSON en streaming"""
+    # el turno "heavy" se mantiene hasta enviar la ultima linea
+    return await admitted_stream(
+        "heavy",
+        CompuestoService.export_compuestos(batch_size),
+        media_type="application/x-ndjson"
+    )
+
+@router.get("/search", status_code=status.HTTP_200_OK, dependencies=[admit("list")])
+async def search_compuestos(q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=100)):
+    """Endpoint para buscar compuestos por nombre (sin distinguir tildes ni mayusculas)"""
+    return await CompuestoService.search_compuestos(q, limit)
+
+@router.get("/autocomplete", status_code=status.HTTP_200_OK, dependencies=[admit("point")])
+async def autocomplete_compuestos(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=50)):
+    """Endpoint para sugerir compuestos cuyo nombre empieza por q"""
+    return await CompuestoService.autocomplete_compuestos(q, limit)
+
+@router.get("/{compuesto_id}", response_model=Compuesto, status_code=status.HTTP_200_OK, dependencies=[admit("point")])
+async def get_compuesto_by_id(
+    compuesto_id: str,
+    response: Response,
+    fields: Optional[str] = Query(None, description="Campos a devolver separados por coma"),
+    if_none_match: Optional[str] = Header(None)
+):
     """Endpoint para obtener un compuesto por su ID"""
-    return await CompuestoService.get_compuesto_by_id(compuesto_id)
+    version = await CompuestoService.get_compuesto_version(compuesto_id)
+    headers = validator_headers(make_etag(compuesto_id, version, fields and f"fields={fields}"), version)
+    if etag_matches(if_none_match, headers["ETag"]):
+        # 304 sin leer ni serializar el documento
+        return not_modified(headers)
+    result = await CompuestoService.get_compuesto_by_id(compuesto_id, fields)
+    if fields is not None:
+        # respuesta parcial: no se valida contra el modelo completo
+        return ORJSONResponse(result, headers=headers)
+    response.headers.update(headers)
+    return result
 
-@router.get("/{compuesto_id}/medicamentos",status_code=status.HTTP_200_OK)
-async def get_medicamentos_by_compuesto(compuesto_id: str):
+@router.get("/{compuesto_id}/medicamentos", status_code=status.HTTP_200_OK, dependencies=[admit("heavy")])
+async def get_medicamentos_by_compuesto(
+    compuesto_id: str,
+    fields: Optional[str] = Query(None, description="Campos a devolver separados por coma"),
+    if_none_match: Optional[str] = Header(None)
+):
     """Endpoint para obtener medicamentos por ID de compuesto"""
-    return await CompuestoService.get_medicamentos_by_compuesto(compuesto_id)
+    # las escrituras de relaciones incrementan la version del compuesto
+    version = await CompuestoService.get_compuesto_version(compuesto_id)
+    headers = validator_headers(make_etag(compuesto_id, version, f"medicamentos-{fields}" if fields else "medicamentos"), version)
+    if etag_matches(if_none_match, headers["ETag"]):
+        return not_modified(headers)
+    return ORJSONResponse(await CompuestoService.get_medicamentos_by_compuesto(compuesto_id, fields), headers=headers)
 
-@router.post("/", response_model=Compuesto, status_code=status.HTTP_201_CREATED)
+@router.post("/", response_model=Compuesto, status_code=status.HTTP_201_CREATED, dependencies=[admit("write")])
 async def create_compuesto(compuesto: Compuesto):
     """Endpoint para crear un nuevo compuesto"""
     return await CompuestoService.create_compuesto(compuesto)
 
-@router.put("/{compuesto_id}", response_model=Compuesto, status_code=status.HTTP_200_OK)
-async def update_compuesto(compuesto_id: str, compuesto: Compuesto):
-    """Endpoint para actualizar un compuesto"""
-    return await CompuestoService.update_compuesto(compuesto_id, compuesto)
+@router.post("/bulk", response_model=List[Dict[str, Any]], status_code=status.HTTP_200_OK, dependencies=[admit("heavy")])
+async def create_compuestos(compuestos: List[Compuesto]):
+    """Endpoint para crear varios compuestos en una sola escritura"""
+    return await CompuestoService.create_compuestos(compuestos)
+
+@router.put("/{compuesto_id}", response_model=Compuesto, status_code=status.HTTP_200_OK, dependencies=[admit("write")])
+async def update_compuesto(compuesto_id: str, compuesto: Compuesto, response: Response, if_match: Optional[str] = Header(None)):
+    """Endpoint para actualizar un compuesto; con If-Match solo si no cambio desde esa ETag"""
+    updated = await CompuestoService.update_compuesto(compuesto_id, compuesto, if_match)
+    response.headers.update(document_headers(compuesto_id, updated))
+    return updated
+
+@router.patch("/{compuesto_id}", response_model=Compuesto, status_code=status.HTTP_200_OK, dependencies=[admit("write")])
+async def patch_compuesto(
+    compuesto_id: str,
+    response: Response,
+    patch: Dict[str, Any] = Body(..., media_type="application/merge-patch+json"),
+    if_match: Optional[str] = Header(None)
+):
+    """Endpoint para modificar solo algunos campos de un compuesto (JSON Merge Patch); sin cambios no escribe"""
+    patched = await CompuestoService.patch_compuesto(compuesto_id, patch, if_match)
+    response.headers.update(document_headers(compuesto_id, patched))
+    return patched
+
+@router.post("/bulk-delete", status_code=status.HTTP_200_OK, dependencies=[admit("heavy")])
+async def delete_compuestos(ids: List[str] = Body(..., embed=True)):
+    """Endpoint para eliminar varios compuestos y sus relaciones; con muchas relaciones responde 202 con el trabajo"""
+    result = await CompuestoService.delete_compuestos(ids)
+    if "job" in result:
+        return JobService.accepted(result)
+    return result
 
-@router.delete("/{compuesto_id}", status_code=status.HTTP_200_OK)
-async def delete_compuesto(compuesto_id: str):
-    """Endpoint para eliminar un compuesto"""
-    result = await CompuestoService.delete_compuesto(compuesto_id)
+@router.delete("/{compuesto_id}", status_code=status.HTTP_200_OK, dependencies=[admit("heavy")])
+async def delete_compuesto(compuesto_id: str, if_match: Optional[str] = Header(None)):
+    """Endpoint para eliminar un compuesto; con If-Match solo si no cambio desde esa ETag, con muchas relaciones responde 202"""
+    result = await CompuestoService.delete_compuesto(compuesto_id, if_match)
+    if "job" in result:
+        return JobService.accepted(result)
     return result
\ No newline at end of file
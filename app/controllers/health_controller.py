@@ -0,0 +1,24 @@
+import asyncio
+import os
+from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
+from app.db.mongo import ping
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+# un probe no debe esperar los 30 s de serverSelectionTimeoutMS
+PING_TIMEOUT_SECONDS = float(os.getenv("HEALTH_PING_TIMEOUT_SECONDS", "2"))
+
+@router.get("/live", include_in_schema=False)
+async def live() -> dict:
+    """Endpoint de liveness: el proceso responde"""
+    return {"status": "ok"}
+
+@router.get("/ready", include_in_schema=False)
+async def ready() -> ORJSONResponse:
+    """Endpoint de readiness: 200 si la base responde a un ping, 503 si no"""
+    try:
+        await asyncio.wait_for(ping(), PING_TIMEOUT_SECONDS)
+    except Exception as e:
+        return ORJSONResponse({"status": "unavailable", "mongo": str(e) or type(e).__name__}, status_code=503)
+    return ORJSONResponse({"status": "ok", "mongo": "ok"})
@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Query, status
+from typing import Any, Dict, List, Optional
+from app.services.job_service import JobService
+from app.services.admission import admit
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+@router.get("/", status_code=status.HTTP_200_OK, dependencies=[admit("list")])
+async def list_jobs(
+    status_filter: Optional[str] = Query(None, alias="status", pattern="^(queued|running|done|failed)$"),
+    limit: int = Query(20, ge=1, le=100)
+) -> List[Dict[str, Any]]:
+    """Endpoint para listar los trabajos en segundo plano, los mas recientes primero"""
+    return await JobService.list_jobs(status_filter, limit)
+
+@router.get("/{job_id}", status_code=status.HTTP_200_OK, dependencies=[admit("point")])
+async def get_job(job_id: str) -> Dict[str, Any]:
+    """Endpoint para consultar el estado y el progreso de un trabajo"""
+    return await JobService.get_job(job_id)
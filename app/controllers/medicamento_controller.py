@@ -1,32 +1,121 @@
-from fastapi import APIRouter, status, Response, Body
-from typing import List, Dict, Any
+from fastapi import APIRouter, status, Response, Query, Body, Header
+from fastapi.responses import ORJSONResponse
+from typing import List, Dict, Any, Optional
 from app.models.medicamento import Medicamento
+from app.models.page import MedicamentoPage
 from app.models.compuesto_med import CompuestoPorMedicamento
+from app.models.medicamento_detalle import MedicamentoDetalle
 from app.services.medicamento_service import MedicamentoService
+from app.services.conditional import document_headers, etag_matches, make_etag, not_modified, validator_headers
+from app.services.job_service import JobService
+from app.services.admission import admit, admitted_stream
 
 router = APIRouter(prefix="/api/medicamentos", tags=["medicamentos"])
 
-@router.get("/", response_model=List[Medicamento], status_code=status.HTTP_200_OK)
-async def get_all_medicamentos():
-    """Endpoint para obtener todos los medicamentos"""
-    return await MedicamentoService.get_all_medicamentos()
+@router.get("/", response_model=MedicamentoPage, status_code=status.HTTP_200_OK, dependencies=[admit("list")])
+async def get_all_medicamentos(
+    limit: int = Query(100, ge=1, le=1000),
+    after: Optional[str] = None,
+    sort: str = Query("_id", pattern="^(_id|nombre)$"),
+    ids: Optional[str] = Query(None, description="IDs separados por coma; se resuelven en una sola consulta"),
+    fields: Optional[str] = Query(None, description="Campos a devolver separados por coma, p. ej. nombre")
+):
+    """Endpoint para obtener los medicamentos paginados por cursor o por lista de IDs"""
+    id_list = [id.strip() for id in ids.split(",") if id.strip()] if ids else None
+    # respuesta directa: los documentos ya vienen con la forma del modelo
+    return ORJSONResponse(await MedicamentoService.get_all_medicamentos(limit, after, sort, id_list, fields))
+
+@router.get("/export", status_code=status.HTTP_200_OK)
+async def export_medicamentos(batch_size: int = Query(1000, ge=1, le=10000)):
+    """Endpoint para exportar todos los medicamentos como NDJSON en streaming"""
+    # el turno "heavy" se mantiene hasta enviar la ultima linea
+    return await admitted_stream(
+        "heavy",
+        MedicamentoService.export_medicamentos(batch_size),
+        media_type="application/x-ndjson"
+    )
+
+@router.get("/search", status_code=status.HTTP_200_OK, dependencies=[admit("list")])
+async def search_medicamentos(q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=100)):
+    """Endpoint para buscar medicamentos por nombre (sin distinguir tildes ni mayusculas)"""
+    return await MedicamentoService.search_medicamentos(q, limit)
+
+@router.get("/autocomplete", status_code=status.HTTP_200_OK, dependencies=[admit("point")])
+async def autocomplete_medicamentos(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=50)):
+    """Endpoint para sugerir medicamentos cuyo nombre empieza por q"""
+    return await MedicamentoService.autocomplete_medicamentos(q, limit)
 
-@router.get("/{medicamento_id}", response_model=Medicamento, status_code=status.HTTP_200_OK)
-async def get_medicamento_by_id(medicamento_id: str):
+@router.get("/by-compuestos", status_code=status.HTTP_200_OK, dependencies=[admit("heavy")])
+async def find_medicamentos_by_compuestos(
+    ids: str = Query(..., description="IDs de compuestos separados por coma"),
+    match: str = Query("all", pattern="^(all|any)$", description="all: contienen todos; any: contienen alguno"),
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = Query(None, description="Campos a devolver separados por coma")
+):
+    """Endpoint para buscar los medicamentos que contienen todos (o alguno) de los compuestos"""
+    id_list = [id.strip() for id in ids.split(",") if id.strip()]
+    return ORJSONResponse(await MedicamentoService.find_medicamentos_by_compuestos(id_list, match, limit, fields))
+
+@router.get("/{medicamento_id}", response_model=Medicamento, status_code=status.HTTP_200_OK, dependencies=[admit("point")])
+async def get_medicamento_by_id(
+    medicamento_id: str,
+    response: Response,
+    fields: Optional[str] = Query(None, description="Campos a devolver separados por coma"),
+    if_none_match: Optional[str] = Header(None)
+):
     """Endpoint para obtener un medicamento por su ID"""
-    return await MedicamentoService.get_medicamento_by_id(medicamento_id)
+    version = await MedicamentoService.get_medicamento_version(medicamento_id)
+    headers = validator_headers(make_etag(medicamento_id, version, fields and f"fields={fields}"), version)
+    if etag_matches(if_none_match, headers["ETag"]):
+        # 304 sin leer ni serializar el documento
+        return not_modified(headers)
+    result = await MedicamentoService.get_medicamento_by_id(medicamento_id, fields)
+    if fields is not None:
+        # respuesta parcial: no se valida contra el modelo completo
+        return ORJSONResponse(result, headers=headers)
+    response.headers.update(headers)
+    return result
 
-@router.get("/{medicamento_id}/compuestos", status_code=status.HTTP_200_OK)
-async def get_compuestos_by_medicamento(medicamento_id: str):
+@router.get("/{medicamento_id}/detail", response_model=MedicamentoDetalle, status_code=status.HTTP_200_OK, dependencies=[admit("heavy")])
+async def get_medicamento_detail(medicamento_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
+    """Endpoint para obtener un medicamento con sus compuestos en una sola consulta"""
+    version = await MedicamentoService.get_medicamento_version(medicamento_id)
+    headers = validator_headers(make_etag(medicamento_id, version, "detail"), version)
+    if etag_matches(if_none_match, headers["ETag"]):
+        return not_modified(headers)
+    response.headers.update(headers)
+    return await MedicamentoService.get_medicamento_detail(medicamento_id)
+
+@router.get("/{medicamento_id}/compuestos", status_code=status.HTTP_200_OK, dependencies=[admit("heavy")])
+async def get_compuestos_by_medicamento(
+    medicamento_id: str,
+    fields: Optional[str] = Query(None, description="Campos a devolver separados por coma"),
+    if_none_match: Optional[str] = Header(None)
+):
     """Endpoint para obtener todos los compuestos de un medicamento"""
-    return await MedicamentoService.get_compuestos_by_medicamento(medicamento_id)
+    # las escrituras de relaciones incrementan la version del medicamento
+    version = await MedicamentoService.get_medicamento_version(medicamento_id)
+    headers = validator_headers(make_etag(medicamento_id, version, f"compuestos-{fields}" if fields else "compuestos"), version)
+    if etag_matches(if_none_match, headers["ETag"]):
+        return not_modified(headers)
+    return ORJSONResponse(await MedicamentoService.get_compuestos_by_medicamento(medicamento_id, fields), headers=headers)
 
-@router.post("/", response_model=Medicamento, status_code=status.HTTP_201_CREATED)
+@router.post("/", response_model=Medicamento, status_code=status.HTTP_201_CREATED, dependencies=[admit("write")])
 async def create_medicamento(medicamento: Medicamento):
     """Endpoint para crear un nuevo medicamento"""
     return await MedicamentoService.create_medicamento(medicamento)
 
-@router.post("/{medicamento_id}/compuestos", response_model=Dict[str, Any], status_code=status.HTTP_201_CREATED)
+@router.post("/bulk", response_model=List[Dict[str, Any]], status_code=status.HTTP_200_OK, dependencies=[admit("heavy")])
+async def create_medicamentos(medicamentos: List[Medicamento]):
+    """Endpoint para crear varios medicamentos en una sola escritura"""
+    return await MedicamentoService.create_medicamentos(medicamentos)
+
+@router.post("/compuestos/bulk", response_model=List[Dict[str, Any]], status_code=status.HTTP_200_OK, dependencies=[admit("heavy")])
+async def add_compuestos_to_medicamentos(relaciones: List[CompuestoPorMedicamento]):
+    """Endpoint para agregar varios compuestos a medicamentos en una sola escritura"""
+    return await MedicamentoService.add_compuestos_to_medicamentos(relaciones)
+
+@router.post("/{medicamento_id}/compuestos", response_model=Dict[str, Any], status_code=status.HTTP_201_CREATED, dependencies=[admit("write")])
 async def add_compuesto_to_medicamento(
     medicamento_id: str,
     compuesto_id: str = Body(..., embed=True),
@@ -49,13 +138,35 @@ async def add_compuesto_to_medicamento(
         }
     return {"success": False, "message": "Failed to add compuesto to medicamento"}
 
-@router.put("/{medicamento_id}", response_model=Medicamento, status_code=status.HTTP_200_OK)
-async def update_medicamento(medicamento_id: str, medicamento: Medicamento):
-    """Endpoint para actualizar un medicamento"""
-    return await MedicamentoService.update_medicamento(medicamento_id, medicamento)
+@router.put("/{medicamento_id}", response_model=Medicamento, status_code=status.HTTP_200_OK, dependencies=[admit("write")])
+async def update_medicamento(medicamento_id: str, medicamento: Medicamento, response: Response, if_match: Optional[str] = Header(None)):
+    """Endpoint para actualizar un medicamento; con If-Match solo si no cambio desde esa ETag"""
+    updated = await MedicamentoService.update_medicamento(medicamento_id, medicamento, if_match)
+    response.headers.update(document_headers(medicamento_id, updated))
+    return updated
+
+@router.patch("/{medicamento_id}", response_model=Medicamento, status_code=status.HTTP_200_OK, dependencies=[admit("write")])
+async def patch_medicamento(
+    medicamento_id: str,
+    response: Response,
+    patch: Dict[str, Any] = Body(..., media_type="application/merge-patch+json"),
+    if_match: Optional[str] = Header(None)
+):
+    """Endpoint para modificar solo algunos campos de un medicamento (JSON Merge Patch); sin cambios no escribe"""
+    patched = await MedicamentoService.patch_medicamento(medicamento_id, patch, if_match)
+    response.headers.update(document_headers(medicamento_id, patched))
+    return patched
+
+@router.post("/bulk-delete", status_code=status.HTTP_200_OK, dependencies=[admit("heavy")])
+async def delete_medicamentos(ids: List[str] = Body(..., embed=True)):
+    """Endpoint para eliminar varios medicamentos y sus relaciones; con muchas relaciones responde 202 con el trabajo"""
+    result = await MedicamentoService.delete_medicamentos(ids)
+    if "job" in result:
+        return JobService.accepted(result)
+    return result
 
-@router.delete("/{medicamento_id}", status_code=status.HTTP_200_OK)
-async def delete_medicamento(medicamento_id: str):
-    """Endpoint para eliminar un medicamento"""
-    result = await MedicamentoService.delete_medicamento(medicamento_id)
+@router.delete("/{medicamento_id}", status_code=status.HTTP_200_OK, dependencies=[admit("write")])
+async def delete_medicamento(medicamento_id: str, if_match: Optional[str] = Header(None)):
+    """Endpoint para eliminar un medicamento; con If-Match solo si no cambio desde esa ETag"""
+    result = await MedicamentoService.delete_medicamento(medicamento_id, if_match)
     return result
\ No newline at end of file
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Query, status
+from typing import Any, Dict, List
+from app.services.stats_service import StatsService
+from app.services.admission import admit
+
+router = APIRouter(prefix="/api/stats", tags=["stats"])
+
+@router.get("/", status_code=status.HTTP_200_OK, dependencies=[admit("list")])
+async def get_stats() -> Dict[str, Any]:
+    """Endpoint con los totales y los promedios de compuestos por medicamento y medicamentos por compuesto"""
+    return await StatsService.get_summary()
+
+@router.get("/fabricantes", status_code=status.HTTP_200_OK, dependencies=[admit("list")])
+async def get_fabricantes(limit: int = Query(20, ge=1, le=1000)) -> List[Dict[str, Any]]:
+    """Endpoint con los fabricantes con mas medicamentos"""
+    return await StatsService.get_ranking("fabricante", "fabricante", limit)
+
+@router.get("/unidades", status_code=status.HTTP_200_OK, dependencies=[admit("list")])
+async def get_unidades(limit: int = Query(20, ge=1, le=1000)) -> List[Dict[str, Any]]:
+    """Endpoint con las unidades de medida mas usadas en las relaciones"""
+    return await StatsService.get_ranking("unidad", "unidad_medida", limit)
+
+@router.get("/compuestos", status_code=status.HTTP_200_OK, dependencies=[admit("list")])
+async def get_top_compuestos(limit: int = Query(20, ge=1, le=1000)) -> List[Dict[str, Any]]:
+    """Endpoint con los compuestos presentes en mas medicamentos"""
+    return await StatsService.get_top_compuestos(limit)
+
+@router.get("/medicamentos", status_code=status.HTTP_200_OK, dependencies=[admit("list")])
+async def get_top_medicamentos(limit: int = Query(20, ge=1, le=1000)) -> List[Dict[str, Any]]:
+    """Endpoint con los medicamentos con mas compuestos"""
+    return await StatsService.get_top_medicamentos(limit)
@@ -0,0 +1,98 @@
+"""
+Causally consistent sessions carried across requests in a header.
+
+Only active when MONGO_READ_PREFERENCE sends reads to secondaries. A request
+that writes, or that sends an X-Session-Token header, runs inside a causally
+consistent session; the response carries an X-Session-Token with the
+session's operation and cluster time. A client that sends that token back
+reads at least what its earlier requests wrote, whichever worker or replica
+set member serves it. Requests without a token and without writes run
+without a session, as before.
+"""
+
+import base64
+import binascii
+from typing import Any, Dict, Optional
+import bson
+import orjson
+from bson.errors import BSONError
+from bson.timestamp import Timestamp
+from app.db.mongo import current_session, get_client, routes_reads
+
+SESSION_TOKEN_HEADER = "x-session-token"
+_WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+def encode_token(session) -> str:
+    """Operation and cluster time of a session as an opaque header value"""
+    document = {"operationTime": session.operation_time, "clusterTime": session.cluster_time}
+    return base64.urlsafe_b64encode(bson.encode(document)).decode("ascii")
+
+
+def decode_token(token: str) -> Dict[str, Any]:
+    """Inverse of encode_token; ValueError if the token is malformed"""
+    try:
+        document = bson.decode(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (binascii.Error, BSONError, UnicodeEncodeError) as e:
+        raise ValueError("Malformed session token") from e
+    operation_time = document.get("operationTime")
+    cluster_time = document.get("clusterTime")
+    if not isinstance(operation_time, Timestamp) or not isinstance(cluster_time, dict) \
+            or not isinstance(cluster_time.get("clusterTime"), Timestamp):
+        raise ValueError("Malformed session token")
+    return document
+
+
+def _header(scope, name: str) -> Optional[str]:
+    encoded = name.encode("latin-1")
+    for key, value in scope["headers"]:
+        if key == encoded:
+            return value.decode("latin-1")
+    return None
+
+
+class CausalConsistencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.enabled = routes_reads()
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _header(scope, SESSION_TOKEN_HEADER)
+        if token is None and scope["method"] not in _WRITE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        times = None
+        if token is not None:
+            try:
+                times = decode_token(token)
+            except ValueError as e:
+                await send({
+                    "type": "http.response.start",
+                    "status": 400,
+                    "headers": [(b"content-type", b"application/json")],
+                })
+                await send({"type": "http.response.body", "body": orjson.dumps({"detail": str(e)})})
+                return
+
+        async with await get_client().start_session(causal_consistency=True) as session:
+            if times is not None:
+                session.advance_cluster_time(times["clusterTime"])
+                session.advance_operation_time(times["operationTime"])
+
+            async def send_with_token(message):
+                if message["type"] == "http.response.start" and session.operation_time is not None:
+                    headers = list(message.get("headers", []))
+                    headers.append((SESSION_TOKEN_HEADER.encode("latin-1"), encode_token(session).encode("ascii")))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            reset = current_session.set(session)
+            try:
+                await self.app(scope, receive, send_with_token)
+            finally:
+                current_session.reset(reset)
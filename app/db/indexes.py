@@ -0,0 +1,117 @@
+"""
+Declarative index definitions for the MongoDB collections.
+
+Definitions live next to the JSON schemas in app/schemas/ and are shared by the
+create_collections script (creation) and the API startup check (drift detection).
+"""
+
+import json
+import logging
+import os
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "schemas")
+
+INDEX_FILES = {
+    "compuestos": "compuestos_indexes.json",
+    "medicamentos": "medicamentos_indexes.json",
+    "compuestos_por_medicamento": "compuestos_medicamentos_indexes.json",
+}
+
+# Collation del indice nombre_es_ci; las consultas deben usar la misma para aprovecharlo
+NOMBRE_COLLATION = {"locale": "es", "strength": 1}
+
+# Opciones de create_index que se copian desde la definicion
+INDEX_OPTIONS = ("unique", "collation", "default_language", "weights", "sparse")
+
+
+def load_index_definitions(collection_name: str) -> List[Dict[str, Any]]:
+    """Load the index definitions for a collection"""
+    path = os.path.join(SCHEMA_DIR, INDEX_FILES[collection_name])
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["indexes"]
+
+
+def index_keys(definition: Dict[str, Any]) -> List[tuple]:
+    """Key specification of a definition as a list of (field, direction) tuples"""
+    return [(field, direction) for field, direction in definition["key"]]
+
+
+def index_options(definition: Dict[str, Any]) -> Dict[str, Any]:
+    """Keyword options for create_index"""
+    options = {"name": definition["name"]}
+    for option in INDEX_OPTIONS:
+        if option in definition:
+            options[option] = definition[option]
+    return options
+
+
+def _live_keys(info: Dict[str, Any]) -> List[tuple]:
+    # los indices de texto se reportan como _fts/_ftsx en vez de los campos
+    if "weights" in info:
+        return [(field, "text") for field in sorted(info["weights"])]
+    return [(field, int(direction) if isinstance(direction, (int, float)) else direction)
+            for field, direction in info["key"]]
+
+
+def _expected_keys(definition: Dict[str, Any]) -> List[tuple]:
+    keys = index_keys(definition)
+    if any(direction == "text" for _, direction in keys):
+        return [(field, "text") for field in sorted(field for field, _ in keys)]
+    return keys
+
+
+def diff_indexes(definitions: List[Dict[str, Any]], live: Dict[str, Dict[str, Any]]) -> List[str]:
+    """Compare definitions against index_information() output and describe the drift"""
+    problems = []
+    for definition in definitions:
+        name = definition["name"]
+        info = live.get(name)
+        if info is None:
+            problems.append(f"missing index '{name}'")
+            continue
+        if _live_keys(info) != _expected_keys(definition):
+            problems.append(f"index '{name}' has keys {info['key']}, expected {definition['key']}")
+        if bool(info.get("unique", False)) != bool(definition.get("unique", False)):
+            problems.append(f"index '{name}' unique={bool(info.get('unique', False))}, expected {bool(definition.get('unique', False))}")
+        if "collation" in definition:
+            live_locale = (info.get("collation") or {}).get("locale")
+            live_strength = (info.get("collation") or {}).get("strength")
+            if live_locale != definition["collation"].get("locale") or live_strength != definition["collation"].get("strength"):
+                problems.append(f"index '{name}' collation differs from definition")
+
+    defined = {definition["name"] for definition in definitions}
+    for name in live:
+        if name != "_id_" and name not in defined:
+            problems.append(f"unexpected index '{name}'")
+    return problems
+
+
+async def verify_indexes(db, mode: str = None) -> Dict[str, List[str]]:
+    """Check live indexes against the definitions at startup.
+
+    mode is 'warn' (log drift), 'fail' (raise RuntimeError) or 'off'; it
+    defaults to the INDEX_CHECK environment variable.
+    """
+    mode = (mode or os.getenv("INDEX_CHECK", "warn")).lower()
+    if mode == "off":
+        return {}
+
+    drift = {}
+    for collection_name in INDEX_FILES:
+        live = await db[collection_name].index_information()
+        problems = diff_indexes(load_index_definitions(collection_name), live)
+        if problems:
+            drift[collection_name] = problems
+
+    for collection_name, problems in drift.items():
+        for problem in problems:
+            logger.warning("Index drift in %s: %s", collection_name, problem)
+
+    if drift and mode == "fail":
+        raise RuntimeError(
+            "Live indexes do not match app/schemas definitions; run app/db/scripts/create_collections.py"
+        )
+    return drift
@@ -0,0 +1,23 @@
+"""
+Background jobs queued in the jobs collection.
+
+Each job is one document {_id, tipo, params, status, processed, total,
+attempts, error, created_at, started_at, updated_at, finished_at,
+lease_until}. A worker claims a queued job (or a running one whose lease
+expired because its worker stopped) with one find_one_and_update, and
+renews the lease on every batch, so jobs survive restarts and are never run
+by two workers at once.
+"""
+
+import os
+
+JOBS_COLLECTION = "jobs"
+JOB_STATUSES = ("queued", "running", "done", "failed")
+
+# La cola se lee por estado en orden de llegada
+JOBS_INDEXES = [("status", 1), ("created_at", 1)]
+
+
+def jobs_enabled() -> bool:
+    """Background jobs are opt-in through JOBS=1"""
+    return os.getenv("JOBS", "0").lower() in ("1", "true", "yes")
@@ -1,9 +1,246 @@
+"""
+Mongo client lifecycle and collection access.
+
+The client is created by connect() in the FastAPI lifespan, with pool,
+timeout and compression settings from the environment, and closed on
+shutdown. Repositories declare collections with CollectionRef, which resolves
+against the current client on every access instead of binding a collection
+at import time.
+
+Read-only repository methods use read collections, routed with
+MONGO_READ_PREFERENCE (bounded by MONGO_MAX_STALENESS_SECONDS); writes always
+go to the primary. While a request runs inside a causally consistent session
+(see app/db/causal.py) that session is passed to every operation that does
+not name one explicitly.
+"""
+
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import contextvars
+import functools
+import logging
 import os
+from app.monitoring.listeners import CommandMetricsListener, PoolMetricsListener
 
 load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
+DB_NAME = "medicamentos_db"
+# Las transacciones requieren un replica set (Atlas lo es); MONGO_TRANSACTIONS=0 para un mongod standalone
+USE_TRANSACTIONS = os.getenv("MONGO_TRANSACTIONS", "1").lower() not in ("0", "false", "no")
+
+logger = logging.getLogger(__name__)
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+# Sesion causal de la peticion en curso; la fija CausalConsistencyMiddleware
+current_session: contextvars.ContextVar = contextvars.ContextVar("mongo_session", default=None)
+# Acciones en memoria (caches) que esperan a que confirme la transaccion en curso
+_after_commit: contextvars.ContextVar = contextvars.ContextVar("after_commit", default=None)
+
+_client: Optional[AsyncIOMotorClient] = None
+_collections: Dict[Tuple[str, bool], "SessionCollection"] = {}
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else None
+
+
+def client_options() -> Dict[str, Any]:
+    """Pool, timeout and compression settings for AsyncIOMotorClient from the environment"""
+    options = {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE"),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE"),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS"),
+        "maxConnecting": _env_int("MONGO_MAX_CONNECTING"),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS"),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS"),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS"),
+        "zlibCompressionLevel": _env_int("MONGO_ZLIB_COMPRESSION_LEVEL"),
+    }
+    compressors = os.getenv("MONGO_COMPRESSORS")
+    if compressors:
+        # p. ej. "zstd,snappy,zlib": el servidor elige el primero que soporte
+        options["compressors"] = compressors
+    # sin valor se usan los valores por defecto de pymongo (o los de MONGO_URI)
+    return {key: value for key, value in options.items() if value is not None}
+
+
+def read_preference():
+    """Read preference for read-only repository methods (MONGO_READ_PREFERENCE)"""
+    mode = os.getenv("MONGO_READ_PREFERENCE", "primary")
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"MONGO_READ_PREFERENCE must be one of {', '.join(READ_PREFERENCES)}, got {mode!r}")
+    if mode == "primary":
+        return Primary()
+    # -1: sin limite; si se fija, el servidor exige al menos 90 segundos
+    return READ_PREFERENCES[mode](max_staleness=_env_int("MONGO_MAX_STALENESS_SECONDS") or -1)
+
+
+READ_PREFERENCE = read_preference()
+
+
+def routes_reads() -> bool:
+    """True when read-only methods may be served by members other than the primary"""
+    return not isinstance(READ_PREFERENCE, Primary)
+
+
+def in_causal_session() -> bool:
+    """True while the current request runs inside a causally consistent session"""
+    return current_session.get() is not None
+
+
+def _new_client() -> AsyncIOMotorClient:
+    # los listeners alimentan las metricas de comandos y del pool expuestas en /metrics
+    return AsyncIOMotorClient(
+        MONGO_URI,
+        event_listeners=[CommandMetricsListener(), PoolMetricsListener()],
+        **client_options()
+    )
+
+
+def get_client() -> AsyncIOMotorClient:
+    """Current client; created on first use outside the lifespan (scripts, shells)"""
+    global _client
+    if _client is None:
+        _client = _new_client()
+    return _client
+
+
+def get_database():
+    return get_client()[DB_NAME]
+
+
+class SessionCollection:
+    """Collection proxy that passes the request's causal session to operations that take one"""
+
+    # metodos de Motor que aceptan session=
+    SESSION_METHODS = frozenset((
+        "find", "find_one", "aggregate", "distinct", "count_documents", "insert_one", "insert_many",
+        "update_one", "update_many", "replace_one", "delete_one", "delete_many", "bulk_write",
+        "find_one_and_update", "find_one_and_replace", "find_one_and_delete",
+    ))
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._collection, name)
+        if name not in self.SESSION_METHODS:
+            return attribute
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            session = current_session.get()
+            # una sesion explicita (p. ej. la de una transaccion) tiene prioridad
+            if session is not None and kwargs.get("session") is None:
+                kwargs["session"] = session
+            return attribute(*args, **kwargs)
+
+        return call
+
+
+def get_collection(name: str, read: bool = False) -> SessionCollection:
+    """Collection on the current client; read=True applies MONGO_READ_PREFERENCE"""
+    key = (name, read)
+    collection = _collections.get(key)
+    if collection is None:
+        motor_collection = get_database()[name]
+        if read and routes_reads():
+            motor_collection = motor_collection.with_options(read_preference=READ_PREFERENCE)
+        collection = _collections[key] = SessionCollection(motor_collection)
+    return collection
+
+
+class CollectionRef:
+    """Class attribute that resolves to a collection of the current client on each access"""
+
+    def __init__(self, name: str, read: bool = False):
+        self.name = name
+        self.read = read
+
+    def __get__(self, instance, owner) -> SessionCollection:
+        return get_collection(self.name, self.read)
+
+
+async def connect() -> None:
+    """Create the client and open minPoolSize connections before the worker takes traffic.
+
+    Raises if the database is not reachable within serverSelectionTimeoutMS,
+    so a worker without a database never starts serving.
+    """
+    global _client
+    if _client is None:
+        _client = _new_client()
+    _collections.clear()
+    # cada ping concurrente toma su propia conexion del pool
+    warm = max(1, _client.options.pool_options.min_pool_size)
+    pings = [_client.admin.command("ping") for _ in range(warm)]
+    if routes_reads():
+        # tambien los miembros que atenderan las lecturas
+        pings += [_client.admin.command("ping", read_preference=READ_PREFERENCE) for _ in range(warm)]
+    await asyncio.gather(*pings)
+    logger.info("Mongo connection pool warmed with %d connection(s) per member", warm)
+
+
+def close() -> None:
+    """Close the client and its sockets; a later access creates a new one"""
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+    _collections.clear()
+
+
+async def ping() -> None:
+    """Round trip to the primary; raises if the database is not reachable"""
+    await get_client().admin.command("ping")
+
+
+async def run_in_transaction(callback: Callable[[Any], Awaitable[Any]]) -> Any:
+    """Run callback(session) inside a transaction, retrying transient errors.
+
+    When transactions are disabled the callback gets session=None and runs
+    as plain independent writes.
+    """
+    if not USE_TRANSACTIONS:
+        return await callback(None)
+    pending: List[Callable[[], None]] = []
+
+    async def attempt(session) -> Any:
+        # un reintento vuelve a registrar sus acciones
+        pending.clear()
+        return await callback(session)
+
+    async with await get_client().start_session() as session:
+        token = _after_commit.set(pending)
+        try:
+            result = await session.with_transaction(attempt)
+        finally:
+            _after_commit.reset(token)
+        for action in pending:
+            action()
+        request_session = current_session.get()
+        if request_session is not None:
+            # las lecturas siguientes de la peticion deben ver lo escrito en la transaccion
+            request_session.advance_cluster_time(session.cluster_time)
+            request_session.advance_operation_time(session.operation_time)
+        return result
+
 
-client = AsyncIOMotorClient(MONGO_URI)
-db = client["medicamentos_db"]
\ No newline at end of file
+def after_commit(session, action: Callable[[], None]) -> None:
+    """Run action once the transaction of session commits, or right away for a write without one"""
+    pending = _after_commit.get() if session is not None else None
+    if pending is None:
+        action()
+    else:
+        pending.append(action)
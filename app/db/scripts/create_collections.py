@@ -1,13 +1,20 @@
 import json
 import os
+import sys
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
 from dotenv import load_dotenv
 
 """"
 This script creates collections in a MongoDB database with validation rules defined in JSON schema files.
+It also creates the indexes declared in the *_indexes.json files; running it again is safe.
 It uses the pymongo library to connect to the database and create collections.
 """
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from app.db.indexes import diff_indexes, index_keys, index_options, load_index_definitions
+
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
@@ -30,7 +37,30 @@ def create_collection(name, schema_filename):
     except Exception as e:
         print(f"Collection '{name}' already exists or failed: {e}")
 
-# Create all collections
-create_collection("compuestos", "compuestos_schema.json")
-create_collection("medicamentos", "medicamentos_schema.json")
-create_collection("compuestos_por_medicamento", "compuestos_medicamentos_schema.json")
+def create_indexes(name):
+    """Create the declared indexes of a collection; existing identical indexes are left as is"""
+    for definition in load_index_definitions(name):
+        try:
+            db[name].create_index(index_keys(definition), **index_options(definition))
+            print(f"Index '{definition['name']}' ready on '{name}'.")
+        except OperationFailure as e:
+            # mismo nombre con otra especificacion, o datos que violan un indice unico
+            print(f"Index '{definition['name']}' on '{name}' failed: {e}")
+
+    problems = diff_indexes(load_index_definitions(name), db[name].index_information())
+    for problem in problems:
+        print(f"  drift in '{name}': {problem}")
+
+def main():
+    # Create all collections
+    create_collection("compuestos", "compuestos_schema.json")
+    create_collection("medicamentos", "medicamentos_schema.json")
+    create_collection("compuestos_por_medicamento", "compuestos_medicamentos_schema.json")
+
+    # Create all indexes
+    create_indexes("compuestos")
+    create_indexes("medicamentos")
+    create_indexes("compuestos_por_medicamento")
+
+if __name__ == "__main__":
+    main()
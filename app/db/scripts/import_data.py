@@ -1,17 +1,30 @@
+"""
+This script imports data from JSON files in the datos/ directory into MongoDB collections.
+Files are parsed incrementally (a top-level JSON array or NDJSON, one document per line)
+and inserted in bounded unordered batches into a staging collection per target. When a
+collection is fully loaded and indexed, its staging collection is renamed over the live
+one, so readers never see an empty or half-loaded catalog. The three collections load
+concurrently.
+"""
+
+import argparse
 import json
 import os
+import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 from dotenv import load_dotenv
-from bson import ObjectId
-
-"""
-This script imports data from JSON files in the datos/ directory into MongoDB collections.
-It uses the pymongo library to connect to the database and insert data.
-"""
+from bson import json_util
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
 
+from app.db.indexes import index_keys, index_options, load_index_definitions
+from app.db.stats import stats_enabled
+from app.db.views import views_enabled
+
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
@@ -24,47 +37,151 @@ db = client[DB_NAME]
 # Paths to JSON files
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 DATA_DIR = os.path.join(BASE_DIR, "datos")
+SCHEMA_DIR = os.path.join(BASE_DIR, "app", "schemas")
+
+# coleccion -> (archivo de datos sin extension, archivo de esquema)
+COLLECTIONS = {
+    "compuestos": ("compuestos", "compuestos_schema.json"),
+    "medicamentos": ("medicamentos", "medicamentos_schema.json"),
+    "compuestos_por_medicamento": ("compuestos_medicamentos", "compuestos_medicamentos_schema.json"),
+}
+
+CHUNK_SIZE = 1 << 16
+# un documento BSON no pasa de 16 MB: si el buffer crece mas sin cerrar un documento, el JSON esta mal formado
+MAX_DOCUMENT_CHARS = 16 << 20
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# json_util.object_hook convierte {"$oid": ...} y demas Extended JSON a tipos BSON
+decoder = json.JSONDecoder(object_hook=json_util.object_hook)
+
+def iter_ndjson(f):
+    """Yield one document per non-empty line"""
+    for line in f:
+        line = line.strip()
+        if line:
+            yield decoder.decode(line)
 
-def import_data(collection_name, filename):
-    """Import data from a JSON file into a MongoDB collection"""
-    file_path = os.path.join(DATA_DIR, filename)
-    
-    db[collection_name].delete_many({})
-    
-    with open(file_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-        
-    for item in data:
-        if "_id" in item and "$oid" in item["_id"]:
-            item["_id"] = ObjectId(item["_id"]["$oid"])
-        
-        if "medicamento_id" in item and "$oid" in item["medicamento_id"]:
-            item["medicamento_id"] = ObjectId(item["medicamento_id"]["$oid"])
-            
-        if "compuesto_id" in item and "$oid" in item["compuesto_id"]:
-            item["compuesto_id"] = ObjectId(item["compuesto_id"]["$oid"])
-    
-    # Insertar datos
-    if data:
-        result = db[collection_name].insert_many(data)
-        print(f"Imported {len(result.inserted_ids)} documents into {collection_name}")
-    else:
-        print(f"No data to import into {collection_name}")
+def iter_json_array(f):
+    """Yield the elements of a top-level JSON array without loading the whole file"""
+    buffer = f.read(CHUNK_SIZE)
+    pos = WHITESPACE.match(buffer).end()
+    if not buffer.startswith("[", pos):
+        raise ValueError("Expected a JSON array or an .ndjson file")
+    pos += 1
+    eof = False
+    while True:
+        # se avanza un indice sobre el buffer en lugar de recortarlo en cada documento
+        pos = WHITESPACE.match(buffer, pos).end()
+        if buffer.startswith(",", pos):
+            pos = WHITESPACE.match(buffer, pos + 1).end()
+        if buffer.startswith("]", pos):
+            return
+        if pos < len(buffer):
+            try:
+                document, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield document
+                continue
+        elif eof:
+            raise ValueError("Unexpected end of file inside the JSON array")
+        # documento incompleto: se descarta lo ya consumido una vez por bloque leido
+        if len(buffer) - pos > MAX_DOCUMENT_CHARS:
+            raise ValueError(f"No complete JSON document in {MAX_DOCUMENT_CHARS} characters; the file is malformed")
+        chunk = f.read(CHUNK_SIZE)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+def iter_documents(path):
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".ndjson", ".jsonl")):
+            yield from iter_ndjson(f)
+        else:
+            yield from iter_json_array(f)
+
+def find_data_file(data_dir, base_name):
+    """Prefer NDJSON when both formats exist"""
+    for extension in (".ndjson", ".jsonl", ".json"):
+        path = os.path.join(data_dir, base_name + extension)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"No data file for '{base_name}' in {data_dir}")
+
+def create_staging(collection_name, schema_filename):
+    """Create an empty staging collection with the live collection's validator"""
+    staging_name = f"{collection_name}__staging"
+    db.drop_collection(staging_name)
+    with open(os.path.join(SCHEMA_DIR, schema_filename), "r", encoding="utf-8") as f:
+        schema = json.load(f)
+    db.create_collection(staging_name, validator=schema["validator"])
+    return db[staging_name]
+
+def insert_batch(staging, batch):
+    try:
+        return len(staging.insert_many(batch, ordered=False).inserted_ids)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        print(f"  {staging.name}: {len(errors)} documents rejected, first error: {errors[0].get('errmsg') if errors else e}")
+        return e.details.get("nInserted", 0)
+
+def import_data(collection_name, data_dir=DATA_DIR, batch_size=1000):
+    """Stream a data file into staging and swap it over the live collection"""
+    base_name, schema_filename = COLLECTIONS[collection_name]
+    file_path = find_data_file(data_dir, base_name)
+    started = time.perf_counter()
+
+    staging = create_staging(collection_name, schema_filename)
+    imported = 0
+    batch = []
+    for document in iter_documents(file_path):
+        batch.append(document)
+        if len(batch) >= batch_size:
+            imported += insert_batch(staging, batch)
+            batch = []
+    if batch:
+        imported += insert_batch(staging, batch)
+
+    # los indices se construyen al final: es mas rapido que mantenerlos durante la carga
+    for definition in load_index_definitions(collection_name):
+        staging.create_index(index_keys(definition), **index_options(definition))
+
+    # renameCollection con dropTarget reemplaza la coleccion viva en un solo paso
+    staging.rename(collection_name, dropTarget=True)
+    print(f"Imported {imported} documents into {collection_name} from {os.path.basename(file_path)} "
+          f"in {time.perf_counter() - started:.1f}s")
+    return imported
 
 def main():
+    parser = argparse.ArgumentParser(description="Import the datos/ files into MongoDB")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="directory with the .json/.ndjson files")
+    parser.add_argument("--batch-size", type=int, default=1000, help="documents per insert_many")
+    args = parser.parse_args()
+
     try:
-        print("Creating collections with schemas...")
-        from app.db.scripts.create_collections import create_collection
-        
         # Importar datos
-        print("\nImporting data into collections...")
-        import_data("compuestos", "compuestos.json")
-        import_data("medicamentos", "medicamentos.json")
-        import_data("compuestos_por_medicamento", "compuestos_medicamentos.json")
-        
+        print("Importing data into collections...")
+        with ThreadPoolExecutor(max_workers=len(COLLECTIONS)) as executor:
+            futures = [
+                executor.submit(import_data, name, args.data_dir, args.batch_size)
+                for name in COLLECTIONS
+            ]
+            for future in futures:
+                future.result()
+
+        if views_enabled():
+            from app.db.scripts.rebuild_views import main as rebuild_views
+            rebuild_views()
+        if stats_enabled():
+            # los contadores se mantienen con $inc en cada escritura; tras reemplazar las colecciones se recalculan
+            from app.db.scripts.recompute_stats import main as recompute_stats
+            recompute_stats()
+
         print("\nData import completed successfully!")
     except Exception as e:
         print(f"Error during import: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
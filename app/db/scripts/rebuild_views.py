@@ -0,0 +1,34 @@
+"""
+This script rebuilds the materialized views (medicamentos_view and compuestos_view)
+from the source collections. Run it after enabling MATERIALIZED_VIEWS, after a data
+import, or whenever the views may have drifted.
+"""
+
+import os
+import sys
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from app.db.views import VIEW_INDEXES, compuestos_view_pipeline, medicamentos_view_pipeline
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+DB_NAME = "medicamentos_db"
+
+# MongoDB connection
+client = MongoClient(MONGO_URI)
+db = client[DB_NAME]
+
+def main():
+    # $out reemplaza cada vista de forma atomica al terminar la agregacion
+    db.medicamentos.aggregate(medicamentos_view_pipeline())
+    db.compuestos.aggregate(compuestos_view_pipeline())
+    for name, keys in VIEW_INDEXES.items():
+        db[name].create_index(keys)
+        print(f"View '{name}' rebuilt with {db[name].estimated_document_count()} documents.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+This script recomputes the statistics counters (estadisticas collection) from the
+source collections. Run it after enabling STATS, after a data import, or whenever
+the counters may have drifted.
+"""
+
+import os
+import sys
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from app.db.stats import STATS_COLLECTION, STATS_INDEXES, stats_pipelines
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+DB_NAME = "medicamentos_db"
+
+# MongoDB connection
+client = MongoClient(MONGO_URI)
+db = client[DB_NAME]
+
+def main():
+    db[STATS_COLLECTION].delete_many({})
+    # cada pipeline escribe sus contadores con $merge
+    for source, pipeline in stats_pipelines():
+        db[source].aggregate(pipeline)
+    db[STATS_COLLECTION].create_index(STATS_INDEXES)
+    print(f"Statistics recomputed: {db[STATS_COLLECTION].count_documents({})} counters.")
+
+if __name__ == "__main__":
+    main()
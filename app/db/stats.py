@@ -0,0 +1,72 @@
+"""
+Counters behind the /api/stats endpoints.
+
+Each counter is one document {_id: "<tipo>:<clave>", tipo, clave, n} in the
+estadisticas collection:
+
+- total: medicamentos, compuestos and relaciones
+- fabricante: medicamentos per fabricante
+- unidad: relations per unidad_medida
+- compuesto: medicamentos per compuesto id
+- medicamento: compuestos per medicamento id
+
+The service layer keeps them up to date with $inc on every write; these
+pipelines rebuild them from scratch with $merge.
+"""
+
+import os
+from typing import Any, Dict, List, Tuple
+
+STATS_COLLECTION = "estadisticas"
+STATS_TYPES = ("total", "fabricante", "unidad", "compuesto", "medicamento")
+
+# Los rankings se leen por tipo ordenados por n
+STATS_INDEXES = [("tipo", 1), ("n", -1)]
+
+
+def stats_enabled() -> bool:
+    """Incremental statistics are opt-in through STATS=1"""
+    return os.getenv("STATS", "0").lower() in ("1", "true", "yes")
+
+
+def counter_id(tipo: str, clave: Any) -> str:
+    return f"{tipo}:{clave}"
+
+
+def _merge_stage() -> Dict[str, Any]:
+    return {"$merge": {"into": STATS_COLLECTION, "whenMatched": "replace", "whenNotMatched": "insert"}}
+
+
+def _total_pipeline(clave: str) -> List[Dict[str, Any]]:
+    return [
+        {"$count": "n"},
+        {"$project": {"_id": {"$literal": counter_id("total", clave)}, "tipo": {"$literal": "total"}, "clave": {"$literal": clave}, "n": 1}},
+        _merge_stage(),
+    ]
+
+
+def _group_pipeline(tipo: str, field: str) -> List[Dict[str, Any]]:
+    return [
+        {"$group": {"_id": f"${field}", "n": {"$sum": 1}}},
+        {"$match": {"_id": {"$ne": None}}},
+        {"$project": {
+            "_id": {"$concat": [f"{tipo}:", {"$toString": "$_id"}]},
+            "tipo": {"$literal": tipo},
+            "clave": {"$toString": "$_id"},
+            "n": 1,
+        }},
+        _merge_stage(),
+    ]
+
+
+def stats_pipelines() -> List[Tuple[str, List[Dict[str, Any]]]]:
+    """(source collection, pipeline) pairs that write every counter into estadisticas"""
+    return [
+        ("medicamentos", _total_pipeline("medicamentos")),
+        ("medicamentos", _group_pipeline("fabricante", "fabricante")),
+        ("compuestos", _total_pipeline("compuestos")),
+        ("compuestos_por_medicamento", _total_pipeline("relaciones")),
+        ("compuestos_por_medicamento", _group_pipeline("unidad", "unidad_medida")),
+        ("compuestos_por_medicamento", _group_pipeline("compuesto", "compuesto_id")),
+        ("compuestos_por_medicamento", _group_pipeline("medicamento", "medicamento_id")),
+    ]
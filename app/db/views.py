@@ -0,0 +1,89 @@
+"""
+Materialized read models for the medicamento <-> compuesto relation.
+
+medicamentos_view holds every medicamento with its compuestos embedded and
+compuestos_view holds every compuesto with its medicamentos embedded. The
+service layer keeps them in sync on writes; these pipelines rebuild them from
+scratch.
+"""
+
+import os
+from typing import Any, Dict, List
+
+MEDICAMENTOS_VIEW = "medicamentos_view"
+COMPUESTOS_VIEW = "compuestos_view"
+
+# Indices multikey usados para actualizar las copias embebidas al renombrar
+VIEW_INDEXES = {
+    MEDICAMENTOS_VIEW: [("compuestos._id", 1)],
+    COMPUESTOS_VIEW: [("medicamentos._id", 1)],
+}
+
+
+def views_enabled() -> bool:
+    """Materialized views are opt-in through MATERIALIZED_VIEWS=1"""
+    return os.getenv("MATERIALIZED_VIEWS", "0").lower() in ("1", "true", "yes")
+
+
+def compuestos_lookup_stage() -> Dict[str, Any]:
+    """$lookup that embeds the compuestos of each medicamento as 'compuestos'"""
+    return {"$lookup": {
+        "from": "compuestos_por_medicamento",
+        "let": {"medicamento_id": "$_id"},
+        "pipeline": [
+            {"$match": {"$expr": {"$eq": ["$medicamento_id", "$$medicamento_id"]}}},
+            {"$lookup": {
+                "from": "compuestos",
+                "localField": "compuesto_id",
+                "foreignField": "_id",
+                "as": "compuesto"
+            }},
+            {"$unwind": "$compuesto"},
+            {"$project": {
+                "_id": "$compuesto._id",
+                "nombre": "$compuesto.nombre",
+                "concentracion": "$concentracion",
+                "unidad_medida": "$unidad_medida"
+            }}
+        ],
+        "as": "compuestos"
+    }}
+
+
+def medicamentos_view_pipeline() -> List[Dict[str, Any]]:
+    """Aggregation over medicamentos that replaces medicamentos_view"""
+    return [
+        compuestos_lookup_stage(),
+        {"$project": {"nombre": 1, "fabricante": 1, "compuestos": 1}},
+        {"$out": MEDICAMENTOS_VIEW}
+    ]
+
+
+def compuestos_view_pipeline() -> List[Dict[str, Any]]:
+    """Aggregation over compuestos that replaces compuestos_view"""
+    return [
+        {"$lookup": {
+            "from": "compuestos_por_medicamento",
+            "let": {"compuesto_id": "$_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$compuesto_id", "$$compuesto_id"]}}},
+                {"$lookup": {
+                    "from": "medicamentos",
+                    "localField": "medicamento_id",
+                    "foreignField": "_id",
+                    "as": "medicamento"
+                }},
+                {"$unwind": "$medicamento"},
+                {"$project": {
+                    "_id": "$medicamento._id",
+                    "nombre": "$medicamento.nombre",
+                    "fabricante": "$medicamento.fabricante",
+                    "concentracion": "$concentracion",
+                    "unidad_medida": "$unidad_medida"
+                }}
+            ],
+            "as": "medicamentos"
+        }},
+        {"$project": {"nombre": 1, "medicamentos": 1}},
+        {"$out": COMPUESTOS_VIEW}
+    ]
@@ -1,12 +1,52 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from app.controllers.admin_controller import router as admin_router
 from app.controllers.compuesto_controller import router as compuesto_router
+from app.controllers.health_controller import router as health_router
+from app.controllers.jobs_controller import router as jobs_router
 from app.controllers.medicamento_controller import router as medicamento_router
+from app.controllers.metrics_controller import router as metrics_router
+from app.controllers.stats_controller import router as stats_router
+from app.db import mongo
+from app.db.causal import CausalConsistencyMiddleware
+from app.db.indexes import verify_indexes
+from app.monitoring.middleware import MetricsMiddleware
+from app.repositories.compuesto_repo import CompuestoRepository
+from app.services.job_service import JobService
+from app.monitoring.slow_queries import slow_query_log
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Cliente con el pool configurado por entorno; abre las conexiones antes de recibir trafico
+    await mongo.connect()
+    # Verificar que los indices coincidan con app/schemas (INDEX_CHECK=warn|fail|off)
+    await verify_indexes(mongo.get_database())
+    # los explain de las consultas lentas se lanzan en este loop
+    slow_query_log.bind(asyncio.get_running_loop(), mongo.get_client())
+    # catalogo de compuestos en memoria (COMPUESTOS_SNAPSHOT=1), cargado antes de recibir trafico
+    if CompuestoRepository.snapshot is not None:
+        await CompuestoRepository.snapshot.start()
+    # trabajos en segundo plano (JOBS=1); retoma los que quedaron a medias en la ejecucion anterior
+    if JobService.runner is not None:
+        await JobService.runner.start()
+    yield
+    if JobService.runner is not None:
+        await JobService.runner.stop()
+    if CompuestoRepository.snapshot is not None:
+        await CompuestoRepository.snapshot.stop()
+    # cierra los sockets del pool (tambien en cada recarga de uvicorn --reload)
+    mongo.close()
 
 app = FastAPI(
     title="API de Medicamentos y Compuestos",
     description="API REST para gestionar medicamentos y sus compuestos químicos",
     version="1.0.0",
+    lifespan=lifespan,
+    # orjson para codificar todas las respuestas JSON
+    default_response_class=ORJSONResponse,
 )
 
 # Configuracion de CORS
@@ -16,10 +56,23 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # el navegador solo deja leer los encabezados expuestos
+    expose_headers=["ETag", "X-Session-Token"],
 )
 
+# Sesiones causales (X-Session-Token) cuando MONGO_READ_PREFERENCE lee de secundarios
+app.add_middleware(CausalConsistencyMiddleware)
+
+# Metricas por ruta para /metrics; se agrega al final para medir tambien CORS
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(compuesto_router)
 app.include_router(medicamento_router)
+app.include_router(stats_router)
+app.include_router(jobs_router)
+app.include_router(admin_router)
+app.include_router(metrics_router)
+app.include_router(health_router)
 
 # Root endpoint
 @app.get("/", tags=["root"])
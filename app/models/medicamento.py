@@ -1,3 +1,4 @@
+from datetime import datetime
 from pydantic import BaseModel, Field
 from typing import Optional
 
@@ -6,6 +7,10 @@ class Medicamento(BaseModel):
     nombre: str
     fabricante: str
     
+    # mantenidos por el repositorio; se ignoran si vienen en el cuerpo
+    version: Optional[int] = None
+    updated_at: Optional[datetime] = None
+    
     class Config:
         populate_by_name = True
         json_encoders = {
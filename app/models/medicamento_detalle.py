@@ -0,0 +1,15 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from app.models.medicamento import Medicamento
+
+class CompuestoEnMedicamento(BaseModel):
+    id: Optional[str] = Field(default=None, alias="_id")
+    nombre: str
+    concentracion: float
+    unidad_medida: str
+    
+    class Config:
+        populate_by_name = True
+
+class MedicamentoDetalle(Medicamento):
+    compuestos: List[CompuestoEnMedicamento] = []
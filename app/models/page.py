@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from app.models.compuesto import Compuesto
+from app.models.medicamento import Medicamento
+
+class MedicamentoPage(BaseModel):
+    items: List[Medicamento]
+    next_cursor: Optional[str] = None
+
+class CompuestoPage(BaseModel):
+    items: List[Compuesto]
+    next_cursor: Optional[str] = None
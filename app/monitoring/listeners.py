@@ -0,0 +1,83 @@
+"""
+pymongo event listeners feeding the Mongo metrics.
+
+Succeeded/failed command events do not carry the command document, so the
+collection and command are remembered from the started event, keyed by
+connection and request id, and looked up when the command finishes. Finished
+commands are also passed to the slow-query log.
+"""
+
+from pymongo import monitoring
+from app.monitoring.metrics import (
+    MONGO_COMMAND_FAILURES,
+    MONGO_COMMAND_LATENCY,
+    MONGO_POOL_CHECKED_OUT,
+    MONGO_POOL_CHECKOUT_FAILURES,
+    MONGO_POOL_WAIT,
+)
+from app.monitoring.slow_queries import slow_query_log
+
+# Comandos cuyo valor no es el nombre de la coleccion
+_COLLECTION_KEYS = {"getMore": "collection"}
+
+
+def _collection_of(event: monitoring.CommandStartedEvent) -> str:
+    value = event.command.get(_COLLECTION_KEYS.get(event.command_name, event.command_name))
+    return value if isinstance(value, str) else "-"
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    def __init__(self):
+        self._commands = {}
+
+    def started(self, event):
+        self._commands[(event.connection_id, event.request_id)] = (_collection_of(event), event.command)
+
+    def succeeded(self, event):
+        collection, command = self._commands.pop((event.connection_id, event.request_id), ("-", {}))
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMAND_LATENCY.observe(seconds, collection, event.command_name)
+        slow_query_log.observe(event.database_name, collection, event.command_name, command, seconds)
+
+    def failed(self, event):
+        collection, _ = self._commands.pop((event.connection_id, event.request_id), ("-", {}))
+        MONGO_COMMAND_LATENCY.observe(event.duration_micros / 1e6, collection, event.command_name)
+        MONGO_COMMAND_FAILURES.inc(collection, event.command_name)
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    def connection_checked_out(self, event):
+        MONGO_POOL_WAIT.observe(event.duration)
+        MONGO_POOL_CHECKED_OUT.inc()
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.dec()
+
+    def connection_check_out_failed(self, event):
+        MONGO_POOL_WAIT.observe(event.duration)
+        MONGO_POOL_CHECKOUT_FAILURES.inc(str(event.reason))
+
+    # eventos sin metricas asociadas
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
@@ -0,0 +1,42 @@
+"""
+ASGI middleware that records per-route request metrics.
+
+It is a plain ASGI middleware (not BaseHTTPMiddleware) so streaming responses
+such as /export are not buffered, and their latency covers the whole stream.
+Routes are labelled by their template (/api/medicamentos/{medicamento_id}),
+never by the raw path, to keep the number of series bounded.
+"""
+
+import time
+from app.monitoring.metrics import HTTP_IN_FLIGHT, HTTP_LATENCY, HTTP_REQUESTS
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            # el router de FastAPI deja la ruta resuelta en el scope
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method, route_path, str(status_code))
+            HTTP_LATENCY.observe(elapsed, method, route_path)
@@ -0,0 +1,186 @@
+"""
+Slow-query log fed by the pymongo command listener.
+
+Read commands (find, aggregate, count, distinct) slower than SLOW_QUERY_MS are
+recorded with their shape (literal values replaced by '?') and duration. Some
+of them also get an explain("executionStats") run in the background. Explains
+are limited to SLOW_QUERY_EXPLAINS_PER_MINUTE, and each shape is explained at
+most once per EXPLAIN_SHAPE_COOLDOWN_SECONDS, so a burst of identical slow
+queries costs one extra query.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+from bson import json_util
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE_COMMANDS = ("find", "aggregate", "count", "distinct")
+# Claves de sesion, transaccion y enrutamiento que explain no acepta
+_META_KEYS = ("lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern")
+EXPLAIN_SHAPE_COOLDOWN_SECONDS = 600
+
+
+def query_shape(value: Any) -> Any:
+    """Command with literal values replaced by '?', keeping field names, operators and numbers"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = query_shape(item)
+            # listas como las de $in se reducen a una entrada por forma distinta
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    if isinstance(value, (bool, int, float)) or value is None:
+        return value
+    if isinstance(value, str) and value.startswith("$"):
+        return value
+    return "?"
+
+
+def explainable_command(command: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a command without the keys explain rejects"""
+    return {key: value for key, value in command.items() if not key.startswith("$") and key not in _META_KEYS}
+
+
+def _find_key(value: Any, key: str) -> Optional[Any]:
+    if isinstance(value, dict):
+        if key in value:
+            return value[key]
+        value = list(value.values())
+    if isinstance(value, list):
+        for item in value:
+            found = _find_key(item, key)
+            if found is not None:
+                return found
+    return None
+
+
+def _stages(plan: Any) -> List[str]:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for child in ("inputStage", "queryPlan"):
+            stages.extend(_stages(plan.get(child)))
+        for child in plan.get("inputStages", []):
+            stages.extend(_stages(child))
+    return stages
+
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """The parts of an explain that answer 'did it use an index'"""
+    winning_plan = _find_key(explain, "winningPlan")
+    stats = _find_key(explain, "executionStats") or {}
+    stages = _stages(winning_plan)
+    return {
+        "stages": stages,
+        "collection_scan": "COLLSCAN" in stages,
+        "n_returned": stats.get("nReturned"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "execution_time_ms": stats.get("executionTimeMillis"),
+        # Extended JSON: el plan incluye ObjectId y fechas de los filtros
+        "winning_plan": json.loads(json_util.dumps(winning_plan)),
+    }
+
+
+class SlowQueryLog:
+    """Bounded log of slow commands with rate-limited explain capture"""
+
+    def __init__(self, threshold_ms: float = None, explains_per_minute: int = None, size: int = None):
+        self.threshold = (threshold_ms if threshold_ms is not None else float(os.getenv("SLOW_QUERY_MS", "100"))) / 1000
+        self.explains_per_minute = explains_per_minute if explains_per_minute is not None else int(os.getenv("SLOW_QUERY_EXPLAINS_PER_MINUTE", "6"))
+        self._records = deque(maxlen=size if size is not None else int(os.getenv("SLOW_QUERY_LOG_SIZE", "100")))
+        self._lock = threading.Lock()
+        self._explain_times = deque()
+        self._explained_shapes: Dict[str, float] = {}
+        self._loop = None
+        self._client = None
+        # el loop solo guarda referencias debiles a sus tareas: sin esta, una explain en curso podria recolectarse
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop, client) -> None:
+        """Enable explain capture; explains run on this loop with this client"""
+        self._loop = loop
+        self._client = client
+
+    def _explain_allowed(self, shape_key: str) -> bool:
+        now = time.monotonic()
+        while self._explain_times and now - self._explain_times[0] > 60:
+            self._explain_times.popleft()
+        if len(self._explain_times) >= self.explains_per_minute:
+            return False
+        last = self._explained_shapes.get(shape_key)
+        if last is not None and now - last < EXPLAIN_SHAPE_COOLDOWN_SECONDS:
+            return False
+        self._explain_times.append(now)
+        self._explained_shapes = {
+            key: at for key, at in self._explained_shapes.items() if now - at < EXPLAIN_SHAPE_COOLDOWN_SECONDS
+        }
+        self._explained_shapes[shape_key] = now
+        return True
+
+    def observe(self, database: str, collection: str, command_name: str, command: Dict[str, Any], seconds: float) -> None:
+        """Called from the command listener (on driver threads) for every finished command"""
+        if not self.enabled or seconds < self.threshold or command_name not in EXPLAINABLE_COMMANDS:
+            return
+        shape = query_shape(explainable_command(command))
+        record = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "database": database,
+            "collection": collection,
+            "command": command_name,
+            "duration_ms": round(seconds * 1000, 3),
+            "shape": shape,
+            "explain": None,
+        }
+        logger.warning("Slow %s on %s: %.1f ms %s", command_name, collection, seconds * 1000, shape)
+        # explain con executionStats ejecuta el pipeline; nunca sobre uno que escribe
+        writes = command_name == "aggregate" and any(
+            "$out" in stage or "$merge" in stage for stage in command.get("pipeline", [])
+        )
+        with self._lock:
+            self._records.append(record)
+            explain = self._loop is not None and not writes and self._explain_allowed(repr(shape))
+        if explain:
+            self._loop.call_soon_threadsafe(self._start_explain, record, explainable_command(command))
+
+    def _start_explain(self, record: Dict[str, Any], command: Dict[str, Any]) -> None:
+        task = self._loop.create_task(self._explain(record, command))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _explain(self, record: Dict[str, Any], command: Dict[str, Any]) -> None:
+        try:
+            result = await self._client[record["database"]].command(
+                {"explain": command, "verbosity": "executionStats"}
+            )
+            record["explain"] = summarize_explain(result)
+        except Exception as e:
+            record["explain"] = {"error": str(e)}
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Slow commands, most recent first"""
+        with self._lock:
+            return list(reversed(self._records))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+
+
+slow_query_log = SlowQueryLog()
@@ -0,0 +1,134 @@
+"""
+In-process read-through cache used by the repositories in front of get_by_id.
+
+Any object with get/fill/set/invalidate/clear/stats can be plugged into a
+repository's `cache` attribute; TTLCache is the default and NullCache disables
+caching.
+
+Reads store what they loaded with fill(key, value, started), passing the
+time.monotonic() taken before the query. Writes store with set() or drop with
+invalidate(), once their write (or its transaction) is committed. A fill is
+dropped if the key was written after its read started, so a slow read cannot
+put back a version older than the one a concurrent write left.
+
+The cache is per process: a write made by another worker is not seen here
+until the entry expires, so CACHE_TTL_SECONDS bounds how stale a get_by_id
+can be across workers. Reads that must see every write use a causal session,
+which bypasses the cache.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after ttl seconds"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        # ultima escritura por clave, en orden de llegada; se olvida pasado el ttl
+        self._written: "OrderedDict[Hashable, float]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_fills = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value or None on a miss"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _store(self, key: Hashable, value: Any, now: float) -> None:
+        self._data[key] = (now + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def _mark_written(self, key: Hashable, now: float) -> None:
+        self._written[key] = now
+        self._written.move_to_end(key)
+        # una lectura empezada hace mas de ttl ya no puede rellenar, asi que su marca sobra
+        while self._written and next(iter(self._written.values())) < now - self.ttl:
+            self._written.popitem(last=False)
+
+    def fill(self, key: Hashable, value: Any, started: float) -> None:
+        """Store a value read from the database, unless the key was written after the read started"""
+        now = time.monotonic()
+        if now - started > self.ttl or self._written.get(key, float("-inf")) >= started:
+            self.stale_fills += 1
+            return
+        self._store(key, value, now)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store the value a committed write produced"""
+        now = time.monotonic()
+        self._mark_written(key, now)
+        self._store(key, value, now)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop the entry of a committed write whose result is not known here"""
+        self._mark_written(key, time.monotonic())
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stale_fills": self.stale_fills,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class NullCache:
+    """Cache that never stores anything"""
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        return None
+
+    def fill(self, key: Hashable, value: Any, started: float) -> None:
+        pass
+
+    def set(self, key: Hashable, value: Any) -> None:
+        pass
+
+    def invalidate(self, key: Hashable) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": False}
+
+
+def build_cache():
+    """Create the cache configured by CACHE_ENABLED, CACHE_MAXSIZE and CACHE_TTL_SECONDS"""
+    if os.getenv("CACHE_ENABLED", "1").lower() in ("0", "false", "no"):
+        return NullCache()
+    return TTLCache(
+        maxsize=int(os.getenv("CACHE_MAXSIZE", "10000")),
+        ttl=float(os.getenv("CACHE_TTL_SECONDS", "60")),
+    )
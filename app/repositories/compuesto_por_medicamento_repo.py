@@ -1,18 +1,22 @@
 from bson import ObjectId
-from typing import List, Optional
-from app.db.mongo import db
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from pymongo.errors import BulkWriteError
+from app.db.mongo import CollectionRef
 from app.models.compuesto_med import CompuestoPorMedicamento
+from app.repositories.ids import parse_object_ids
 
 class CompuestoPorMedicamentoRepository:
     """Repository for CompuestoPorMedicamento entity operations"""
     
-    collection = db.compuestos_por_medicamento
+    collection = CollectionRef("compuestos_por_medicamento")
+    # lecturas enrutadas segun MONGO_READ_PREFERENCE
+    read_collection = CollectionRef("compuestos_por_medicamento", read=True)
     
     @staticmethod
     async def get_all() -> List[CompuestoPorMedicamento]:
         """Get all compuestos por medicamento from the database"""
         compuestos_med = []
-        cursor = CompuestoPorMedicamentoRepository.collection.find({})
+        cursor = CompuestoPorMedicamentoRepository.read_collection.find({})
         async for document in cursor:
             document["_id"] = str(document["_id"])
             document["medicamento_id"] = str(document["medicamento_id"])
@@ -24,7 +28,7 @@ class CompuestoPorMedicamentoRepository:
     async def get_by_id(id: str) -> Optional[CompuestoPorMedicamento]:
         """Get a compuesto por medicamento by its ID"""
         try:
-            document = await CompuestoPorMedicamentoRepository.collection.find_one({"_id": ObjectId(id)})
+            document = await CompuestoPorMedicamentoRepository.read_collection.find_one({"_id": ObjectId(id)})
             if document:
                 document["_id"] = str(document["_id"])
                 document["medicamento_id"] = str(document["medicamento_id"])
@@ -34,6 +38,86 @@ class CompuestoPorMedicamentoRepository:
         except Exception:
             return None
     
+    @staticmethod
+    async def find_medicamento_ids(compuesto_ids: List[str], match_all: bool = True) -> List[str]:
+        """Ids of the medicamentos containing all (or any) of the compuestos, in one aggregation.
+
+        The $match and $group only touch compuesto_id and medicamento_id, so the
+        compuesto_id_1_medicamento_id_1 index covers the whole pipeline.
+        """
+        object_ids, _ = parse_object_ids(compuesto_ids)
+        if not object_ids:
+            return []
+        pipeline = [
+            {"$match": {"compuesto_id": {"$in": object_ids}}},
+            {"$group": {"_id": "$medicamento_id", "matches": {"$sum": 1}}},
+        ]
+        if match_all:
+            # el indice unico por par garantiza una relacion por compuesto
+            pipeline.append({"$match": {"matches": len(object_ids)}})
+        pipeline.append({"$sort": {"_id": 1}})
+        cursor = CompuestoPorMedicamentoRepository.read_collection.aggregate(pipeline)
+        return [str(document["_id"]) async for document in cursor]
+    
+    @staticmethod
+    async def summarize(field: str, ids: List[str], session=None) -> Dict[str, Dict[str, int]]:
+        """Relation counts per compuesto, medicamento and unidad_medida for the relations whose field is in ids"""
+        object_ids, _ = parse_object_ids(ids)
+        summary = {"compuesto": {}, "medicamento": {}, "unidad": {}}
+        if not object_ids:
+            return summary
+        pipeline = [
+            {"$match": {field: {"$in": object_ids}}},
+            {"$facet": {
+                "compuesto": [{"$group": {"_id": "$compuesto_id", "n": {"$sum": 1}}}],
+                "medicamento": [{"$group": {"_id": "$medicamento_id", "n": {"$sum": 1}}}],
+                "unidad": [{"$group": {"_id": "$unidad_medida", "n": {"$sum": 1}}}],
+            }}
+        ]
+        documents = await CompuestoPorMedicamentoRepository.collection.aggregate(pipeline, session=session).to_list(length=1)
+        for tipo, groups in (documents[0] if documents else {}).items():
+            summary[tipo] = {str(group["_id"]): group["n"] for group in groups}
+        return summary
+    
+    @staticmethod
+    async def count_by(field: str, ids: List[str]) -> int:
+        """Number of relations whose field is in ids, counted on the index"""
+        object_ids, _ = parse_object_ids(ids)
+        if not object_ids:
+            return 0
+        return await CompuestoPorMedicamentoRepository.collection.count_documents({field: {"$in": object_ids}})
+    
+    @staticmethod
+    async def compuesto_ids_for(medicamento_ids: List[str], session=None) -> List[str]:
+        """Ids of the compuestos related to any of the medicamentos"""
+        object_ids, _ = parse_object_ids(medicamento_ids)
+        if not object_ids:
+            return []
+        ids = await CompuestoPorMedicamentoRepository.collection.distinct(
+            "compuesto_id", {"medicamento_id": {"$in": object_ids}}, session=session
+        )
+        return [str(id) for id in ids]
+    
+    @staticmethod
+    async def medicamento_ids_for(compuesto_ids: List[str], session=None) -> List[str]:
+        """Ids of the medicamentos related to any of the compuestos"""
+        object_ids, _ = parse_object_ids(compuesto_ids)
+        if not object_ids:
+            return []
+        ids = await CompuestoPorMedicamentoRepository.collection.distinct(
+            "medicamento_id", {"compuesto_id": {"$in": object_ids}}, session=session
+        )
+        return [str(id) for id in ids]
+    
+    @staticmethod
+    async def iter_pairs() -> AsyncIterator[Tuple[str, str]]:
+        """Yield (compuesto_id, medicamento_id) for every relation; the sort lets the planner read only the index"""
+        cursor = CompuestoPorMedicamentoRepository.read_collection.find(
+            {}, {"_id": 0, "compuesto_id": 1, "medicamento_id": 1}
+        ).sort([("compuesto_id", 1), ("medicamento_id", 1)]).batch_size(5000)
+        async for document in cursor:
+            yield str(document["compuesto_id"]), str(document["medicamento_id"])
+    
     @staticmethod
     async def create(compuesto_med: dict) -> CompuestoPorMedicamento:
         """Create a new compuesto por medicamento"""
@@ -50,21 +134,97 @@ class CompuestoPorMedicamentoRepository:
         
         result = await CompuestoPorMedicamentoRepository.collection.insert_one(compuesto_med)
         
-        # Return the created relation with the generated ID
-        return await CompuestoPorMedicamentoRepository.get_by_id(str(result.inserted_id))
+        # Build the created relation from the inserted document, no re-read needed
+        document = dict(compuesto_med)
+        document["_id"] = str(result.inserted_id)
+        document["medicamento_id"] = str(document["medicamento_id"])
+        document["compuesto_id"] = str(document["compuesto_id"])
+        return CompuestoPorMedicamento(**document)
+    
+    @staticmethod
+    async def create_many(compuestos_med: List[dict]) -> List[Dict[str, Any]]:
+        """Insert several relations with one unordered insert_many and report each item"""
+        documents = []
+        for compuesto_med in compuestos_med:
+            documents.append({
+                "medicamento_id": ObjectId(compuesto_med["medicamento_id"]),
+                "compuesto_id": ObjectId(compuesto_med["compuesto_id"]),
+                "concentracion": compuesto_med["concentracion"],
+                "unidad_medida": compuesto_med["unidad_medida"]
+            })
+        if not documents:
+            return []
+        
+        errors = {}
+        try:
+            await CompuestoPorMedicamentoRepository.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                # 11000: la relacion ya existe (indice unico medicamento_id + compuesto_id)
+                errors[error["index"]] = error.get("errmsg", "write error")
+        
+        results = []
+        for index, document in enumerate(documents):
+            if index in errors:
+                results.append({"index": index, "status": "error", "error": errors[index]})
+            else:
+                results.append({"index": index, "status": "created", "id": str(document["_id"])})
+        return results
     
     @staticmethod
-    async def delete_by_medicamento_id(medicamento_id: str) -> int:
+    async def delete_by_medicamento_id(medicamento_id: str, session=None) -> int:
         """Delete all compuestos por medicamento for a specific medicamento"""
         result = await CompuestoPorMedicamentoRepository.collection.delete_many(
-            {"medicamento_id": ObjectId(medicamento_id)}
+            {"medicamento_id": ObjectId(medicamento_id)}, session=session
+        )
+        return result.deleted_count
+    
+    @staticmethod
+    async def delete_by_medicamento_ids(medicamento_ids: List[str], session=None) -> int:
+        """Delete all compuestos por medicamento for several medicamentos with a single $in"""
+        if not medicamento_ids:
+            return 0
+        result = await CompuestoPorMedicamentoRepository.collection.delete_many(
+            {"medicamento_id": {"$in": [ObjectId(id) for id in medicamento_ids]}}, session=session
         )
         return result.deleted_count
     
     @staticmethod
-    async def delete_by_compuesto_id(compuesto_id: str) -> int:
+    async def delete_by_compuesto_id(compuesto_id: str, session=None) -> int:
         """Delete all compuestos por medicamento for a specific compuesto"""
         result = await CompuestoPorMedicamentoRepository.collection.delete_many(
-            {"compuesto_id": ObjectId(compuesto_id)}
+            {"compuesto_id": ObjectId(compuesto_id)}, session=session
         )
-        return result.deleted_count
\ No newline at end of file
+        return result.deleted_count
+    
+    @staticmethod
+    async def delete_by_compuesto_ids(compuesto_ids: List[str], session=None) -> int:
+        """Delete all compuestos por medicamento for several compuestos with a single $in"""
+        if not compuesto_ids:
+            return 0
+        result = await CompuestoPorMedicamentoRepository.collection.delete_many(
+            {"compuesto_id": {"$in": [ObjectId(id) for id in compuesto_ids]}}, session=session
+        )
+        return result.deleted_count
+    
+    @staticmethod
+    async def delete_batch(field: str, ids: List[str], limit: int, session=None) -> List[CompuestoPorMedicamento]:
+        """Delete up to limit relations whose field is in ids and return them; repeat until it returns none"""
+        object_ids, _ = parse_object_ids(ids)
+        if not object_ids:
+            return []
+        documents = await CompuestoPorMedicamentoRepository.collection.find(
+            {field: {"$in": object_ids}}, session=session
+        ).limit(limit).to_list(length=limit)
+        if not documents:
+            return []
+        await CompuestoPorMedicamentoRepository.collection.delete_many(
+            {"_id": {"$in": [document["_id"] for document in documents]}}, session=session
+        )
+        relaciones = []
+        for document in documents:
+            document["_id"] = str(document["_id"])
+            document["medicamento_id"] = str(document["medicamento_id"])
+            document["compuesto_id"] = str(document["compuesto_id"])
+            relaciones.append(CompuestoPorMedicamento(**document))
+        return relaciones
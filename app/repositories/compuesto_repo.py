@@ -1,72 +1,446 @@
+import time
 from bson import ObjectId
-from typing import List, Optional
-from app.db.mongo import db
+from datetime import datetime
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from app.db.indexes import NOMBRE_COLLATION
+from app.db.mongo import CollectionRef, after_commit, get_collection, in_causal_session
 from app.models.compuesto import Compuesto
+from app.repositories.cache import build_cache
+from app.repositories.ids import normalize_id, parse_object_ids
+from app.repositories.loader import BatchLoader
+from app.repositories.pagination import build_keyset_query, clamp_limit, encode_cursor
+from app.repositories.projection import find_projection, project_stage_fields
+from app.repositories.snapshot import CollectionSnapshot, snapshot_enabled
+from app.repositories.versioning import DocumentVersion, VERSION_FIELDS, bump_version, initial_version, version_filter, version_of
 
 class CompuestoRepository:
     """Repository for Compuesto entity operations"""
     
-    collection = db.compuestos
+    collection = CollectionRef("compuestos")
+    # lecturas enrutadas segun MONGO_READ_PREFERENCE
+    read_collection = CollectionRef("compuestos", read=True)
+    cache = build_cache()
+    FIELDS = ("nombre",)
+    # agrupa los get_by_id concurrentes del mismo tick en un solo $in
+    loader = BatchLoader(lambda ids: CompuestoRepository._load_many(ids))
+    # catalogo completo en memoria, al dia por change stream (COMPUESTOS_SNAPSHOT=1)
+    snapshot = CollectionSnapshot(
+        "compuestos", lambda document: Compuesto(**{**document, "_id": str(document["_id"])})
+    ) if snapshot_enabled("compuestos") else None
+    
+    @staticmethod
+    def _snapshot() -> Optional[CollectionSnapshot]:
+        """The in-memory catalog if it can serve this request: ready, and no causal session to honour"""
+        snapshot = CompuestoRepository.snapshot
+        if snapshot is None or not snapshot.ready or in_causal_session():
+            return None
+        return snapshot
+    
+    @staticmethod
+    def _snapshot_put(compuesto: Compuesto) -> None:
+        if CompuestoRepository.snapshot is not None:
+            CompuestoRepository.snapshot.put(compuesto)
+    
+    @staticmethod
+    def _invalidate(ids: List[str], session=None) -> None:
+        # dentro de una transaccion, al confirmarla: antes, otra lectura volveria a cachear la version anterior
+        def invalidate() -> None:
+            for id in ids:
+                CompuestoRepository.cache.invalidate(id)
+                # el change stream trae el documento definitivo; mientras tanto se lee de la base
+                if CompuestoRepository.snapshot is not None:
+                    CompuestoRepository.snapshot.invalidate(id)
+        after_commit(session, invalidate)
     
     @staticmethod
     async def get_all() -> List[Compuesto]:
-        """Get all compuestos from the database"""
+        """Get all compuestos from the in-memory catalog or the database"""
+        snapshot = CompuestoRepository._snapshot()
+        if snapshot is not None and snapshot.complete():
+            return [compuesto.model_copy() for compuesto in snapshot.values()]
         compuestos = []
-        cursor = CompuestoRepository.collection.find({})
+        cursor = CompuestoRepository.read_collection.find({})
         async for document in cursor:
             document["_id"] = str(document["_id"])
             compuestos.append(Compuesto(**document))
         return compuestos
     
+    @staticmethod
+    def _output_projection(fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Projection that returns the requested model fields, with _id already as a string"""
+        projection = {"_id": {"$toString": "$_id"}}
+        for field in (CompuestoRepository.FIELDS if fields is None else fields):
+            projection[field] = 1
+        return projection
+    
+    @staticmethod
+    async def get_page(limit: int, after: Optional[str] = None, sort: str = "_id", fields: Optional[List[str]] = None) -> Tuple[List[dict], Optional[str]]:
+        """Get one page of compuestos as raw documents using keyset pagination on the sort field"""
+        limit = clamp_limit(limit)
+        query, sort_spec = build_keyset_query(sort, after)
+        # el campo de orden se proyecta siempre porque el cursor lo necesita
+        projected = None if fields is None else list(dict.fromkeys(fields + ([sort] if sort != "_id" else [])))
+        snapshot = CompuestoRepository._snapshot()
+        if sort == "_id" and snapshot is not None and snapshot.complete():
+            # mismo orden y misma forma que la consulta, sin ir a la base
+            after_id = str(query["_id"]["$gt"]) if query else None
+            include = set(CompuestoRepository.FIELDS if fields is None else fields)
+            documents = [
+                {"_id": compuesto.id, **compuesto.model_dump(include=include)}
+                for compuesto in snapshot.page(after_id, limit + 1)
+            ]
+        else:
+            # se pide un documento extra para saber si hay pagina siguiente
+            cursor = CompuestoRepository.read_collection.find(query, CompuestoRepository._output_projection(projected)).sort(sort_spec).limit(limit + 1)
+            documents = await cursor.to_list(length=limit + 1)
+        
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = encode_cursor(sort, documents[-1])
+        if fields is not None and sort != "_id" and sort not in fields:
+            for document in documents:
+                document.pop(sort, None)
+        # datos confiables de la base: se serializan sin volver a validar con Pydantic
+        return documents, next_cursor
+    
+    @staticmethod
+    async def iter_documents(batch_size: int = 1000) -> AsyncIterator[dict]:
+        """Yield every raw compuesto document as the cursor delivers it"""
+        cursor = CompuestoRepository.read_collection.find({}, CompuestoRepository._output_projection()).sort("_id", 1).batch_size(batch_size)
+        async for document in cursor:
+            yield document
+    
+    @staticmethod
+    async def search(q: str, limit: int = 20) -> List[dict]:
+        """Search compuestos by nombre: accent-insensitive prefix for one word, full text for several"""
+        projection = CompuestoRepository._output_projection()
+        if len(q.split()) > 1:
+            projection["score"] = {"$meta": "textScore"}
+            cursor = CompuestoRepository.read_collection.find({"$text": {"$search": q}}, projection).sort(
+                [("score", {"$meta": "textScore"})]
+            ).limit(limit)
+        else:
+            # rango [q, q + U+FFFF) con la misma collation del indice nombre_es_ci
+            cursor = CompuestoRepository.read_collection.find(
+                {"nombre": {"$gte": q, "$lt": q + "\uffff"}}, projection
+            ).collation(NOMBRE_COLLATION).sort("nombre", 1).limit(limit)
+        return await cursor.to_list(length=limit)
+    
+    @staticmethod
+    async def iter_names() -> AsyncIterator[Tuple[str, str]]:
+        """Yield (id, nombre) for every compuesto, used to build the autocomplete index"""
+        cursor = CompuestoRepository.read_collection.find({}, {"nombre": 1}).batch_size(5000)
+        async for document in cursor:
+            yield str(document["_id"]), document["nombre"]
+    
     @staticmethod
     async def get_by_id(id: str) -> Optional[Compuesto]:
-        """Get a compuesto by its ID"""
+        """Get a compuesto by its ID, served from the catalog, the cache or a coalesced batch query"""
+        id = normalize_id(id)
+        if id is None:
+            return None
+        snapshot = CompuestoRepository._snapshot()
+        if snapshot is not None and snapshot.covers(id):
+            compuesto = snapshot.get(id)
+            return compuesto.model_copy() if compuesto else None
+        # con sesion causal se lee de la base, sin cache ni lotes de otras peticiones
+        causal = in_causal_session()
+        cached = None if causal else CompuestoRepository.cache.get(id)
+        if cached is not None:
+            return cached.model_copy()
+        started = time.monotonic()
         try:
-            document = await CompuestoRepository.collection.find_one({"_id": ObjectId(id)})
-            if document:
-                document["_id"] = str(document["_id"])
-                return Compuesto(**document)
+            if causal:
+                compuesto = (await CompuestoRepository._load_many([id])).get(id)
+            else:
+                compuesto = await CompuestoRepository.loader.load(id)
+            if compuesto:
+                CompuestoRepository.cache.fill(id, compuesto, started)
+                return compuesto.model_copy()
             return None
         except Exception:
             return None
     
+    @staticmethod
+    async def get_version(id: str, fresh: bool = False) -> Optional[DocumentVersion]:
+        """Version of a compuesto; from memory when held there unless fresh, otherwise a find_one projecting only the version"""
+        id = normalize_id(id)
+        if id is None:
+            return None
+        snapshot = CompuestoRepository._snapshot()
+        if not fresh and snapshot is not None and snapshot.covers(id):
+            compuesto = snapshot.get(id)
+            return version_of(compuesto) if compuesto else None
+        if not fresh and not in_causal_session():
+            cached = CompuestoRepository.cache.get(id)
+            if cached is not None:
+                return version_of(cached)
+        object_id = ObjectId(id)
+        # sin cargar (ni cachear) el documento completo: un 304 no lo necesita
+        collection = CompuestoRepository.collection if fresh else CompuestoRepository.read_collection
+        document = await collection.find_one({"_id": object_id}, {field: 1 for field in VERSION_FIELDS})
+        return version_of(document) if document else None
+    
+    @staticmethod
+    async def touch(ids: List[str], session=None, after: Optional[datetime] = None) -> None:
+        """Increment the version of compuestos whose relations changed"""
+        object_ids, _ = parse_object_ids(ids)
+        if not object_ids:
+            return
+        await CompuestoRepository.collection.update_many({"_id": {"$in": object_ids}}, bump_version(after=after), session=session)
+        CompuestoRepository._invalidate([str(object_id) for object_id in object_ids], session)
+    
+    @staticmethod
+    async def touch_stale(ids: List[str], since: datetime, limit: int, session=None) -> int:
+        """Touch up to limit of the compuestos last written at or before the given time; returns how many"""
+        object_ids, _ = parse_object_ids(ids)
+        if not object_ids:
+            return 0
+        documents = await CompuestoRepository.collection.find(
+            {"_id": {"$in": object_ids}, "$or": [{"updated_at": {"$lte": since}}, {"updated_at": None}]},
+            {"_id": 1},
+            session=session
+        ).limit(limit).to_list(length=limit)
+        # quedan con updated_at posterior a since: el siguiente lote ya no los elige
+        await CompuestoRepository.touch([str(document["_id"]) for document in documents], session=session, after=since)
+        return len(documents)
+    
+    @staticmethod
+    async def get_partial(id: str, fields: List[str]) -> Optional[dict]:
+        """Get only some fields of a compuesto, projected by Mongo unless it is in memory"""
+        id = normalize_id(id)
+        if id is None:
+            return None
+        snapshot = CompuestoRepository._snapshot()
+        if snapshot is not None and snapshot.covers(id):
+            compuesto = snapshot.get(id)
+            return compuesto.model_dump(by_alias=True, include={"id", *fields}) if compuesto else None
+        cached = None if in_causal_session() else CompuestoRepository.cache.get(id)
+        if cached is not None:
+            return cached.model_dump(by_alias=True, include={"id", *fields})
+        object_id = ObjectId(id)
+        document = await CompuestoRepository.read_collection.find_one({"_id": object_id}, find_projection(fields))
+        if document:
+            document["_id"] = str(document["_id"])
+        return document
+    
+    @staticmethod
+    async def _load_many(ids: List[str]) -> Dict[str, Compuesto]:
+        """Fetch several compuestos with a single $in query, keyed by string id"""
+        object_ids, _ = parse_object_ids(ids)
+        if not object_ids:
+            return {}
+        found = {}
+        cursor = CompuestoRepository.read_collection.find({"_id": {"$in": object_ids}})
+        async for document in cursor:
+            document["_id"] = str(document["_id"])
+            found[document["_id"]] = Compuesto(**document)
+        return found
+    
+    @staticmethod
+    async def get_many(ids: List[str]) -> List[Compuesto]:
+        """Get several compuestos in request order; cache misses resolve in one $in query"""
+        found = {}
+        missing = []
+        causal = in_causal_session()
+        snapshot = CompuestoRepository._snapshot()
+        # ids en su forma canonica: las claves de la cache y de _load_many son hex en minusculas
+        requested = [id for id in dict.fromkeys(normalize_id(id) for id in ids) if id is not None]
+        for id in requested:
+            if snapshot is not None and snapshot.covers(id):
+                if snapshot.get(id) is not None:
+                    found[id] = snapshot.get(id)
+                continue
+            cached = None if causal else CompuestoRepository.cache.get(id)
+            if cached is not None:
+                found[id] = cached
+            else:
+                missing.append(id)
+        if missing:
+            started = time.monotonic()
+            loaded = await CompuestoRepository._load_many(missing)
+            for id, compuesto in loaded.items():
+                CompuestoRepository.cache.fill(id, compuesto, started)
+            found.update(loaded)
+        return [found[id].model_copy() for id in requested if id in found]
+    
     @staticmethod
     async def create(compuesto: Compuesto) -> Compuesto:
         """Create a new compuesto"""
         # Ensure ID is not included in the insert operation
-        compuesto_dict = compuesto.dict(exclude_unset=True)
+        compuesto_dict = compuesto.dict(exclude_unset=True, exclude=set(VERSION_FIELDS))
+        compuesto_dict.pop("id", None)
         if "_id" in compuesto_dict:
             del compuesto_dict["_id"]
+        compuesto_dict.update(initial_version())
         
         result = await CompuestoRepository.collection.insert_one(compuesto_dict)
         
-        # Return the created compuesto with the generated ID
-        created_compuesto = await CompuestoRepository.get_by_id(str(result.inserted_id))
-        return created_compuesto
+        # Build the created compuesto from the inserted document, no re-read needed
+        compuesto_dict["_id"] = str(result.inserted_id)
+        created_compuesto = Compuesto(**compuesto_dict)
+        CompuestoRepository.cache.set(compuesto_dict["_id"], created_compuesto)
+        CompuestoRepository._snapshot_put(created_compuesto)
+        return created_compuesto.model_copy()
+    
+    @staticmethod
+    async def create_many(compuestos: List[Compuesto]) -> List[Dict[str, Any]]:
+        """Insert several compuestos with one unordered insert_many and report each item"""
+        documents = []
+        for compuesto in compuestos:
+            compuesto_dict = compuesto.dict(exclude_unset=True, exclude=set(VERSION_FIELDS))
+            compuesto_dict.pop("id", None)
+            compuesto_dict.pop("_id", None)
+            compuesto_dict.update(initial_version())
+            documents.append(compuesto_dict)
+        if not documents:
+            return []
+        
+        errors = {}
+        try:
+            # insert_many asigna el _id a cada documento antes de enviarlo
+            await CompuestoRepository.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                errors[error["index"]] = error.get("errmsg", "write error")
+        
+        results = []
+        for index, document in enumerate(documents):
+            if index in errors:
+                results.append({"index": index, "status": "error", "error": errors[index]})
+                continue
+            document["_id"] = str(document["_id"])
+            created_compuesto = Compuesto(**document)
+            CompuestoRepository.cache.set(document["_id"], created_compuesto)
+            CompuestoRepository._snapshot_put(created_compuesto)
+            results.append({"index": index, "status": "created", "id": document["_id"]})
+        return results
+    
+    @staticmethod
+    async def existing_ids(ids: List[str]) -> Set[str]:
+        """Return which of the given ids exist, using a single $in query"""
+        object_ids, _ = parse_object_ids(ids)
+        if not object_ids:
+            return set()
+        snapshot = CompuestoRepository._snapshot()
+        canonical = [str(object_id) for object_id in object_ids]
+        if snapshot is not None and all(snapshot.covers(id) for id in canonical):
+            existing = {id for id in canonical if snapshot.get(id) is not None}
+        else:
+            existing = {str(object_id) for object_id in await CompuestoRepository.collection.distinct("_id", {"_id": {"$in": object_ids}})}
+        # los ids tal como se pidieron, para compararlos con los de la entrada
+        return {id for id in ids if normalize_id(id) in existing}
     
     @staticmethod
-    async def update(id: str, compuesto: Compuesto) -> Optional[Compuesto]:
-        """Update an existing compuesto"""
-        compuesto_dict = compuesto.dict(exclude_unset=True)
+    async def update(id: str, compuesto: Compuesto, expected_version: Optional[int] = None) -> Optional[Tuple[Compuesto, Compuesto]]:
+        """Update an existing compuesto and return (previous, updated); with expected_version only if it is still at that version"""
+        compuesto_dict = compuesto.dict(exclude_unset=True, exclude=set(VERSION_FIELDS))
+        compuesto_dict.pop("id", None)
         if "_id" in compuesto_dict:
             del compuesto_dict["_id"]
             
-        await CompuestoRepository.collection.update_one(
-            {"_id": ObjectId(id)},
-            {"$set": compuesto_dict}
+        id = normalize_id(id)
+        if id is None:
+            return None
+        object_id = ObjectId(id)
+        
+        # Atomic update that returns the document as it was; None means it does not exist
+        query = {"_id": object_id}
+        if expected_version is not None:
+            query.update(version_filter(expected_version))
+        update = bump_version(compuesto_dict)
+        document = await CompuestoRepository.collection.find_one_and_update(
+            query,
+            update,
+            return_document=ReturnDocument.BEFORE
         )
+        if not document:
+            CompuestoRepository.cache.invalidate(id)
+            return None
         
-        # Return the updated compuesto
-        return await CompuestoRepository.get_by_id(id)
+        document["_id"] = str(document["_id"])
+        previous = Compuesto(**document)
+        # la version nueva es la anterior con el mismo $set/$inc aplicado
+        document.update(update["$set"])
+        document["version"] = (document.get("version") or 0) + 1
+        updated_compuesto = Compuesto(**document)
+        CompuestoRepository.cache.set(id, updated_compuesto)
+        CompuestoRepository._snapshot_put(updated_compuesto)
+        return previous, updated_compuesto.model_copy()
+    
+    @staticmethod
+    async def get_fresh(id: str) -> Optional[Compuesto]:
+        """Current compuesto read from the primary, bypassing the cache"""
+        id = normalize_id(id)
+        if id is None:
+            return None
+        object_id = ObjectId(id)
+        document = await CompuestoRepository.collection.find_one({"_id": object_id})
+        if not document:
+            return None
+        document["_id"] = str(document["_id"])
+        return Compuesto(**document)
     
     @staticmethod
-    async def delete(id: str) -> bool:
-        """Delete a compuesto by its ID"""
-        result = await CompuestoRepository.collection.delete_one({"_id": ObjectId(id)})
+    async def patch(id: str, changes: Dict[str, Any], expected_version: int) -> Optional[Compuesto]:
+        """Write only the changed fields ($set, or $unset for None) if the compuesto is still at expected_version"""
+        id = normalize_id(id)
+        if id is None:
+            return None
+        object_id = ObjectId(id)
+        update = bump_version({field: value for field, value in changes.items() if value is not None})
+        removed = [field for field, value in changes.items() if value is None]
+        if removed:
+            update["$unset"] = {field: "" for field in removed}
+        # la misma operacion atomica devuelve el documento nuevo
+        document = await CompuestoRepository.collection.find_one_and_update(
+            {"_id": object_id, **version_filter(expected_version)},
+            update,
+            return_document=ReturnDocument.AFTER
+        )
+        if not document:
+            CompuestoRepository.cache.invalidate(id)
+            return None
+        
+        document["_id"] = str(document["_id"])
+        patched_compuesto = Compuesto(**document)
+        CompuestoRepository.cache.set(id, patched_compuesto)
+        CompuestoRepository._snapshot_put(patched_compuesto)
+        return patched_compuesto.model_copy()
+    
+    @staticmethod
+    async def delete(id: str, session=None, expected_version: Optional[int] = None) -> bool:
+        """Delete a compuesto by its ID; False means it did not exist (or is no longer at expected_version)"""
+        id = normalize_id(id)
+        if id is None:
+            return False
+        object_id = ObjectId(id)
+        query = {"_id": object_id}
+        if expected_version is not None:
+            query.update(version_filter(expected_version))
+        result = await CompuestoRepository.collection.delete_one(query, session=session)
+        CompuestoRepository._invalidate([id], session)
         return result.deleted_count > 0
     
     @staticmethod
-    async def get_medicamentos_by_compuesto_id(compuesto_id: str) -> List[dict]:
+    async def delete_many(ids: List[str], session=None) -> List[str]:
+        """Delete several compuestos with a single $in and return the ids that existed"""
+        object_ids, _ = parse_object_ids(ids)
+        if not object_ids:
+            return []
+        existing = await CompuestoRepository.collection.distinct(
+            "_id", {"_id": {"$in": object_ids}}, session=session
+        )
+        if existing:
+            await CompuestoRepository.collection.delete_many({"_id": {"$in": existing}}, session=session)
+        CompuestoRepository._invalidate([str(object_id) for object_id in object_ids], session)
+        return [str(object_id) for object_id in existing]
+    
+    @staticmethod
+    async def get_medicamentos_by_compuesto_id(compuesto_id: str, fields: Optional[List[str]] = None) -> List[dict]:
         """Get all medicamentos that contain a specific compuesto"""
         pipeline = [
             {"$match": {"compuesto_id": ObjectId(compuesto_id)}},
@@ -77,17 +451,17 @@ class CompuestoRepository:
                 "as": "medicamento"
             }},
             {"$unwind": "$medicamento"},
-            {"$project": {
+            {"$project": project_stage_fields({
                 "_id": {"$toString": "$medicamento._id"},
                 "nombre": "$medicamento.nombre",
                 "fabricante": "$medicamento.fabricante",
                 "concentracion": "$concentracion",
                 "unidad_medida": "$unidad_medida"
-            }}
+            }, fields)}
         ]
         
         result = []
-        cursor = db.compuestos_por_medicamento.aggregate(pipeline)
+        cursor = get_collection("compuestos_por_medicamento", read=True).aggregate(pipeline)
         async for doc in cursor:
             result.append(doc)
         
@@ -0,0 +1,21 @@
+from bson import ObjectId
+from typing import Iterable, List, Optional, Tuple
+
+def parse_object_ids(ids: Iterable[str]) -> Tuple[List[ObjectId], List[str]]:
+    """Split string ids into unique ObjectIds (in order) and the invalid ones"""
+    valid = []
+    invalid = []
+    seen = set()
+    for id in ids:
+        if not ObjectId.is_valid(id):
+            invalid.append(id)
+            continue
+        object_id = ObjectId(id)
+        if object_id not in seen:
+            seen.add(object_id)
+            valid.append(object_id)
+    return valid, invalid
+
+def normalize_id(id: str) -> Optional[str]:
+    """Canonical form of an ObjectId string (lowercase hex, as str(ObjectId) gives it), or None if invalid"""
+    return str(ObjectId(id)) if ObjectId.is_valid(id) else None
@@ -0,0 +1,110 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from pymongo import ReturnDocument
+from app.db.jobs import JOBS_COLLECTION, JOBS_INDEXES
+from app.db.mongo import CollectionRef
+
+def _now() -> datetime:
+    # como lo devuelve MongoDB (UTC sin zona, milisegundos), para que la respuesta al encolar coincida con /api/jobs
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+class JobRepository:
+    """Repository for the background jobs queue"""
+
+    # el progreso se lee del primario: un secundario atrasado lo mostraria retrocediendo
+    collection = CollectionRef(JOBS_COLLECTION)
+
+    @staticmethod
+    async def ensure_indexes() -> None:
+        await JobRepository.collection.create_index(JOBS_INDEXES)
+
+    @staticmethod
+    async def create(tipo: str, params: Dict[str, Any], total: int, session=None) -> Dict[str, Any]:
+        """Queue a job; with a session it only exists if the write that needs it commits"""
+        now = _now()
+        document = {
+            "tipo": tipo,
+            "params": params,
+            "status": "queued",
+            "processed": 0,
+            "total": total,
+            "attempts": 0,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+            "lease_until": None,
+        }
+        result = await JobRepository.collection.insert_one(document, session=session)
+        document["_id"] = result.inserted_id
+        return document
+
+    @staticmethod
+    async def get_by_id(id: str) -> Optional[Dict[str, Any]]:
+        try:
+            object_id = ObjectId(id)
+        except InvalidId:
+            return None
+        return await JobRepository.collection.find_one({"_id": object_id})
+
+    @staticmethod
+    async def get_recent(status: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        """Latest jobs first, optionally only those in one status"""
+        query = {"status": status} if status else {}
+        cursor = JobRepository.collection.find(query).sort("_id", -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    @staticmethod
+    async def claim(lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """Take the oldest queued job, or a running one whose worker stopped renewing its lease"""
+        now = _now()
+        return await JobRepository.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued"},
+                {"status": "running", "lease_until": {"$lt": now}},
+            ]},
+            {
+                "$set": {"status": "running", "updated_at": now, "lease_until": now + timedelta(seconds=lease_seconds)},
+                # started_at solo se fija la primera vez (el documento se crea sin el)
+                "$min": {"started_at": now},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    @staticmethod
+    async def progress(id: ObjectId, processed: int, lease_seconds: float, session=None) -> None:
+        """Count processed items and renew the lease; with a session it commits with the batch"""
+        now = _now()
+        await JobRepository.collection.update_one(
+            {"_id": id},
+            {
+                "$inc": {"processed": processed},
+                "$set": {"updated_at": now, "lease_until": now + timedelta(seconds=lease_seconds)},
+            },
+            session=session
+        )
+
+    @staticmethod
+    async def finish(id: ObjectId) -> None:
+        now = _now()
+        await JobRepository.collection.update_one(
+            {"_id": id},
+            {"$set": {"status": "done", "error": None, "updated_at": now, "finished_at": now, "lease_until": None}}
+        )
+
+    @staticmethod
+    async def release(id: ObjectId, error: Optional[str] = None, failed: bool = False) -> None:
+        """Give a claimed job back to the queue, or mark it failed"""
+        now = _now()
+        update = {"status": "failed" if failed else "queued", "updated_at": now, "lease_until": None}
+        if error is not None:
+            update["error"] = error
+        if failed:
+            update["finished_at"] = now
+        await JobRepository.collection.update_one({"_id": id}, {"$set": update})
@@ -0,0 +1,86 @@
+"""
+DataLoader-style request coalescing for point reads.
+
+Every load() issued during the same event-loop tick is collected and resolved by
+one call to the batch function (a single $in query). Concurrent loads of a key
+that is already queued or in flight share the same future ("singleflight").
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+BatchFunction = Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]]
+
+
+class BatchLoader:
+    """Merges concurrent loads into batched lookups"""
+
+    def __init__(self, batch_fn: BatchFunction, max_batch_size: int = 1000):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._scheduled = False
+        # el loop solo guarda referencias debiles a sus tareas: un lote en curso no debe recolectarse
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.coalesced = 0
+
+    async def load(self, key: Hashable) -> Any:
+        """Resolve one key; returns None when the batch function has no value for it"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # los futures pertenecen a un loop; al cambiar de loop se empieza de cero
+            self._loop = loop
+            self._pending = {}
+            self._inflight = {}
+            self._scheduled = False
+            self._tasks = set()
+
+        future = self._pending.get(key) or self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = loop.create_future()
+            self._pending[key] = future
+            if not self._scheduled:
+                self._scheduled = True
+                loop.call_soon(self._dispatch)
+        # shield: cancelar a un solicitante no cancela la carga compartida
+        return await asyncio.shield(future)
+
+    def _dispatch(self) -> None:
+        self._scheduled = False
+        batch = self._pending
+        self._pending = {}
+        self._inflight.update(batch)
+        keys = list(batch)
+        for start in range(0, len(keys), self.max_batch_size):
+            chunk = {key: batch[key] for key in keys[start:start + self.max_batch_size]}
+            task = self._loop.create_task(self._run(chunk))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[Hashable, asyncio.Future]) -> None:
+        self.batches += 1
+        try:
+            values = await self.batch_fn(list(batch))
+            for key, future in batch.items():
+                if not future.done():
+                    future.set_result(values.get(key))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            for key, future in batch.items():
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
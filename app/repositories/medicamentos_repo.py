@@ -1,72 +1,421 @@
+import time
 from bson import ObjectId
-from typing import List, Optional
-from app.db.mongo import db
+from datetime import datetime
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from app.db.indexes import NOMBRE_COLLATION
+from app.db.mongo import CollectionRef, after_commit, get_collection, in_causal_session
+from app.db.views import compuestos_lookup_stage
 from app.models.medicamento import Medicamento
+from app.models.medicamento_detalle import MedicamentoDetalle
+from app.repositories.cache import build_cache
+from app.repositories.ids import normalize_id, parse_object_ids
+from app.repositories.loader import BatchLoader
+from app.repositories.pagination import build_keyset_query, clamp_limit, encode_cursor
+from app.repositories.projection import find_projection, project_stage_fields
+from app.repositories.versioning import DocumentVersion, VERSION_FIELDS, bump_version, initial_version, version_filter, version_of
 
 class MedicamentoRepository:
     """Repository for Medicamento entity operations"""
     
-    collection = db.medicamentos
+    collection = CollectionRef("medicamentos")
+    # lecturas enrutadas segun MONGO_READ_PREFERENCE
+    read_collection = CollectionRef("medicamentos", read=True)
+    cache = build_cache()
+    FIELDS = ("nombre", "fabricante")
+    # agrupa los get_by_id concurrentes del mismo tick en un solo $in
+    loader = BatchLoader(lambda ids: MedicamentoRepository._load_many(ids))
     
     @staticmethod
     async def get_all() -> List[Medicamento]:
         """Get all medicamentos from the database"""
         medicamentos = []
-        cursor = MedicamentoRepository.collection.find({})
+        cursor = MedicamentoRepository.read_collection.find({})
         async for document in cursor:
             document["_id"] = str(document["_id"])
             medicamentos.append(Medicamento(**document))
         return medicamentos
     
+    @staticmethod
+    def _output_projection(fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Projection that returns the requested model fields, with _id already as a string"""
+        projection = {"_id": {"$toString": "$_id"}}
+        for field in (MedicamentoRepository.FIELDS if fields is None else fields):
+            projection[field] = 1
+        return projection
+    
+    @staticmethod
+    async def get_page(limit: int, after: Optional[str] = None, sort: str = "_id", fields: Optional[List[str]] = None) -> Tuple[List[dict], Optional[str]]:
+        """Get one page of medicamentos as raw documents using keyset pagination on the sort field"""
+        limit = clamp_limit(limit)
+        query, sort_spec = build_keyset_query(sort, after)
+        # el campo de orden se proyecta siempre porque el cursor lo necesita
+        projected = None if fields is None else list(dict.fromkeys(fields + ([sort] if sort != "_id" else [])))
+        # se pide un documento extra para saber si hay pagina siguiente
+        cursor = MedicamentoRepository.read_collection.find(query, MedicamentoRepository._output_projection(projected)).sort(sort_spec).limit(limit + 1)
+        documents = await cursor.to_list(length=limit + 1)
+        
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = encode_cursor(sort, documents[-1])
+        if fields is not None and sort != "_id" and sort not in fields:
+            for document in documents:
+                document.pop(sort, None)
+        # datos confiables de la base: se serializan sin volver a validar con Pydantic
+        return documents, next_cursor
+    
+    @staticmethod
+    async def iter_documents(batch_size: int = 1000) -> AsyncIterator[dict]:
+        """Yield every raw medicamento document as the cursor delivers it"""
+        cursor = MedicamentoRepository.read_collection.find({}, MedicamentoRepository._output_projection()).sort("_id", 1).batch_size(batch_size)
+        async for document in cursor:
+            yield document
+    
+    @staticmethod
+    async def search(q: str, limit: int = 20) -> List[dict]:
+        """Search medicamentos by nombre: accent-insensitive prefix for one word, full text for several"""
+        projection = MedicamentoRepository._output_projection()
+        if len(q.split()) > 1:
+            projection["score"] = {"$meta": "textScore"}
+            cursor = MedicamentoRepository.read_collection.find({"$text": {"$search": q}}, projection).sort(
+                [("score", {"$meta": "textScore"})]
+            ).limit(limit)
+        else:
+            # rango [q, q + U+FFFF) con la misma collation del indice nombre_es_ci
+            cursor = MedicamentoRepository.read_collection.find(
+                {"nombre": {"$gte": q, "$lt": q + "\uffff"}}, projection
+            ).collation(NOMBRE_COLLATION).sort("nombre", 1).limit(limit)
+        return await cursor.to_list(length=limit)
+    
+    @staticmethod
+    def _invalidate(ids: List[str], session=None) -> None:
+        # dentro de una transaccion, al confirmarla: antes, otra lectura volveria a cachear la version anterior
+        def invalidate() -> None:
+            for id in ids:
+                MedicamentoRepository.cache.invalidate(id)
+        after_commit(session, invalidate)
+    
+    @staticmethod
+    async def iter_names() -> AsyncIterator[Tuple[str, str]]:
+        """Yield (id, nombre) for every medicamento, used to build the autocomplete index"""
+        cursor = MedicamentoRepository.read_collection.find({}, {"nombre": 1}).batch_size(5000)
+        async for document in cursor:
+            yield str(document["_id"]), document["nombre"]
+    
     @staticmethod
     async def get_by_id(id: str) -> Optional[Medicamento]:
-        """Get a medicamento by its ID"""
+        """Get a medicamento by its ID, served from the cache or a coalesced batch query"""
+        id = normalize_id(id)
+        if id is None:
+            return None
+        # con sesion causal se lee de la base, sin cache ni lotes de otras peticiones
+        causal = in_causal_session()
+        cached = None if causal else MedicamentoRepository.cache.get(id)
+        if cached is not None:
+            return cached.model_copy()
+        started = time.monotonic()
         try:
-            document = await MedicamentoRepository.collection.find_one({"_id": ObjectId(id)})
-            if document:
-                document["_id"] = str(document["_id"])
-                return Medicamento(**document)
+            if causal:
+                medicamento = (await MedicamentoRepository._load_many([id])).get(id)
+            else:
+                medicamento = await MedicamentoRepository.loader.load(id)
+            if medicamento:
+                MedicamentoRepository.cache.fill(id, medicamento, started)
+                return medicamento.model_copy()
             return None
         except Exception:
             return None
     
+    @staticmethod
+    async def get_version(id: str, fresh: bool = False) -> Optional[DocumentVersion]:
+        """Version of a medicamento; from memory when held there unless fresh, otherwise a find_one projecting only the version"""
+        id = normalize_id(id)
+        if id is None:
+            return None
+        if not fresh and not in_causal_session():
+            cached = MedicamentoRepository.cache.get(id)
+            if cached is not None:
+                return version_of(cached)
+        object_id = ObjectId(id)
+        # sin cargar (ni cachear) el documento completo: un 304 no lo necesita
+        collection = MedicamentoRepository.collection if fresh else MedicamentoRepository.read_collection
+        document = await collection.find_one({"_id": object_id}, {field: 1 for field in VERSION_FIELDS})
+        return version_of(document) if document else None
+    
+    @staticmethod
+    async def touch(ids: List[str], session=None, after: Optional[datetime] = None) -> None:
+        """Increment the version of medicamentos whose relations changed"""
+        object_ids, _ = parse_object_ids(ids)
+        if not object_ids:
+            return
+        await MedicamentoRepository.collection.update_many({"_id": {"$in": object_ids}}, bump_version(after=after), session=session)
+        MedicamentoRepository._invalidate([str(object_id) for object_id in object_ids], session)
+    
+    @staticmethod
+    async def touch_stale(ids: List[str], since: datetime, limit: int, session=None) -> int:
+        """Touch up to limit of the medicamentos last written at or before the given time; returns how many"""
+        object_ids, _ = parse_object_ids(ids)
+        if not object_ids:
+            return 0
+        documents = await MedicamentoRepository.collection.find(
+            {"_id": {"$in": object_ids}, "$or": [{"updated_at": {"$lte": since}}, {"updated_at": None}]},
+            {"_id": 1},
+            session=session
+        ).limit(limit).to_list(length=limit)
+        # quedan con updated_at posterior a since: el siguiente lote ya no los elige
+        await MedicamentoRepository.touch([str(document["_id"]) for document in documents], session=session, after=since)
+        return len(documents)
+    
+    @staticmethod
+    async def get_partial(id: str, fields: List[str]) -> Optional[dict]:
+        """Get only some fields of a medicamento, projected by Mongo unless it is cached"""
+        id = normalize_id(id)
+        if id is None:
+            return None
+        cached = None if in_causal_session() else MedicamentoRepository.cache.get(id)
+        if cached is not None:
+            return cached.model_dump(by_alias=True, include={"id", *fields})
+        object_id = ObjectId(id)
+        document = await MedicamentoRepository.read_collection.find_one({"_id": object_id}, find_projection(fields))
+        if document:
+            document["_id"] = str(document["_id"])
+        return document
+    
+    @staticmethod
+    async def _load_many(ids: List[str]) -> Dict[str, Medicamento]:
+        """Fetch several medicamentos with a single $in query, keyed by string id"""
+        object_ids, _ = parse_object_ids(ids)
+        if not object_ids:
+            return {}
+        found = {}
+        cursor = MedicamentoRepository.read_collection.find({"_id": {"$in": object_ids}})
+        async for document in cursor:
+            document["_id"] = str(document["_id"])
+            found[document["_id"]] = Medicamento(**document)
+        return found
+    
+    @staticmethod
+    async def get_many(ids: List[str]) -> List[Medicamento]:
+        """Get several medicamentos in request order; cache misses resolve in one $in query"""
+        found = {}
+        missing = []
+        causal = in_causal_session()
+        # ids en su forma canonica: las claves de la cache y de _load_many son hex en minusculas
+        requested = [id for id in dict.fromkeys(normalize_id(id) for id in ids) if id is not None]
+        for id in requested:
+            cached = None if causal else MedicamentoRepository.cache.get(id)
+            if cached is not None:
+                found[id] = cached
+            else:
+                missing.append(id)
+        if missing:
+            started = time.monotonic()
+            loaded = await MedicamentoRepository._load_many(missing)
+            for id, medicamento in loaded.items():
+                MedicamentoRepository.cache.fill(id, medicamento, started)
+            found.update(loaded)
+        return [found[id].model_copy() for id in requested if id in found]
+    
     @staticmethod
     async def create(medicamento: Medicamento) -> Medicamento:
         """Create a new medicamento"""
         # Ensure ID is not included in the insert operation
-        medicamento_dict = medicamento.dict(exclude_unset=True)
+        medicamento_dict = medicamento.dict(exclude_unset=True, exclude=set(VERSION_FIELDS))
+        medicamento_dict.pop("id", None)
         if "_id" in medicamento_dict:
             del medicamento_dict["_id"]
+        medicamento_dict.update(initial_version())
         
         result = await MedicamentoRepository.collection.insert_one(medicamento_dict)
         
-        # Return the created medicamento with the generated ID
-        created_medicamento = await MedicamentoRepository.get_by_id(str(result.inserted_id))
-        return created_medicamento
+        # Build the created medicamento from the inserted document, no re-read needed
+        medicamento_dict["_id"] = str(result.inserted_id)
+        created_medicamento = Medicamento(**medicamento_dict)
+        MedicamentoRepository.cache.set(medicamento_dict["_id"], created_medicamento)
+        return created_medicamento.model_copy()
     
     @staticmethod
-    async def update(id: str, medicamento: Medicamento) -> Optional[Medicamento]:
-        """Update an existing medicamento"""
-        medicamento_dict = medicamento.dict(exclude_unset=True)
+    async def create_many(medicamentos: List[Medicamento]) -> List[Dict[str, Any]]:
+        """Insert several medicamentos with one unordered insert_many and report each item"""
+        documents = []
+        for medicamento in medicamentos:
+            medicamento_dict = medicamento.dict(exclude_unset=True, exclude=set(VERSION_FIELDS))
+            medicamento_dict.pop("id", None)
+            medicamento_dict.pop("_id", None)
+            medicamento_dict.update(initial_version())
+            documents.append(medicamento_dict)
+        if not documents:
+            return []
+        
+        errors = {}
+        try:
+            # insert_many asigna el _id a cada documento antes de enviarlo
+            await MedicamentoRepository.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                errors[error["index"]] = error.get("errmsg", "write error")
+        
+        results = []
+        for index, document in enumerate(documents):
+            if index in errors:
+                results.append({"index": index, "status": "error", "error": errors[index]})
+                continue
+            document["_id"] = str(document["_id"])
+            MedicamentoRepository.cache.set(document["_id"], Medicamento(**document))
+            results.append({"index": index, "status": "created", "id": document["_id"]})
+        return results
+    
+    @staticmethod
+    async def existing_ids(ids: List[str]) -> Set[str]:
+        """Return which of the given ids exist, using a single $in query"""
+        object_ids, _ = parse_object_ids(ids)
+        if not object_ids:
+            return set()
+        existing = {str(object_id) for object_id in await MedicamentoRepository.collection.distinct("_id", {"_id": {"$in": object_ids}})}
+        # los ids tal como se pidieron, para compararlos con los de la entrada
+        return {id for id in ids if normalize_id(id) in existing}
+    
+    @staticmethod
+    async def count_fabricantes(ids: List[str], session=None) -> Dict[str, int]:
+        """Number of the given medicamentos per fabricante, read from the primary"""
+        object_ids, _ = parse_object_ids(ids)
+        if not object_ids:
+            return {}
+        cursor = MedicamentoRepository.collection.aggregate([
+            {"$match": {"_id": {"$in": object_ids}}},
+            {"$group": {"_id": "$fabricante", "n": {"$sum": 1}}}
+        ], session=session)
+        return {document["_id"]: document["n"] async for document in cursor if document["_id"] is not None}
+    
+    @staticmethod
+    async def update(id: str, medicamento: Medicamento, expected_version: Optional[int] = None) -> Optional[Tuple[Medicamento, Medicamento]]:
+        """Update an existing medicamento and return (previous, updated); with expected_version only if it is still at that version"""
+        medicamento_dict = medicamento.dict(exclude_unset=True, exclude=set(VERSION_FIELDS))
+        medicamento_dict.pop("id", None)
         if "_id" in medicamento_dict:
             del medicamento_dict["_id"]
             
-        await MedicamentoRepository.collection.update_one(
-            {"_id": ObjectId(id)},
-            {"$set": medicamento_dict}
+        id = normalize_id(id)
+        if id is None:
+            return None
+        object_id = ObjectId(id)
+        
+        # Atomic update that returns the document as it was; None means it does not exist
+        query = {"_id": object_id}
+        if expected_version is not None:
+            query.update(version_filter(expected_version))
+        update = bump_version(medicamento_dict)
+        document = await MedicamentoRepository.collection.find_one_and_update(
+            query,
+            update,
+            return_document=ReturnDocument.BEFORE
         )
+        if not document:
+            MedicamentoRepository.cache.invalidate(id)
+            return None
         
-        # Return the updated medicamento
-        return await MedicamentoRepository.get_by_id(id)
+        document["_id"] = str(document["_id"])
+        previous = Medicamento(**document)
+        # la version nueva es la anterior con el mismo $set/$inc aplicado
+        document.update(update["$set"])
+        document["version"] = (document.get("version") or 0) + 1
+        updated_medicamento = Medicamento(**document)
+        MedicamentoRepository.cache.set(id, updated_medicamento)
+        return previous, updated_medicamento.model_copy()
+    
+    @staticmethod
+    async def get_fresh(id: str) -> Optional[Medicamento]:
+        """Current medicamento read from the primary, bypassing the cache"""
+        id = normalize_id(id)
+        if id is None:
+            return None
+        object_id = ObjectId(id)
+        document = await MedicamentoRepository.collection.find_one({"_id": object_id})
+        if not document:
+            return None
+        document["_id"] = str(document["_id"])
+        return Medicamento(**document)
     
     @staticmethod
-    async def delete(id: str) -> bool:
-        """Delete a medicamento by its ID"""
-        result = await MedicamentoRepository.collection.delete_one({"_id": ObjectId(id)})
+    async def patch(id: str, changes: Dict[str, Any], expected_version: int) -> Optional[Medicamento]:
+        """Write only the changed fields ($set, or $unset for None) if the medicamento is still at expected_version"""
+        id = normalize_id(id)
+        if id is None:
+            return None
+        object_id = ObjectId(id)
+        update = bump_version({field: value for field, value in changes.items() if value is not None})
+        removed = [field for field, value in changes.items() if value is None]
+        if removed:
+            update["$unset"] = {field: "" for field in removed}
+        # la misma operacion atomica devuelve el documento nuevo
+        document = await MedicamentoRepository.collection.find_one_and_update(
+            {"_id": object_id, **version_filter(expected_version)},
+            update,
+            return_document=ReturnDocument.AFTER
+        )
+        if not document:
+            MedicamentoRepository.cache.invalidate(id)
+            return None
+        
+        document["_id"] = str(document["_id"])
+        patched_medicamento = Medicamento(**document)
+        MedicamentoRepository.cache.set(id, patched_medicamento)
+        return patched_medicamento.model_copy()
+    
+    @staticmethod
+    async def delete(id: str, session=None, expected_version: Optional[int] = None) -> bool:
+        """Delete a medicamento by its ID; False means it did not exist (or is no longer at expected_version)"""
+        id = normalize_id(id)
+        if id is None:
+            return False
+        object_id = ObjectId(id)
+        query = {"_id": object_id}
+        if expected_version is not None:
+            query.update(version_filter(expected_version))
+        result = await MedicamentoRepository.collection.delete_one(query, session=session)
+        MedicamentoRepository._invalidate([id], session)
         return result.deleted_count > 0
     
     @staticmethod
-    async def get_compuestos_by_medicamento_id(medicamento_id: str) -> List[dict]:
+    async def delete_many(ids: List[str], session=None) -> List[str]:
+        """Delete several medicamentos with a single $in and return the ids that existed"""
+        object_ids, _ = parse_object_ids(ids)
+        if not object_ids:
+            return []
+        existing = await MedicamentoRepository.collection.distinct(
+            "_id", {"_id": {"$in": object_ids}}, session=session
+        )
+        if existing:
+            await MedicamentoRepository.collection.delete_many({"_id": {"$in": existing}}, session=session)
+        MedicamentoRepository._invalidate([str(object_id) for object_id in object_ids], session)
+        return [str(object_id) for object_id in existing]
+    
+    @staticmethod
+    async def get_detail(id: str) -> Optional[MedicamentoDetalle]:
+        """Get a medicamento with its compuestos in one aggregation; None if it does not exist"""
+        id = normalize_id(id)
+        if id is None:
+            return None
+        object_id = ObjectId(id)
+        pipeline = [
+            {"$match": {"_id": object_id}},
+            {"$limit": 1},
+            compuestos_lookup_stage()
+        ]
+        documents = await MedicamentoRepository.read_collection.aggregate(pipeline).to_list(length=1)
+        if not documents:
+            return None
+        
+        document = documents[0]
+        document["_id"] = str(document["_id"])
+        for compuesto in document["compuestos"]:
+            compuesto["_id"] = str(compuesto["_id"])
+        return MedicamentoDetalle(**document)
+    
+    @staticmethod
+    async def get_compuestos_by_medicamento_id(medicamento_id: str, fields: Optional[List[str]] = None) -> List[dict]:
         """Get all compuestos that are in a specific medicamento"""
         pipeline = [
             {"$match": {"medicamento_id": ObjectId(medicamento_id)}},
@@ -77,16 +426,16 @@ class MedicamentoRepository:
                 "as": "compuesto"
             }},
             {"$unwind": "$compuesto"},
-            {"$project": {
+            {"$project": project_stage_fields({
                 "_id": {"$toString": "$compuesto._id"},
                 "nombre": "$compuesto.nombre",
                 "concentracion": "$concentracion",
                 "unidad_medida": "$unidad_medida"
-            }}
+            }, fields)}
         ]
         
         result = []
-        cursor = db.compuestos_por_medicamento.aggregate(pipeline)
+        cursor = get_collection("compuestos_por_medicamento", read=True).aggregate(pipeline)
         async for doc in cursor:
             result.append(doc)
         
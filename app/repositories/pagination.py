@@ -0,0 +1,65 @@
+"""
+Helpers for opaque-cursor keyset pagination.
+
+A cursor encodes the sort key of the last document of a page (and its _id as
+tie-breaker), so the next page is a range query on an index instead of a skip.
+"""
+
+import base64
+import json
+from bson import ObjectId
+from bson.errors import InvalidId
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+SORT_FIELDS = ("_id", "nombre")
+
+
+def encode_cursor(sort: str, document: Dict[str, Any]) -> str:
+    """Build an opaque cursor pointing right after the given document"""
+    payload = {"s": sort, "id": str(document["_id"])}
+    if sort != "_id":
+        payload["k"] = document.get(sort)
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[ObjectId, Any]:
+    """Decode a cursor into (last _id, last sort key); raises ValueError if invalid"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        last_id = ObjectId(payload["id"])
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise ValueError("Invalid pagination cursor") from e
+    if payload.get("s") != sort:
+        raise ValueError("Pagination cursor does not match the requested sort")
+    return last_id, payload.get("k")
+
+
+def build_keyset_query(sort: str, after: Optional[str]) -> Tuple[Dict[str, Any], List[Tuple[str, int]]]:
+    """Return the (filter, sort spec) for the page that starts after the cursor"""
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"Sort field must be one of {', '.join(SORT_FIELDS)}")
+
+    sort_spec = [("_id", 1)] if sort == "_id" else [(sort, 1), ("_id", 1)]
+    if not after:
+        return {}, sort_spec
+
+    last_id, last_key = decode_cursor(after, sort)
+    if sort == "_id":
+        return {"_id": {"$gt": last_id}}, sort_spec
+    return {
+        "$or": [
+            {sort: {"$gt": last_key}},
+            {sort: last_key, "_id": {"$gt": last_id}},
+        ]
+    }, sort_spec
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    """Keep the page size inside [1, MAX_LIMIT]"""
+    if not limit or limit < 1:
+        return DEFAULT_LIMIT
+    return min(limit, MAX_LIMIT)
@@ -0,0 +1,35 @@
+"""
+Helpers for the fields= query parameter, turned into MongoDB projections.
+The _id is always returned, so it does not need to be requested.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> Optional[List[str]]:
+    """Parse 'nombre,fabricante' into a field list; None means every field"""
+    if fields is None:
+        return None
+    requested = []
+    for field in fields.split(","):
+        field = field.strip()
+        if not field or field in ("_id", "id") or field in requested:
+            continue
+        if field not in allowed:
+            raise ValueError(f"Unknown field '{field}'; allowed fields: {', '.join(allowed)}")
+        requested.append(field)
+    return requested
+
+
+def find_projection(fields: Sequence[str], prefix: str = "") -> Dict[str, Any]:
+    """Inclusion projection for find/find_one, optionally inside an embedded array"""
+    projection = {f"{prefix}_id": 1}
+    for field in fields:
+        projection[f"{prefix}{field}"] = 1
+    return projection
+
+
+def project_stage_fields(stage_fields: Dict[str, Any], fields: Optional[Sequence[str]]) -> Dict[str, Any]:
+    """Keep only the requested fields (and _id) of a $project stage specification"""
+    if fields is None:
+        return stage_fields
+    return {name: value for name, value in stage_fields.items() if name == "_id" or name in fields}
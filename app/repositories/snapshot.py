@@ -0,0 +1,224 @@
+"""
+Immutable in-process snapshot of a small collection kept fresh by a change stream.
+
+start() opens a change stream, loads the whole collection and then applies
+every change event to a new snapshot, so readers never see a half-applied
+update. The stream resumes from its last resume token after a network
+error; when the token is no longer in the oplog, or the stream is
+invalidated (drop, rename), the collection is reloaded from scratch.
+
+Local writes are applied right away (put) or mark their ids as pending
+(invalidate) until their change event arrives, so a worker reads its own
+writes. While the stream is down the snapshot is not ready and callers fall
+back to the database. Change streams need a replica set; on a standalone
+mongod the snapshot stays disabled.
+"""
+
+import asyncio
+import bisect
+import logging
+import os
+import time
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple
+from pymongo.errors import OperationFailure, PyMongoError
+from app.db.mongo import get_collection
+
+logger = logging.getLogger(__name__)
+
+# eventos tras los que el stream se cierra y hay que recargar
+INVALIDATING_EVENTS = ("invalidate", "drop", "rename", "dropDatabase")
+# ChangeStreamHistoryLost / ChangeStreamFatalError: el resume token ya no sirve
+LOST_RESUME_CODES = (280, 286)
+# $changeStream solo existe en replica sets y clusters
+UNSUPPORTED_CODE = 40573
+
+
+def snapshot_enabled(name: str) -> bool:
+    """Opt-in per collection, e.g. COMPUESTOS_SNAPSHOT=1"""
+    return os.getenv(f"{name.upper()}_SNAPSHOT", "0").lower() in ("1", "true", "yes")
+
+
+class Snapshot(NamedTuple):
+    by_id: Mapping[str, Any]
+    # ids ordenados como los ObjectId (mismo orden que su representacion hex)
+    ids: Tuple[str, ...]
+
+
+def _version(item: Any) -> int:
+    return getattr(item, "version", None) or 0
+
+
+class CollectionSnapshot:
+    """Read-only copy of a collection, keyed by string id"""
+
+    def __init__(self, name: str, parse: Callable[[dict], Any], retry_seconds: float = None, pending_ttl: float = None):
+        self.name = name
+        self.parse = parse
+        self.retry_seconds = retry_seconds if retry_seconds is not None else float(os.getenv("SNAPSHOT_RETRY_SECONDS", "5"))
+        # cuanto se espera el evento de una escritura local antes de volver a confiar en la copia
+        self.pending_ttl = pending_ttl if pending_ttl is not None else float(os.getenv("SNAPSHOT_PENDING_TTL_SECONDS", "30"))
+        self._snapshot = Snapshot(MappingProxyType({}), ())
+        self._pending: Dict[str, float] = {}
+        self._ready = False
+        self._started = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.reloads = 0
+        self.changes = 0
+        self.resumes = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def _is_pending(self, id: str) -> bool:
+        deadline = self._pending.get(id)
+        if deadline is None:
+            return False
+        if deadline < time.monotonic():
+            del self._pending[id]
+            return False
+        return True
+
+    def covers(self, id: str) -> bool:
+        """True if the snapshot can answer for this id (present or known absent)"""
+        return self._ready and not self._is_pending(id)
+
+    def complete(self) -> bool:
+        """True if the snapshot can answer for the whole collection"""
+        return self._ready and not any(self._is_pending(id) for id in list(self._pending))
+
+    def get(self, id: str) -> Optional[Any]:
+        return self._snapshot.by_id.get(id)
+
+    def page(self, after: Optional[str], limit: int) -> List[Any]:
+        """Up to limit items in id order, starting after the given id"""
+        snapshot = self._snapshot
+        start = bisect.bisect_right(snapshot.ids, after) if after is not None else 0
+        return [snapshot.by_id[id] for id in snapshot.ids[start:start + limit]]
+
+    def values(self) -> List[Any]:
+        return self.page(None, len(self._snapshot.ids))
+
+    def __len__(self) -> int:
+        return len(self._snapshot.ids)
+
+    def _replace(self, by_id: Dict[str, Any]) -> None:
+        # copia completa: la coleccion es pequena y cambia poco
+        self._snapshot = Snapshot(MappingProxyType(by_id), tuple(sorted(by_id)))
+
+    def put(self, item: Any) -> None:
+        """Apply a document known to be current (local write or change event)"""
+        current = self._snapshot.by_id.get(item.id)
+        self._pending.pop(item.id, None)
+        # un evento atrasado no pisa una version mas nueva ya aplicada
+        if current is not None and _version(current) > _version(item):
+            return
+        by_id = dict(self._snapshot.by_id)
+        by_id[item.id] = item
+        self._replace(by_id)
+
+    def remove(self, id: str) -> None:
+        self._pending.pop(id, None)
+        if id in self._snapshot.by_id:
+            by_id = dict(self._snapshot.by_id)
+            del by_id[id]
+            self._replace(by_id)
+
+    def invalidate(self, id: str) -> None:
+        """Serve this id from the database until its change event arrives"""
+        self._pending[id] = time.monotonic() + self.pending_ttl
+
+    def _apply(self, change: Dict[str, Any]) -> None:
+        self.changes += 1
+        id = str(change["documentKey"]["_id"])
+        document = change.get("fullDocument")
+        if change["operationType"] == "delete" or document is None:
+            # sin fullDocument: el documento se borro antes del lookup
+            self.remove(id)
+        else:
+            self.put(self.parse(document))
+
+    async def _reload(self) -> None:
+        by_id = {}
+        async for document in get_collection(self.name).find({}):
+            item = self.parse(document)
+            by_id[item.id] = item
+        self._replace(by_id)
+        self._pending.clear()
+        self.reloads += 1
+        logger.info("Loaded %d %s into the in-memory snapshot", len(by_id), self.name)
+
+    async def _run(self) -> None:
+        resume_token = None
+        while True:
+            try:
+                stream = get_collection(self.name).watch(full_document="updateLookup", resume_after=resume_token)
+                async with stream:
+                    # try_next abre el stream antes de la carga: los cambios intermedios se reaplican despues
+                    change = await stream.try_next()
+                    if resume_token is None:
+                        await self._reload()
+                    else:
+                        self.resumes += 1
+                    self._ready = True
+                    self._started.set()
+                    while True:
+                        if change is not None:
+                            if change["operationType"] in INVALIDATING_EVENTS:
+                                resume_token = None
+                                break
+                            self._apply(change)
+                        resume_token = stream.resume_token
+                        change = await stream.next()
+                self._ready = False
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                self._ready = False
+                if e.code == UNSUPPORTED_CODE:
+                    logger.warning("Change streams are not available (%s); %s are read from the database", e, self.name)
+                    self._started.set()
+                    return
+                if e.code in LOST_RESUME_CODES:
+                    resume_token = None
+                logger.warning("Change stream on %s failed, retrying: %s", self.name, e)
+                self._started.set()
+                await asyncio.sleep(self.retry_seconds)
+            except Exception as e:
+                self._ready = False
+                if not isinstance(e, PyMongoError):
+                    # un documento que no se pudo interpretar: se recarga todo en el siguiente intento
+                    logger.exception("Unexpected error applying changes to the %s snapshot", self.name)
+                    resume_token = None
+                else:
+                    logger.warning("Change stream on %s failed, retrying: %s", self.name, e)
+                self._started.set()
+                await asyncio.sleep(self.retry_seconds)
+
+    async def start(self) -> None:
+        """Load the snapshot and start tailing; returns once the first attempt finished"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        await self._started.wait()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._ready = False
+        self._started = asyncio.Event()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self._ready,
+            "size": len(self),
+            "pending": len(self._pending),
+            "reloads": self.reloads,
+            "changes": self.changes,
+            "resumes": self.resumes,
+        }
@@ -0,0 +1,59 @@
+from typing import Any, Dict, List, Mapping, Tuple
+from pymongo import UpdateOne
+from app.db.mongo import CollectionRef, get_collection
+from app.db.stats import STATS_COLLECTION, STATS_INDEXES, counter_id, stats_enabled, stats_pipelines
+
+class StatsRepository:
+    """Repository for the incrementally maintained statistics counters"""
+
+    collection = CollectionRef(STATS_COLLECTION)
+    # lecturas enrutadas segun MONGO_READ_PREFERENCE
+    read_collection = CollectionRef(STATS_COLLECTION, read=True)
+    enabled = stats_enabled()
+
+    @staticmethod
+    async def increment(deltas: Mapping[Tuple[str, str], int], session=None) -> None:
+        """Apply counter deltas keyed by (tipo, clave) with one unordered bulk of $inc upserts"""
+        changes = {key: n for key, n in deltas.items() if n}
+        if not changes:
+            return
+        await StatsRepository.collection.bulk_write([
+            UpdateOne(
+                {"_id": counter_id(tipo, clave)},
+                {"$inc": {"n": n}, "$setOnInsert": {"tipo": tipo, "clave": clave}},
+                upsert=True
+            )
+            for (tipo, clave), n in changes.items()
+        ], ordered=False, session=session)
+        decremented = [counter_id(tipo, clave) for (tipo, clave), n in changes.items() if n < 0]
+        if decremented:
+            # contadores que llegaron a cero (p. ej. de un medicamento borrado)
+            await StatsRepository.collection.delete_many(
+                {"_id": {"$in": decremented}, "n": {"$lte": 0}}, session=session
+            )
+
+    @staticmethod
+    async def get_totals() -> Dict[str, int]:
+        """Total medicamentos, compuestos and relaciones"""
+        cursor = StatsRepository.read_collection.find({"tipo": "total"}, {"clave": 1, "n": 1})
+        return {document["clave"]: document["n"] async for document in cursor}
+
+    @staticmethod
+    async def top(tipo: str, limit: int) -> List[Dict[str, Any]]:
+        """Counters of one type with the highest n first"""
+        cursor = StatsRepository.read_collection.find(
+            {"tipo": tipo, "n": {"$gt": 0}}, {"_id": 0, "clave": 1, "n": 1}
+        ).sort("n", -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    @staticmethod
+    async def rebuild() -> Dict[str, int]:
+        """Recompute every counter from the source collections"""
+        await StatsRepository.collection.delete_many({})
+        for source, pipeline in stats_pipelines():
+            await get_collection(source).aggregate(pipeline).to_list(length=None)
+        await StatsRepository.collection.create_index(STATS_INDEXES)
+        counts = await StatsRepository.collection.aggregate([
+            {"$group": {"_id": "$tipo", "n": {"$sum": 1}}}
+        ]).to_list(length=None)
+        return {document["_id"]: document["n"] for document in counts}
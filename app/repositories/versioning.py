@@ -0,0 +1,52 @@
+"""
+Per-document version counters for conditional requests.
+
+Every medicamento and compuesto carries 'version' (incremented on each write
+that changes its representation, including its relations) and 'updated_at'.
+Documents imported before versioning existed have neither and count as
+version 0.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, NamedTuple, Optional
+
+VERSION_FIELDS = ("version", "updated_at")
+
+
+class DocumentVersion(NamedTuple):
+    version: int
+    updated_at: Optional[datetime]
+
+
+def _now() -> datetime:
+    # MongoDB guarda milisegundos en UTC sin zona; se trunca igual para que la cache coincida
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def version_of(document: Any) -> DocumentVersion:
+    """DocumentVersion of a model or raw document"""
+    if isinstance(document, dict):
+        return DocumentVersion(document.get("version") or 0, document.get("updated_at"))
+    return DocumentVersion(document.version or 0, document.updated_at)
+
+
+def initial_version() -> Dict[str, Any]:
+    """Fields stamped on inserted documents"""
+    return {"version": 1, "updated_at": _now()}
+
+
+def bump_version(update: Dict[str, Any] = None, after: Optional[datetime] = None) -> Dict[str, Any]:
+    """Update document that applies $set (if any) and increments the version; updated_at ends up later than after"""
+    updated_at = _now()
+    if after is not None and updated_at <= after:
+        # el reloj de este worker no paso del instante dado (mismo milisegundo o desfase entre servidores)
+        updated_at = after + timedelta(milliseconds=1)
+    return {"$set": {**(update or {}), "updated_at": updated_at}, "$inc": {"version": 1}}
+
+
+def version_filter(expected: int) -> Dict[str, Any]:
+    """Filter clause matching documents still at the expected version"""
+    if expected == 0:
+        return {"version": {"$in": [None, 0]}}
+    return {"version": expected}
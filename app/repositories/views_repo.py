@@ -0,0 +1,235 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+from typing import Any, Dict, List, Optional
+from pymongo import UpdateOne
+from app.db.mongo import CollectionRef, get_collection
+from app.db.views import (
+    COMPUESTOS_VIEW,
+    MEDICAMENTOS_VIEW,
+    VIEW_INDEXES,
+    compuestos_view_pipeline,
+    medicamentos_view_pipeline,
+    views_enabled,
+)
+from app.models.compuesto import Compuesto
+from app.models.medicamento import Medicamento
+from app.models.medicamento_detalle import MedicamentoDetalle
+from app.repositories.projection import find_projection
+
+class MaterializedViewRepository:
+    """Repository for the denormalized medicamento/compuesto read models"""
+
+    medicamentos_view = CollectionRef(MEDICAMENTOS_VIEW)
+    compuestos_view = CollectionRef(COMPUESTOS_VIEW)
+    # lecturas enrutadas segun MONGO_READ_PREFERENCE
+    medicamentos_view_read = CollectionRef(MEDICAMENTOS_VIEW, read=True)
+    compuestos_view_read = CollectionRef(COMPUESTOS_VIEW, read=True)
+    enabled = views_enabled()
+
+    @staticmethod
+    def _stringify(entries: List[dict]) -> List[dict]:
+        for entry in entries:
+            entry["_id"] = str(entry["_id"])
+        return entries
+
+    @staticmethod
+    async def get_compuestos(medicamento_id: str, fields: Optional[List[str]] = None) -> Optional[List[dict]]:
+        """Compuestos embedded in a medicamento; None if the medicamento does not exist"""
+        try:
+            document = await MaterializedViewRepository.medicamentos_view_read.find_one(
+                {"_id": ObjectId(medicamento_id)},
+                {"compuestos": 1} if fields is None else find_projection(fields, prefix="compuestos.")
+            )
+        except InvalidId:
+            return None
+        if document is None:
+            return None
+        return MaterializedViewRepository._stringify(document.get("compuestos", []))
+
+    @staticmethod
+    async def get_medicamento_detail(medicamento_id: str) -> Optional[MedicamentoDetalle]:
+        """Medicamento with its embedded compuestos; None if it does not exist"""
+        try:
+            document = await MaterializedViewRepository.medicamentos_view_read.find_one({"_id": ObjectId(medicamento_id)})
+        except InvalidId:
+            return None
+        if document is None:
+            return None
+        document["_id"] = str(document["_id"])
+        MaterializedViewRepository._stringify(document.get("compuestos", []))
+        return MedicamentoDetalle(**document)
+
+    @staticmethod
+    async def get_medicamentos(compuesto_id: str, fields: Optional[List[str]] = None) -> Optional[List[dict]]:
+        """Medicamentos embedded in a compuesto; None if the compuesto does not exist"""
+        try:
+            document = await MaterializedViewRepository.compuestos_view_read.find_one(
+                {"_id": ObjectId(compuesto_id)},
+                {"medicamentos": 1} if fields is None else find_projection(fields, prefix="medicamentos.")
+            )
+        except InvalidId:
+            return None
+        if document is None:
+            return None
+        return MaterializedViewRepository._stringify(document.get("medicamentos", []))
+
+    @staticmethod
+    async def save_medicamento(medicamento: Medicamento, session=None) -> None:
+        """Upsert the medicamento view document and refresh its embedded copies"""
+        object_id = ObjectId(medicamento.id)
+        await MaterializedViewRepository.medicamentos_view.update_one(
+            {"_id": object_id},
+            {"$set": {"nombre": medicamento.nombre, "fabricante": medicamento.fabricante},
+             "$setOnInsert": {"compuestos": []}},
+            upsert=True,
+            session=session
+        )
+        await MaterializedViewRepository.compuestos_view.update_many(
+            {"medicamentos._id": object_id},
+            {"$set": {"medicamentos.$[m].nombre": medicamento.nombre,
+                      "medicamentos.$[m].fabricante": medicamento.fabricante}},
+            array_filters=[{"m._id": object_id}],
+            session=session
+        )
+
+    @staticmethod
+    async def save_compuesto(compuesto: Compuesto, session=None) -> None:
+        """Upsert the compuesto view document and refresh its embedded copies"""
+        object_id = ObjectId(compuesto.id)
+        await MaterializedViewRepository.compuestos_view.update_one(
+            {"_id": object_id},
+            {"$set": {"nombre": compuesto.nombre},
+             "$setOnInsert": {"medicamentos": []}},
+            upsert=True,
+            session=session
+        )
+        await MaterializedViewRepository.medicamentos_view.update_many(
+            {"compuestos._id": object_id},
+            {"$set": {"compuestos.$[c].nombre": compuesto.nombre}},
+            array_filters=[{"c._id": object_id}],
+            session=session
+        )
+
+    @staticmethod
+    async def add_relations(relations: List[Dict[str, Any]], session=None) -> None:
+        """Embed new relations in both views.
+
+        Each item carries medicamento (Medicamento), compuesto (Compuesto),
+        concentracion and unidad_medida.
+        """
+        if not relations:
+            return
+        medicamento_ops = []
+        compuesto_ops = []
+        for relation in relations:
+            medicamento = relation["medicamento"]
+            compuesto = relation["compuesto"]
+            medicamento_ops.append(UpdateOne(
+                {"_id": ObjectId(medicamento.id)},
+                {"$push": {"compuestos": {
+                    "_id": ObjectId(compuesto.id),
+                    "nombre": compuesto.nombre,
+                    "concentracion": relation["concentracion"],
+                    "unidad_medida": relation["unidad_medida"]
+                }}, "$setOnInsert": {"nombre": medicamento.nombre, "fabricante": medicamento.fabricante}},
+                upsert=True
+            ))
+            compuesto_ops.append(UpdateOne(
+                {"_id": ObjectId(compuesto.id)},
+                {"$push": {"medicamentos": {
+                    "_id": ObjectId(medicamento.id),
+                    "nombre": medicamento.nombre,
+                    "fabricante": medicamento.fabricante,
+                    "concentracion": relation["concentracion"],
+                    "unidad_medida": relation["unidad_medida"]
+                }}, "$setOnInsert": {"nombre": compuesto.nombre}},
+                upsert=True
+            ))
+        await MaterializedViewRepository.medicamentos_view.bulk_write(medicamento_ops, ordered=False, session=session)
+        await MaterializedViewRepository.compuestos_view.bulk_write(compuesto_ops, ordered=False, session=session)
+
+    @staticmethod
+    async def remove_medicamentos(medicamento_ids: List[str], session=None, pull: bool = True) -> None:
+        """Drop deleted medicamentos from both views; pull=False leaves their entries to pull_medicamentos"""
+        if not medicamento_ids:
+            return
+        object_ids = [ObjectId(id) for id in medicamento_ids]
+        await MaterializedViewRepository.medicamentos_view.delete_many(
+            {"_id": {"$in": object_ids}}, session=session
+        )
+        if pull:
+            await MaterializedViewRepository.compuestos_view.update_many(
+                {"medicamentos._id": {"$in": object_ids}},
+                {"$pull": {"medicamentos": {"_id": {"$in": object_ids}}}},
+                session=session
+            )
+
+    @staticmethod
+    async def remove_compuestos(compuesto_ids: List[str], session=None, pull: bool = True) -> None:
+        """Drop deleted compuestos from both views; pull=False leaves their entries to pull_compuestos"""
+        if not compuesto_ids:
+            return
+        object_ids = [ObjectId(id) for id in compuesto_ids]
+        await MaterializedViewRepository.compuestos_view.delete_many(
+            {"_id": {"$in": object_ids}}, session=session
+        )
+        if pull:
+            await MaterializedViewRepository.medicamentos_view.update_many(
+                {"compuestos._id": {"$in": object_ids}},
+                {"$pull": {"compuestos": {"_id": {"$in": object_ids}}}},
+                session=session
+            )
+
+    @staticmethod
+    async def pull_medicamentos(medicamento_ids: List[str], compuesto_ids: List[str], session=None) -> None:
+        """Remove medicamento entries from the given compuestos only, one batch of a deferred cascade"""
+        if not medicamento_ids or not compuesto_ids:
+            return
+        object_ids = [ObjectId(id) for id in medicamento_ids]
+        await MaterializedViewRepository.compuestos_view.update_many(
+            {"_id": {"$in": [ObjectId(id) for id in compuesto_ids]}},
+            {"$pull": {"medicamentos": {"_id": {"$in": object_ids}}}},
+            session=session
+        )
+
+    @staticmethod
+    async def pull_compuestos(compuesto_ids: List[str], medicamento_ids: List[str], session=None) -> None:
+        """Remove compuesto entries from the given medicamentos only, one batch of a deferred cascade"""
+        if not compuesto_ids or not medicamento_ids:
+            return
+        object_ids = [ObjectId(id) for id in compuesto_ids]
+        await MaterializedViewRepository.medicamentos_view.update_many(
+            {"_id": {"$in": [ObjectId(id) for id in medicamento_ids]}},
+            {"$pull": {"compuestos": {"_id": {"$in": object_ids}}}},
+            session=session
+        )
+
+    @staticmethod
+    async def rebuild() -> Dict[str, int]:
+        """Rebuild both views from the source collections"""
+        await get_collection("medicamentos").aggregate(medicamentos_view_pipeline()).to_list(length=None)
+        await get_collection("compuestos").aggregate(compuestos_view_pipeline()).to_list(length=None)
+        for name, keys in VIEW_INDEXES.items():
+            await get_collection(name).create_index(keys)
+        return {
+            MEDICAMENTOS_VIEW: await MaterializedViewRepository.medicamentos_view.estimated_document_count(),
+            COMPUESTOS_VIEW: await MaterializedViewRepository.compuestos_view.estimated_document_count()
+        }
+
+    @staticmethod
+    async def insert_medicamentos(medicamentos: List[Medicamento]) -> None:
+        """Add view documents for newly created medicamentos"""
+        if medicamentos:
+            await MaterializedViewRepository.medicamentos_view.insert_many([
+                {"_id": ObjectId(m.id), "nombre": m.nombre, "fabricante": m.fabricante, "compuestos": []}
+                for m in medicamentos
+            ], ordered=False)
+
+    @staticmethod
+    async def insert_compuestos(compuestos: List[Compuesto]) -> None:
+        """Add view documents for newly created compuestos"""
+        if compuestos:
+            await MaterializedViewRepository.compuestos_view.insert_many([
+                {"_id": ObjectId(c.id), "nombre": c.nombre, "medicamentos": []}
+                for c in compuestos
+            ], ordered=False)
@@ -0,0 +1,189 @@
+"""
+Admission control: a concurrency limit per class of route.
+
+Every route declares its class with dependencies=[admit("...")]:
+
+- point: reads of one document by id, versions and in-memory lookups
+- list: paginated lists, search and statistics
+- heavy: $lookup sub-resources and details, composition queries, exports
+  and bulk writes
+- write: single-document writes
+
+Streaming routes use admitted_stream() instead, because the cleanup of a
+dependency runs before a StreamingResponse sends its body.
+
+Each class runs at most ADMISSION_<CLASS>_LIMIT requests at once. Further
+requests wait in a FIFO queue of at most ADMISSION_<CLASS>_QUEUE entries for
+at most ADMISSION_<CLASS>_TIMEOUT_MS; past either bound they get an
+immediate 503 with Retry-After instead of piling up on the connection pool.
+Since each class has its own slots, a burst of heavy requests cannot take the
+slots of the point reads. Limits are per worker process.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict
+from fastapi import Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from app.monitoring.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED, ADMISSION_WAIT
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_CONTROL", "1").lower() not in ("0", "false", "no")
+RETRY_AFTER_SECONDS = os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1")
+
+# (concurrencia, cola, espera maxima en ms) por defecto; la suma de concurrencias cabe en el pool por defecto
+DEFAULT_LIMITS = {
+    "point": (50, 200, 500),
+    "list": (20, 50, 1000),
+    "heavy": (8, 16, 2000),
+    "write": (20, 100, 2000),
+}
+
+
+class Saturated(Exception):
+    """The class is at its limit and its queue is full, or the wait deadline passed"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdmissionLimiter:
+    """Concurrency limit with a bounded FIFO wait queue and a wait deadline"""
+
+    def __init__(self, name: str, limit: int, queue_size: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @classmethod
+    def from_env(cls, name: str) -> "AdmissionLimiter":
+        limit, queue_size, timeout_ms = DEFAULT_LIMITS[name]
+        prefix = f"ADMISSION_{name.upper()}"
+        return cls(
+            name,
+            int(os.getenv(f"{prefix}_LIMIT", str(limit))),
+            int(os.getenv(f"{prefix}_QUEUE", str(queue_size))),
+            float(os.getenv(f"{prefix}_TIMEOUT_MS", str(timeout_ms))) / 1000
+        )
+
+    def _set_queue_depth(self) -> None:
+        ADMISSION_QUEUE_DEPTH.set(self.name, value=len(self._waiters))
+
+    async def acquire(self) -> None:
+        """Take a slot, waiting in line if needed; Saturated if the queue is full or the deadline passes"""
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+            ADMISSION_IN_FLIGHT.inc(self.name)
+            ADMISSION_WAIT.observe(0, self.name)
+            return
+        if len(self._waiters) >= self.queue_size:
+            ADMISSION_REJECTED.inc(self.name, "queue_full")
+            raise Saturated("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._set_queue_depth()
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # el turno llego justo al vencer el plazo (o al cancelarse): se pasa al siguiente
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            self._set_queue_depth()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            ADMISSION_REJECTED.inc(self.name, "timeout")
+            raise Saturated("timeout") from e
+        # release() ya cuenta este turno como activo
+        ADMISSION_WAIT.observe(time.perf_counter() - started, self.name)
+
+    def release(self) -> None:
+        """Free a slot, handing it straight to the oldest waiter if there is one"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._set_queue_depth()
+                return
+        self._active -= 1
+        ADMISSION_IN_FLIGHT.dec(self.name)
+        self._set_queue_depth()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "limit": self.limit,
+            "active": self._active,
+            "queued": len(self._waiters),
+            "queue_size": self.queue_size,
+            "timeout_ms": self.timeout * 1000,
+        }
+
+
+LIMITERS: Dict[str, AdmissionLimiter] = {name: AdmissionLimiter.from_env(name) for name in DEFAULT_LIMITS}
+
+
+async def _acquire_or_503(limiter: AdmissionLimiter) -> None:
+    try:
+        await limiter.acquire()
+    except Saturated as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Too many concurrent '{limiter.name}' requests ({e.reason}); retry later",
+            headers={"Retry-After": RETRY_AFTER_SECONDS}
+        )
+
+
+def _dependency(name: str):
+    async def admission():
+        if not ADMISSION_ENABLED:
+            yield
+            return
+        limiter = LIMITERS[name]
+        await _acquire_or_503(limiter)
+        try:
+            yield
+        finally:
+            limiter.release()
+    return admission
+
+
+_DEPENDENCIES = {name: Depends(_dependency(name)) for name in LIMITERS}
+
+
+def admit(name: str):
+    """Route dependency that holds a slot of the class while the request is served"""
+    return _DEPENDENCIES[name]
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """StreamingResponse that releases an admission slot once the body is sent (or the client leaves)"""
+
+    def __init__(self, content: AsyncIterator[bytes], limiter: AdmissionLimiter, **kwargs):
+        super().__init__(content, **kwargs)
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.limiter.release()
+
+
+async def admitted_stream(name: str, content: AsyncIterator[bytes], **kwargs) -> StreamingResponse:
+    """Streaming response that holds a slot of the class until the whole body is sent; 503 if saturated"""
+    if not ADMISSION_ENABLED:
+        return StreamingResponse(content, **kwargs)
+    limiter = LIMITERS[name]
+    await _acquire_or_503(limiter)
+    return AdmittedStreamingResponse(content, limiter, **kwargs)
@@ -0,0 +1,126 @@
+"""
+In-memory prefix index over nombre for the /autocomplete routes.
+
+Names are normalized (accents removed, case folded) and kept in a sorted list,
+so a prefix lookup is a binary search plus a short scan. Local writes update
+the index in place through put() and remove(); only the first lookup waits
+for a full load. Once the index is older than AUTOCOMPLETE_TTL_SECONDS (to pick
+up writes made by other workers) it is rebuilt in a background task while
+lookups keep using the current one.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (nombre normalizado, nombre, _id): el orden de la tupla es el del indice
+Row = Tuple[str, str, str]
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip accents: 'Acetaminofén' -> 'acetaminofen'"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold().strip()
+
+
+class AutocompleteIndex:
+    """Sorted prefix index over (nombre, _id) pairs"""
+
+    def __init__(self, source: Callable[[], AsyncIterator[Tuple[str, str]]], ttl: float = None):
+        self.source = source
+        self.ttl = ttl if ttl is not None else float(os.getenv("AUTOCOMPLETE_TTL_SECONDS", "300"))
+        self._rows: List[Row] = []
+        self._by_id: Dict[str, Row] = {}
+        self._loaded_at = None
+        self._lock = asyncio.Lock()
+        self._rebuild: Optional[asyncio.Task] = None
+        # escrituras locales hechas mientras se recorre la coleccion, para aplicarlas al indice nuevo
+        self._pending: Optional[List[Tuple[str, Optional[str]]]] = None
+
+    def _apply(self, id: str, nombre: Optional[str]) -> None:
+        row = (normalize(nombre), nombre, id) if nombre is not None else None
+        old = self._by_id.get(id)
+        if old == row:
+            return
+        if old is not None:
+            index = bisect_left(self._rows, old)
+            if index < len(self._rows) and self._rows[index] == old:
+                del self._rows[index]
+            del self._by_id[id]
+        if row is not None:
+            insort(self._rows, row)
+            self._by_id[id] = row
+
+    def _write(self, id: str, nombre: Optional[str]) -> None:
+        if self._pending is not None:
+            self._pending.append((id, nombre))
+        # antes de la primera carga no hay nada que actualizar: la carga ya vera la escritura
+        if self._loaded_at is not None:
+            self._apply(id, nombre)
+
+    def put(self, id: str, nombre: str) -> None:
+        """Add a created document or move a renamed one"""
+        self._write(id, nombre)
+
+    def remove(self, ids: Iterable[str]) -> None:
+        """Drop deleted documents"""
+        for id in ids:
+            self._write(id, None)
+
+    async def _load(self) -> None:
+        self._pending = []
+        try:
+            rows = []
+            async for id, nombre in self.source():
+                rows.append((normalize(nombre), nombre, id))
+            rows.sort()
+            pending = self._pending
+            # las busquedas son sincronas: nunca ven el cambio de listas a medias
+            self._rows, self._by_id = rows, {row[2]: row for row in rows}
+            for id, nombre in pending:
+                self._apply(id, nombre)
+            self._loaded_at = time.monotonic()
+        finally:
+            self._pending = None
+
+    async def refresh(self) -> None:
+        """Load the index now; lookups call this only for the first load"""
+        async with self._lock:
+            await self._load()
+
+    def _schedule_rebuild(self) -> None:
+        if self._rebuild is None or self._rebuild.done():
+            self._rebuild = asyncio.create_task(self._background_rebuild())
+
+    async def _background_rebuild(self) -> None:
+        try:
+            await self.refresh()
+        except Exception:
+            # se sigue sirviendo el indice anterior; se reintenta en la siguiente busqueda
+            logger.exception("Could not rebuild the autocomplete index")
+
+    async def suggest(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Entries whose normalized nombre starts with the normalized prefix"""
+        if self._loaded_at is None:
+            async with self._lock:
+                if self._loaded_at is None:
+                    await self._load()
+        elif time.monotonic() - self._loaded_at > self.ttl:
+            self._schedule_rebuild()
+        key = normalize(prefix)
+        rows = self._rows
+        # (key,) queda antes de toda fila cuyo nombre normalizado empieza por key
+        start = bisect_left(rows, (key,))
+        results = []
+        for index in range(start, min(start + limit, len(rows))):
+            normalized, nombre, id = rows[index]
+            if not normalized.startswith(key):
+                break
+            results.append({"_id": id, "nombre": nombre})
+        return results
@@ -0,0 +1,142 @@
+"""
+In-memory compuesto -> medicamentos posting lists for composition queries.
+
+Opt-in through COMPOSITION_INDEX=1. With it, "which medicamentos contain all (or
+any) of these compuestos" is a set intersection (or union) in memory instead of
+an aggregation over compuestos_por_medicamento. Like the autocomplete index,
+local writes update the posting sets of the changed pairs in place, and once
+the index is older than COMPOSITION_INDEX_TTL_SECONDS it is rebuilt in a
+background task while queries keep using the current one.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (compuesto_id, medicamento_id)
+Pair = Tuple[str, str]
+
+
+def composition_index_enabled() -> bool:
+    return os.getenv("COMPOSITION_INDEX", "0").lower() in ("1", "true", "yes")
+
+
+class CompositionIndex:
+    """Posting lists keyed by compuesto id"""
+
+    def __init__(self, source: Callable[[], AsyncIterator[Pair]], ttl: float = None):
+        self.source = source
+        self.ttl = ttl if ttl is not None else float(os.getenv("COMPOSITION_INDEX_TTL_SECONDS", "300"))
+        self._postings: Dict[str, Set[str]] = {}
+        # lado inverso, para quitar un medicamento borrado sin recorrer todas las listas
+        self._by_medicamento: Dict[str, Set[str]] = {}
+        self._loaded_at = None
+        self._lock = asyncio.Lock()
+        self._rebuild: Optional[asyncio.Task] = None
+        # escrituras locales hechas mientras se recorre la coleccion, para aplicarlas al indice nuevo
+        self._pending: Optional[List[Tuple[str, list]]] = None
+
+    def _add(self, pairs: List[Pair]) -> None:
+        for compuesto_id, medicamento_id in pairs:
+            self._postings.setdefault(compuesto_id, set()).add(medicamento_id)
+            self._by_medicamento.setdefault(medicamento_id, set()).add(compuesto_id)
+
+    def _remove(self, pairs: List[Pair]) -> None:
+        for compuesto_id, medicamento_id in pairs:
+            for index, key, value in (
+                (self._postings, compuesto_id, medicamento_id),
+                (self._by_medicamento, medicamento_id, compuesto_id),
+            ):
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(value)
+                    if not ids:
+                        del index[key]
+
+    def _remove_compuestos(self, compuesto_ids: List[str]) -> None:
+        self._remove([(id, medicamento_id) for id in compuesto_ids for medicamento_id in self._postings.get(id, ())])
+
+    def _remove_medicamentos(self, medicamento_ids: List[str]) -> None:
+        self._remove([(compuesto_id, id) for id in medicamento_ids for compuesto_id in self._by_medicamento.get(id, ())])
+
+    def _write(self, operation: str, items: Iterable) -> None:
+        items = list(items)
+        if self._pending is not None:
+            self._pending.append((operation, items))
+        # antes de la primera carga no hay nada que actualizar: la carga ya vera la escritura
+        if self._loaded_at is not None:
+            getattr(self, operation)(items)
+
+    def add(self, pairs: Iterable[Pair]) -> None:
+        """Record created relations"""
+        self._write("_add", pairs)
+
+    def remove(self, pairs: Iterable[Pair]) -> None:
+        """Forget deleted relations"""
+        self._write("_remove", pairs)
+
+    def remove_compuestos(self, compuesto_ids: Iterable[str]) -> None:
+        """Forget every relation of deleted compuestos"""
+        self._write("_remove_compuestos", compuesto_ids)
+
+    def remove_medicamentos(self, medicamento_ids: Iterable[str]) -> None:
+        """Forget every relation of deleted medicamentos"""
+        self._write("_remove_medicamentos", medicamento_ids)
+
+    async def _load(self) -> None:
+        self._pending = []
+        try:
+            pairs = [pair async for pair in self.source()]
+            pending = self._pending
+            # las consultas son sincronas: nunca ven el cambio de diccionarios a medias
+            self._postings, self._by_medicamento = {}, {}
+            self._add(pairs)
+            for operation, items in pending:
+                getattr(self, operation)(items)
+            self._loaded_at = time.monotonic()
+        finally:
+            self._pending = None
+
+    async def refresh(self) -> None:
+        """Load the index now; queries call this only for the first load"""
+        async with self._lock:
+            await self._load()
+
+    def _schedule_rebuild(self) -> None:
+        if self._rebuild is None or self._rebuild.done():
+            self._rebuild = asyncio.create_task(self._background_rebuild())
+
+    async def _background_rebuild(self) -> None:
+        try:
+            await self.refresh()
+        except Exception:
+            # se sigue sirviendo el indice anterior; se reintenta en la siguiente consulta
+            logger.exception("Could not rebuild the composition index")
+
+    async def find(self, compuesto_ids: List[str], match_all: bool = True) -> List[str]:
+        """Sorted ids of the medicamentos containing all (or any) of the compuestos"""
+        if self._loaded_at is None:
+            async with self._lock:
+                if self._loaded_at is None:
+                    await self._load()
+        elif time.monotonic() - self._loaded_at > self.ttl:
+            self._schedule_rebuild()
+        postings = self._postings
+        lists = [postings.get(id, set()) for id in dict.fromkeys(compuesto_ids)]
+        if not lists:
+            return []
+        if match_all:
+            # intersectar desde la lista mas corta reduce el trabajo
+            lists.sort(key=len)
+            result = set(lists[0])
+            for ids in lists[1:]:
+                result.intersection_update(ids)
+                if not result:
+                    break
+        else:
+            result = set().union(*lists)
+        return sorted(result)
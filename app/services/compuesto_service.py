@@ -1,21 +1,115 @@
-from typing import List, Optional, Dict, Any
+import orjson
+from typing import AsyncIterator, List, Optional, Dict, Any, Union
 from fastapi import HTTPException, status
+from app.db.mongo import run_in_transaction
 from app.models.compuesto import Compuesto
 from app.repositories.compuesto_repo import CompuestoRepository
+from app.repositories.ids import normalize_id
+from app.repositories.medicamentos_repo import MedicamentoRepository
 from app.repositories.compuesto_por_medicamento_repo import CompuestoPorMedicamentoRepository
+from app.repositories.stats_repo import StatsRepository
+from app.repositories.views_repo import MaterializedViewRepository
+from app.repositories.versioning import DocumentVersion, version_of
+from app.services.autocomplete import AutocompleteIndex
+from app.services.medicamento_service import MedicamentoService
+from app.services.conditional import make_etag, require_match
+from app.services.job_service import JobService
+from app.services.params import parse_fields_or_400
+from app.services.patch import merge_patch_changes
+from app.services.stats_service import StatsService
+
+BULK_MAX_ITEMS = 10000
+MAX_IDS_PER_REQUEST = 1000
+SUB_RESOURCE_FIELDS = ("nombre", "fabricante", "concentracion", "unidad_medida")
+# campos de un compuesto que muestran las sub-rutas y el detalle de sus medicamentos
+RELATED_FIELDS = ("nombre",)
+# lecturas y escrituras condicionales antes de responder 409 a un PATCH en disputa
+PATCH_MAX_ATTEMPTS = 3
 
 class CompuestoService:
     """Service class for Compuesto business logic"""
     
+    # indice de prefijos en memoria para /autocomplete
+    autocomplete = AutocompleteIndex(CompuestoRepository.iter_names)
+    
+    @staticmethod
+    async def get_all_compuestos(
+        limit: int,
+        after: Optional[str] = None,
+        sort: str = "_id",
+        ids: Optional[List[str]] = None,
+        fields: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get a page of compuestos with keyset pagination, or the requested ids in one query"""
+        field_list = parse_fields_or_400(fields, CompuestoRepository.FIELDS)
+        if ids:
+            if len(ids) > MAX_IDS_PER_REQUEST:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"At most {MAX_IDS_PER_REQUEST} ids per request"
+                )
+            items = await CompuestoRepository.get_many(ids)
+            include = None if field_list is None else {"id", *field_list}
+            return {"items": [item.model_dump(by_alias=True, include=include) for item in items], "next_cursor": None}
+        
+        try:
+            items, next_cursor = await CompuestoRepository.get_page(limit, after, sort, field_list)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        return {"items": items, "next_cursor": next_cursor}
+    
+    @staticmethod
+    async def export_compuestos(batch_size: int) -> AsyncIterator[bytes]:
+        """Stream every compuesto as NDJSON, one line per document"""
+        async for document in CompuestoRepository.iter_documents(batch_size):
+            yield orjson.dumps(document) + b"\n"
+    
+    @staticmethod
+    async def search_compuestos(q: str, limit: int) -> List[Dict[str, Any]]:
+        """Search compuestos by nombre, ignoring case and accents"""
+        if not q or q.strip() == "":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Search query cannot be empty"
+            )
+        return await CompuestoRepository.search(q.strip(), limit)
+    
+    @staticmethod
+    async def autocomplete_compuestos(q: str, limit: int) -> List[Dict[str, Any]]:
+        """Suggest compuestos whose nombre starts with q, served from memory"""
+        return await CompuestoService.autocomplete.suggest(q, limit)
+    
+    @staticmethod
+    async def get_compuesto_version(compuesto_id: str, fresh: bool = False) -> DocumentVersion:
+        """Current version of a compuesto (cached unless fresh), 404 if it does not exist"""
+        version = await CompuestoRepository.get_version(compuesto_id, fresh)
+        if version is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Compuesto with ID {compuesto_id} not found"
+            )
+        return version
+    
     @staticmethod
-    async def get_all_compuestos() -> List[Compuesto]:
-        """Get all compuestos"""
-        return await CompuestoRepository.get_all()
+    async def _expected_version(compuesto_id: str, if_match: Optional[str]) -> Optional[int]:
+        """Version an If-Match header pins a write to (412 if it is stale); None without the header"""
+        if if_match is None:
+            return None
+        current = await CompuestoService.get_compuesto_version(compuesto_id, fresh=True)
+        require_match(if_match, make_etag(compuesto_id, current))
+        return current.version
     
     @staticmethod
-    async def get_compuesto_by_id(compuesto_id: str) -> Compuesto:
-        """Get a compuesto by ID with validation"""
-        compuesto = await CompuestoRepository.get_by_id(compuesto_id)
+    async def get_compuesto_by_id(compuesto_id: str, fields: Optional[str] = None) -> Union[Compuesto, Dict[str, Any]]:
+        """Get a compuesto by ID with validation; with fields only those are returned"""
+        field_list = parse_fields_or_400(fields, CompuestoRepository.FIELDS)
+        if field_list is None:
+            compuesto = await CompuestoRepository.get_by_id(compuesto_id)
+        else:
+            compuesto = await CompuestoRepository.get_partial(compuesto_id, field_list)
         if not compuesto:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -32,51 +126,253 @@ class CompuestoService:
                 detail="Compuesto name cannot be empty"
             )
         
-        return await CompuestoRepository.create(compuesto)
+        created_compuesto = await CompuestoRepository.create(compuesto)
+        if MaterializedViewRepository.enabled:
+            await MaterializedViewRepository.save_compuesto(created_compuesto)
+        await StatsService.record(StatsService.compuesto_deltas(1))
+        CompuestoService.autocomplete.put(created_compuesto.id, created_compuesto.nombre)
+        return created_compuesto
     
     @staticmethod
-    async def update_compuesto(compuesto_id: str, compuesto: Compuesto) -> Compuesto:
-        """Update an existing compuesto with validation"""
-        existing_compuesto = await CompuestoRepository.get_by_id(compuesto_id)
-        if not existing_compuesto:
+    async def create_compuestos(compuestos: List[Compuesto]) -> List[Dict[str, Any]]:
+        """Create several compuestos in one write, validating each item"""
+        if len(compuestos) > BULK_MAX_ITEMS:
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Compuesto with ID {compuesto_id} not found"
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At most {BULK_MAX_ITEMS} items per request"
             )
         
+        results = [None] * len(compuestos)
+        valid_indexes = []
+        for index, compuesto in enumerate(compuestos):
+            if not compuesto.nombre or compuesto.nombre.strip() == "":
+                results[index] = {"index": index, "status": "error", "error": "Compuesto name cannot be empty"}
+            else:
+                valid_indexes.append(index)
+        
+        created = await CompuestoRepository.create_many([compuestos[i] for i in valid_indexes])
+        created_compuestos = []
+        for index, result in zip(valid_indexes, created):
+            result["index"] = index
+            results[index] = result
+            if result["status"] == "created":
+                created_compuestos.append(compuestos[index].model_copy(update={"id": result["id"]}))
+        
+        if MaterializedViewRepository.enabled:
+            await MaterializedViewRepository.insert_compuestos(created_compuestos)
+        await StatsService.record(StatsService.compuesto_deltas(len(created_compuestos)))
+        for created in created_compuestos:
+            CompuestoService.autocomplete.put(created.id, created.nombre)
+        return results
+    
+    @staticmethod
+    async def update_compuesto(compuesto_id: str, compuesto: Compuesto, if_match: Optional[str] = None) -> Compuesto:
+        """Update an existing compuesto with validation; If-Match makes it conditional on the ETag"""
         if not compuesto.nombre or compuesto.nombre.strip() == "":
+            # un id inexistente es 404 antes que 400; la lectura solo se hace si el cuerpo no es valido
+            await CompuestoService.get_compuesto_version(compuesto_id)
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Compuesto name cannot be empty"
             )
         
-        return await CompuestoRepository.update(compuesto_id, compuesto)
-    
-    @staticmethod
-    async def delete_compuesto(compuesto_id: str) -> Dict[str, Any]:
-        """Delete a compuesto with validation and cascade deletion"""
-        existing_compuesto = await CompuestoRepository.get_by_id(compuesto_id)
-        if not existing_compuesto:
+        expected_version = await CompuestoService._expected_version(compuesto_id, if_match)
+        result = await CompuestoRepository.update(compuesto_id, compuesto, expected_version)
+        if not result:
+            if expected_version is not None:
+                # existia al validar el If-Match: otra escritura cambio la version entre medias
+                raise HTTPException(
+                    status_code=status.HTTP_412_PRECONDITION_FAILED,
+                    detail="Resource was modified; fetch it again to get the current ETag"
+                )
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Compuesto with ID {compuesto_id} not found"
             )
+        previous, updated_compuesto = result
+        if MaterializedViewRepository.enabled:
+            await MaterializedViewRepository.save_compuesto(updated_compuesto)
+        if any(getattr(previous, field) != getattr(updated_compuesto, field) for field in RELATED_FIELDS):
+            await MedicamentoService.touch_related("compuesto_id", compuesto_id, updated_compuesto.updated_at)
+        CompuestoService.autocomplete.put(updated_compuesto.id, updated_compuesto.nombre)
+        return updated_compuesto
+    
+    @staticmethod
+    async def patch_compuesto(compuesto_id: str, patch: Dict[str, Any], if_match: Optional[str] = None) -> Compuesto:
+        """Apply a JSON Merge Patch that writes only the fields it changes; If-Match makes it conditional on the ETag"""
+        for attempt in range(PATCH_MAX_ATTEMPTS):
+            # primer intento con la copia en cache; con If-Match o tras un conflicto, desde el primario
+            if attempt > 0 or if_match is not None:
+                current = await CompuestoRepository.get_fresh(compuesto_id)
+            else:
+                current = await CompuestoRepository.get_by_id(compuesto_id)
+            if not current:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Compuesto with ID {compuesto_id} not found"
+                )
+            if if_match is not None:
+                require_match(if_match, make_etag(compuesto_id, version_of(current)))
+            
+            try:
+                changes = merge_patch_changes(current, patch, CompuestoRepository.FIELDS)
+            except ValueError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=str(e)
+                )
+            if "nombre" in changes and changes["nombre"].strip() == "":
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Compuesto name cannot be empty"
+                )
+            if not changes:
+                # nada cambia: no se escribe (ni oplog ni replicacion)
+                return current
+            
+            patched = await CompuestoRepository.patch(compuesto_id, changes, current.version or 0)
+            if patched:
+                break
+            if if_match is not None:
+                raise HTTPException(
+                    status_code=status.HTTP_412_PRECONDITION_FAILED,
+                    detail="Resource was modified; fetch it again to get the current ETag"
+                )
+            # otra escritura cambio la version entre la lectura y el patch: se recalcula el diff
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Compuesto with ID {compuesto_id} is being modified concurrently; retry the patch"
+            )
+        
+        if MaterializedViewRepository.enabled:
+            await MaterializedViewRepository.save_compuesto(patched)
+        if any(field in changes for field in RELATED_FIELDS):
+            await MedicamentoService.touch_related("compuesto_id", compuesto_id, patched.updated_at)
+        if "nombre" in changes:
+            CompuestoService.autocomplete.put(patched.id, patched.nombre)
+        return patched
+    
+    @staticmethod
+    async def delete_compuesto(compuesto_id: str, if_match: Optional[str] = None) -> Dict[str, Any]:
+        """Delete a compuesto and its relations atomically in one transaction; If-Match makes it conditional.
+
+        A compuesto with more relations than JobService.cascade_threshold is
+        deleted right away and its relations by a background job.
+        """
+        expected_version = await CompuestoService._expected_version(compuesto_id, if_match)
+        deferred_total = await JobService.cascade_size("compuesto_id", [compuesto_id])
+        
+        async def cascade(session) -> Dict[str, Any]:
+            # borrar el compuesto; si no existia no hay nada que borrar en cascada
+            deleted = await CompuestoRepository.delete(compuesto_id, session=session, expected_version=expected_version)
+            if not deleted:
+                if expected_version is not None:
+                    raise HTTPException(
+                        status_code=status.HTTP_412_PRECONDITION_FAILED,
+                        detail="Resource was modified; fetch it again to get the current ETag"
+                    )
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Compuesto with ID {compuesto_id} not found"
+                )
+            
+            if deferred_total is not None:
+                # las relaciones se borran por lotes en segundo plano (delete_relations_step)
+                if MaterializedViewRepository.enabled:
+                    await MaterializedViewRepository.remove_compuestos([compuesto_id], session=session, pull=False)
+                await StatsService.record(StatsService.compuesto_deltas(1, -1), session=session)
+                return {
+                    "deleted": deleted,
+                    "id": compuesto_id,
+                    "job": await JobService.enqueue_cascade("compuesto_id", [compuesto_id], deferred_total, session=session)
+                }
+            
+            # borrar las relaciones en la misma transaccion
+            related_ids = await CompuestoPorMedicamentoRepository.medicamento_ids_for([compuesto_id], session=session)
+            if StatsRepository.enabled:
+                relations = await CompuestoPorMedicamentoRepository.summarize("compuesto_id", [compuesto_id], session=session)
+            deleted_relations = await CompuestoPorMedicamentoRepository.delete_by_compuesto_id(compuesto_id, session=session)
+            await MedicamentoRepository.touch(related_ids, session=session)
+            if MaterializedViewRepository.enabled:
+                await MaterializedViewRepository.remove_compuestos([compuesto_id], session=session)
+            if StatsRepository.enabled:
+                deltas = StatsService.compuesto_deltas(1, -1)
+                deltas.update(StatsService.relation_deltas(relations, -1))
+                await StatsService.record(deltas, session=session)
+            
+            return {
+                "deleted": deleted,
+                "id": compuesto_id,
+                "related_records_deleted": deleted_relations
+            }
         
-        # borrrar las relaciones con medicamentos
-        deleted_relations = await CompuestoPorMedicamentoRepository.delete_by_compuesto_id(compuesto_id)
+        result = await run_in_transaction(cascade)
+        if "job" in result:
+            JobService.notify()
+        # los indices en memoria usan el id en su forma canonica
+        CompuestoService.autocomplete.remove([normalize_id(compuesto_id)])
+        if MedicamentoService.composition is not None:
+            MedicamentoService.composition.remove_compuestos([normalize_id(compuesto_id)])
+        return result
+    
+    @staticmethod
+    async def delete_compuestos(compuesto_ids: List[str]) -> Dict[str, Any]:
+        """Delete several compuestos and their relations with one $in per collection; large cascades become a job"""
+        deferred_total = await JobService.cascade_size("compuesto_id", compuesto_ids)
         
-        # borrar el compuesto
-        result = await CompuestoRepository.delete(compuesto_id)
+        async def cascade(session) -> Dict[str, Any]:
+            deleted_ids = await CompuestoRepository.delete_many(compuesto_ids, session=session)
+            found = set(deleted_ids)
+            if deferred_total is not None and deleted_ids:
+                # las relaciones se borran por lotes en segundo plano (delete_relations_step)
+                if MaterializedViewRepository.enabled:
+                    await MaterializedViewRepository.remove_compuestos(deleted_ids, session=session, pull=False)
+                await StatsService.record(StatsService.compuesto_deltas(len(deleted_ids), -1), session=session)
+                return {
+                    "deleted": deleted_ids,
+                    "not_found": [id for id in compuesto_ids if id not in found],
+                    "job": await JobService.enqueue_cascade("compuesto_id", deleted_ids, deferred_total, session=session)
+                }
+            related_ids = await CompuestoPorMedicamentoRepository.medicamento_ids_for(deleted_ids, session=session)
+            if StatsRepository.enabled:
+                relations = await CompuestoPorMedicamentoRepository.summarize("compuesto_id", deleted_ids, session=session)
+            deleted_relations = await CompuestoPorMedicamentoRepository.delete_by_compuesto_ids(deleted_ids, session=session)
+            await MedicamentoRepository.touch(related_ids, session=session)
+            if MaterializedViewRepository.enabled:
+                await MaterializedViewRepository.remove_compuestos(deleted_ids, session=session)
+            if StatsRepository.enabled:
+                deltas = StatsService.compuesto_deltas(len(deleted_ids), -1)
+                deltas.update(StatsService.relation_deltas(relations, -1))
+                await StatsService.record(deltas, session=session)
+            return {
+                "deleted": deleted_ids,
+                "not_found": [id for id in compuesto_ids if id not in found],
+                "related_records_deleted": deleted_relations
+            }
         
-        return {
-            "deleted": result,
-            "id": compuesto_id,
-            "related_records_deleted": deleted_relations
-        }
+        result = await run_in_transaction(cascade)
+        if "job" in result:
+            JobService.notify()
+        CompuestoService.autocomplete.remove(result["deleted"])
+        if MedicamentoService.composition is not None:
+            MedicamentoService.composition.remove_compuestos(result["deleted"])
+        return result
     
     @staticmethod
-    async def get_medicamentos_by_compuesto(compuesto_id: str) -> List[Dict[str, Any]]:
+    async def get_medicamentos_by_compuesto(compuesto_id: str, fields: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get all medicamentos that contain this compuesto"""
+        field_list = parse_fields_or_400(fields, SUB_RESOURCE_FIELDS)
+        if MaterializedViewRepository.enabled:
+            # una sola lectura indexada sobre la vista materializada
+            medicamentos = await MaterializedViewRepository.get_medicamentos(compuesto_id, field_list)
+            if medicamentos is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Compuesto with ID {compuesto_id} not found"
+                )
+            return medicamentos
+        
         # verificar que el compuesto existe
         existing_compuesto = await CompuestoRepository.get_by_id(compuesto_id)
         if not existing_compuesto:
@@ -85,4 +381,4 @@ class CompuestoService:
                 detail=f"Compuesto with ID {compuesto_id} not found"
             )
         
-        return await CompuestoRepository.get_medicamentos_by_compuesto_id(compuesto_id)
\ No newline at end of file
+        return await CompuestoRepository.get_medicamentos_by_compuesto_id(compuesto_id, field_list)
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""
+ETag / Last-Modified helpers for conditional requests.
+
+ETags are built from the document id and version, so deciding a 304 or a 412
+needs only the version, never the response body. Sub-resources and partial
+responses add a variant ("compuestos", "fields=nombre") because each is a
+different representation of the same version.
+"""
+
+from datetime import timezone
+from email.utils import format_datetime
+from typing import Any, Dict, Optional
+from fastapi import HTTPException, Response, status
+from app.repositories.versioning import DocumentVersion, version_of
+
+def make_etag(id: str, version: DocumentVersion, variant: Optional[str] = None) -> str:
+    tag = f"{id}-{version.version}"
+    if variant:
+        # las ETags no admiten espacios
+        tag = f"{tag}-{''.join(variant.split())}"
+    return f'"{tag}"'
+
+
+def validator_headers(etag: str, version: DocumentVersion) -> Dict[str, str]:
+    """ETag and, when known, Last-Modified response headers"""
+    headers = {"ETag": etag}
+    if version.updated_at is not None:
+        updated_at = version.updated_at
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        headers["Last-Modified"] = format_datetime(updated_at, usegmt=True)
+    return headers
+
+
+def document_headers(id: str, document: Any) -> Dict[str, str]:
+    """Validators for a model or raw document that carries its own version"""
+    version = version_of(document)
+    return validator_headers(make_etag(id, version), version)
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match / If-Match header lists the ETag (weak comparison) or is '*'"""
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    """Empty 304 response carrying the validators"""
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+
+def require_match(if_match: str, etag: str) -> None:
+    """Raise 412 when an If-Match header does not list the current ETag"""
+    if not etag_matches(if_match, etag):
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail="Resource was modified; fetch it again to get the current ETag"
+        )
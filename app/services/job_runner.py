@@ -0,0 +1,137 @@
+"""
+Worker loop that runs the jobs queued in the jobs collection.
+
+A job type is a step function step(params, limit, session) -> int that
+processes at most limit items and returns how many it processed; 0 means
+the job is done. Each step runs in its own transaction together with the
+job's progress update, so a job interrupted at any point resumes from the
+last committed batch: steps select what is left to do from the database
+instead of keeping an offset. Between batches the runner pauses to leave
+room for the request traffic on the primary.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+from app.db.mongo import run_in_transaction
+from app.repositories.jobs_repo import JobRepository
+
+logger = logging.getLogger(__name__)
+
+Step = Callable[[Dict[str, Any], int, Any], Awaitable[int]]
+
+
+class JobRunner:
+    """Claims jobs one at a time and runs them in throttled batches"""
+
+    def __init__(
+        self,
+        steps: Mapping[str, Step],
+        batch_size: int = None,
+        batch_pause: float = None,
+        poll_seconds: float = None,
+        lease_seconds: float = None,
+        max_attempts: int = None
+    ):
+        self.steps = steps
+        self.batch_size = batch_size if batch_size is not None else int(os.getenv("JOBS_BATCH_SIZE", "500"))
+        self.batch_pause = batch_pause if batch_pause is not None else float(os.getenv("JOBS_BATCH_PAUSE_MS", "100")) / 1000
+        # otro worker (o este mismo tras reiniciar) retoma un trabajo cuyo lease vencio
+        self.poll_seconds = poll_seconds if poll_seconds is not None else float(os.getenv("JOBS_POLL_SECONDS", "5"))
+        self.lease_seconds = lease_seconds if lease_seconds is not None else float(os.getenv("JOBS_LEASE_SECONDS", "60"))
+        self.max_attempts = max_attempts if max_attempts is not None else int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._current: Optional[ObjectId] = None
+        self.completed = 0
+        self.failed = 0
+        self.batches = 0
+
+    def notify(self) -> None:
+        """A job was queued by this worker: claim it now instead of at the next poll"""
+        self._wake.set()
+
+    async def _batch(self, job: Dict[str, Any], step: Step, session) -> int:
+        processed = await step(job["params"], self.batch_size, session)
+        if processed:
+            await JobRepository.progress(job["_id"], processed, self.lease_seconds, session=session)
+        return processed
+
+    async def _process(self, job: Dict[str, Any]) -> None:
+        step = self.steps.get(job["tipo"])
+        if step is None:
+            await JobRepository.release(job["_id"], f"Unknown job type {job['tipo']}", failed=True)
+            self.failed += 1
+            return
+        self._current = job["_id"]
+        try:
+            while await run_in_transaction(functools.partial(self._batch, job, step)):
+                self.batches += 1
+                await asyncio.sleep(self.batch_pause)
+            await JobRepository.finish(job["_id"])
+            self.completed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # los pasos son idempotentes: reintentar continua desde el ultimo lote confirmado
+            failed = job["attempts"] >= self.max_attempts
+            logger.exception("Job %s (%s) failed on attempt %d", job["_id"], job["tipo"], job["attempts"])
+            await JobRepository.release(job["_id"], str(e), failed=failed)
+            if failed:
+                self.failed += 1
+            else:
+                await asyncio.sleep(self.poll_seconds)
+        finally:
+            self._current = None
+
+    async def _run(self) -> None:
+        while True:
+            # se limpia antes de buscar: un notify durante la busqueda no se pierde
+            self._wake.clear()
+            try:
+                job = await JobRepository.claim(self.lease_seconds)
+            except PyMongoError as e:
+                logger.warning("Could not claim a job, retrying: %s", e)
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._process(job)
+
+    async def start(self) -> None:
+        """Start claiming jobs, including those left unfinished by a previous run"""
+        await JobRepository.ensure_indexes()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            current = self._current
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            if current is not None:
+                # el lote en curso se aborto con su transaccion; otro worker puede retomarlo ya
+                try:
+                    await JobRepository.release(current)
+                except PyMongoError as e:
+                    logger.warning("Could not release job %s, it resumes when its lease expires: %s", current, e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None,
+            "current": str(self._current) if self._current is not None else None,
+            "completed": self.completed,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
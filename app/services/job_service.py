@@ -0,0 +1,101 @@
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from fastapi import HTTPException, status
+from fastapi.responses import ORJSONResponse
+from app.db.jobs import jobs_enabled
+from app.repositories.compuesto_por_medicamento_repo import CompuestoPorMedicamentoRepository
+from app.repositories.jobs_repo import JobRepository
+from app.services.job_runner import JobRunner, Step
+
+class JobService:
+    """Service class for background jobs: queueing, progress and the worker of this process"""
+
+    enabled = jobs_enabled()
+    # una cascada con mas relaciones que esto se borra en segundo plano
+    cascade_threshold = int(os.getenv("JOBS_CASCADE_THRESHOLD", "1000"))
+    # pasos por tipo de trabajo, registrados con JobService.step
+    steps: Dict[str, Step] = {}
+    runner = JobRunner(steps) if enabled else None
+
+    @staticmethod
+    def step(tipo: str):
+        """Register the decorated function as the step of a job type"""
+        def register(function: Step) -> Step:
+            JobService.steps[tipo] = function
+            return function
+        return register
+
+    @staticmethod
+    async def cascade_size(field: str, ids: List[str]) -> Optional[int]:
+        """Relations a cascade over ids would delete if that is too many to do inline, else None"""
+        if not JobService.enabled:
+            return None
+        total = await CompuestoPorMedicamentoRepository.count_by(field, ids)
+        return total if total > JobService.cascade_threshold else None
+
+    @staticmethod
+    async def enqueue_cascade(field: str, ids: List[str], total: int, session=None) -> Dict[str, Any]:
+        """Queue the deletion of the relations whose field is in ids, in the transaction that deleted their parents"""
+        job = await JobRepository.create("delete_relations", {"field": field, "ids": ids}, total, session=session)
+        return JobService.describe(job)
+
+    @staticmethod
+    async def enqueue_touch(field: str, ids: List[str], since: datetime, total: int) -> Dict[str, Any]:
+        """Queue the version bump of the documents related through field to ids that were not written since"""
+        job = await JobRepository.create("touch_related", {"field": field, "ids": ids, "since": since}, total)
+        return JobService.describe(job)
+
+    @staticmethod
+    def notify() -> None:
+        """Wake the local worker after the transaction that queued a job committed"""
+        if JobService.runner is not None:
+            JobService.runner.notify()
+
+    @staticmethod
+    def describe(job: Dict[str, Any]) -> Dict[str, Any]:
+        """Public representation of a job with its progress"""
+        total = job["total"]
+        if job["status"] == "done":
+            percent = 100.0
+        else:
+            # total es una estimacion hecha al encolar
+            percent = round(min(job["processed"] / total, 1) * 100, 1) if total else 0.0
+        return {
+            "id": str(job["_id"]),
+            "tipo": job["tipo"],
+            "status": job["status"],
+            "processed": job["processed"],
+            "total": total,
+            "percent": percent,
+            "attempts": job["attempts"],
+            "error": job["error"],
+            "created_at": job["created_at"],
+            "started_at": job.get("started_at"),
+            "updated_at": job["updated_at"],
+            "finished_at": job["finished_at"],
+        }
+
+    @staticmethod
+    def accepted(result: Dict[str, Any]) -> ORJSONResponse:
+        """202 response for a write whose cascade was queued, pointing to the job"""
+        return ORJSONResponse(
+            result,
+            status_code=status.HTTP_202_ACCEPTED,
+            headers={"Location": f"/api/jobs/{result['job']['id']}"}
+        )
+
+    @staticmethod
+    async def get_job(job_id: str) -> Dict[str, Any]:
+        job = await JobRepository.get_by_id(job_id)
+        if not job:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Job with ID {job_id} not found"
+            )
+        return JobService.describe(job)
+
+    @staticmethod
+    async def list_jobs(job_status: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        """Latest jobs first"""
+        return [JobService.describe(job) for job in await JobRepository.get_recent(job_status, limit)]
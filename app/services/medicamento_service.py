@@ -1,23 +1,163 @@
-from typing import List, Optional, Dict, Any
+import orjson
+from collections import Counter
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Dict, Any, Union
 from fastapi import HTTPException, status
+from pymongo.errors import DuplicateKeyError
+from app.db.mongo import run_in_transaction
 from app.models.medicamento import Medicamento
 from app.models.compuesto_med import CompuestoPorMedicamento
+from app.models.medicamento_detalle import MedicamentoDetalle
 from app.repositories.medicamentos_repo import MedicamentoRepository
 from app.repositories.compuesto_por_medicamento_repo import CompuestoPorMedicamentoRepository
 from app.repositories.compuesto_repo import CompuestoRepository
+from app.repositories.stats_repo import StatsRepository
+from app.repositories.views_repo import MaterializedViewRepository
+from app.repositories.ids import normalize_id, parse_object_ids
+from app.repositories.versioning import DocumentVersion, version_of
+from app.services.autocomplete import AutocompleteIndex
+from app.services.composition import CompositionIndex, composition_index_enabled
+from app.services.conditional import make_etag, require_match
+from app.services.job_service import JobService
+from app.services.params import parse_fields_or_400
+from app.services.patch import merge_patch_changes
+from app.services.stats_service import StatsService
+
+BULK_MAX_ITEMS = 10000
+MAX_IDS_PER_REQUEST = 1000
+SUB_RESOURCE_FIELDS = ("nombre", "concentracion", "unidad_medida")
+# campos de un medicamento que muestran las sub-rutas de sus compuestos
+RELATED_FIELDS = ("nombre", "fabricante")
+# lecturas y escrituras condicionales antes de responder 409 a un PATCH en disputa
+PATCH_MAX_ATTEMPTS = 3
 
 class MedicamentoService:
     """Service class for Medicamento business logic"""
     
+    # indice de prefijos en memoria para /autocomplete
+    autocomplete = AutocompleteIndex(MedicamentoRepository.iter_names)
+    # listas compuesto -> medicamentos en memoria para las consultas de composicion (opcional)
+    composition = CompositionIndex(CompuestoPorMedicamentoRepository.iter_pairs) if composition_index_enabled() else None
+    
+    @staticmethod
+    async def get_all_medicamentos(
+        limit: int,
+        after: Optional[str] = None,
+        sort: str = "_id",
+        ids: Optional[List[str]] = None,
+        fields: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get a page of medicamentos with keyset pagination, or the requested ids in one query"""
+        field_list = parse_fields_or_400(fields, MedicamentoRepository.FIELDS)
+        if ids:
+            if len(ids) > MAX_IDS_PER_REQUEST:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"At most {MAX_IDS_PER_REQUEST} ids per request"
+                )
+            items = await MedicamentoRepository.get_many(ids)
+            include = None if field_list is None else {"id", *field_list}
+            return {"items": [item.model_dump(by_alias=True, include=include) for item in items], "next_cursor": None}
+        
+        try:
+            items, next_cursor = await MedicamentoRepository.get_page(limit, after, sort, field_list)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+        return {"items": items, "next_cursor": next_cursor}
+    
+    @staticmethod
+    async def export_medicamentos(batch_size: int) -> AsyncIterator[bytes]:
+        """Stream every medicamento as NDJSON, one line per document"""
+        async for document in MedicamentoRepository.iter_documents(batch_size):
+            yield orjson.dumps(document) + b"\n"
+    
+    @staticmethod
+    async def search_medicamentos(q: str, limit: int) -> List[Dict[str, Any]]:
+        """Search medicamentos by nombre, ignoring case and accents"""
+        if not q or q.strip() == "":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Search query cannot be empty"
+            )
+        return await MedicamentoRepository.search(q.strip(), limit)
+    
+    @staticmethod
+    async def autocomplete_medicamentos(q: str, limit: int) -> List[Dict[str, Any]]:
+        """Suggest medicamentos whose nombre starts with q, served from memory"""
+        return await MedicamentoService.autocomplete.suggest(q, limit)
+    
+    @staticmethod
+    async def find_medicamentos_by_compuestos(
+        compuesto_ids: List[str],
+        match: str = "all",
+        limit: int = 100,
+        fields: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Medicamentos containing all (or any) of the given compuestos, resolved in one server-side pass"""
+        field_list = parse_fields_or_400(fields, MedicamentoRepository.FIELDS)
+        if not compuesto_ids:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="At least one compuesto id is required"
+            )
+        if len(compuesto_ids) > MAX_IDS_PER_REQUEST:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At most {MAX_IDS_PER_REQUEST} ids per request"
+            )
+        object_ids, invalid = parse_object_ids(compuesto_ids)
+        if invalid:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid compuesto ids: {', '.join(invalid)}"
+            )
+        # unicos y en su forma canonica, como las claves del indice en memoria
+        compuesto_ids = [str(object_id) for object_id in object_ids]
+        
+        match_all = match == "all"
+        if MedicamentoService.composition is not None:
+            medicamento_ids = await MedicamentoService.composition.find(compuesto_ids, match_all)
+        else:
+            medicamento_ids = await CompuestoPorMedicamentoRepository.find_medicamento_ids(compuesto_ids, match_all)
+        
+        items = await MedicamentoRepository.get_many(medicamento_ids[:limit])
+        include = None if field_list is None else {"id", *field_list}
+        return {
+            "items": [item.model_dump(by_alias=True, include=include) for item in items],
+            "total": len(medicamento_ids)
+        }
+    
     @staticmethod
-    async def get_all_medicamentos() -> List[Medicamento]:
-        """Get all medicamentos"""
-        return await MedicamentoRepository.get_all()
+    async def get_medicamento_version(medicamento_id: str, fresh: bool = False) -> DocumentVersion:
+        """Current version of a medicamento (cached unless fresh), 404 if it does not exist"""
+        version = await MedicamentoRepository.get_version(medicamento_id, fresh)
+        if version is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Medicamento with ID {medicamento_id} not found"
+            )
+        return version
+    
+    @staticmethod
+    async def _expected_version(medicamento_id: str, if_match: Optional[str]) -> Optional[int]:
+        """Version an If-Match header pins a write to (412 if it is stale); None without the header"""
+        if if_match is None:
+            return None
+        current = await MedicamentoService.get_medicamento_version(medicamento_id, fresh=True)
+        require_match(if_match, make_etag(medicamento_id, current))
+        return current.version
     
     @staticmethod
-    async def get_medicamento_by_id(medicamento_id: str) -> Medicamento:
-        """Get a medicamento by ID with validation"""
-        medicamento = await MedicamentoRepository.get_by_id(medicamento_id)
+    async def get_medicamento_by_id(medicamento_id: str, fields: Optional[str] = None) -> Union[Medicamento, Dict[str, Any]]:
+        """Get a medicamento by ID with validation; with fields only those are returned"""
+        field_list = parse_fields_or_400(fields, MedicamentoRepository.FIELDS)
+        if field_list is None:
+            medicamento = await MedicamentoRepository.get_by_id(medicamento_id)
+        else:
+            medicamento = await MedicamentoRepository.get_partial(medicamento_id, field_list)
         if not medicamento:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -40,57 +180,377 @@ class MedicamentoService:
                 detail="Fabricante cannot be empty"
             )
         
-        return await MedicamentoRepository.create(medicamento)
+        created_medicamento = await MedicamentoRepository.create(medicamento)
+        if MaterializedViewRepository.enabled:
+            await MaterializedViewRepository.save_medicamento(created_medicamento)
+        await StatsService.record(StatsService.medicamento_deltas({created_medicamento.fabricante: 1}))
+        MedicamentoService.autocomplete.put(created_medicamento.id, created_medicamento.nombre)
+        return created_medicamento
     
     @staticmethod
-    async def update_medicamento(medicamento_id: str, medicamento: Medicamento) -> Medicamento:
-        """Update an existing medicamento with validation"""
-        existing_medicamento = await MedicamentoRepository.get_by_id(medicamento_id)
-        if not existing_medicamento:
+    async def create_medicamentos(medicamentos: List[Medicamento]) -> List[Dict[str, Any]]:
+        """Create several medicamentos in one write, validating each item"""
+        if len(medicamentos) > BULK_MAX_ITEMS:
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Medicamento with ID {medicamento_id} not found"
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"At most {BULK_MAX_ITEMS} items per request"
             )
         
-        if not medicamento.nombre or medicamento.nombre.strip() == "":
+        results = [None] * len(medicamentos)
+        valid_indexes = []
+        for index, medicamento in enumerate(medicamentos):
+            if not medicamento.nombre or medicamento.nombre.strip() == "":
+                results[index] = {"index": index, "status": "error", "error": "Medicamento name cannot be empty"}
+            elif not medicamento.fabricante or medicamento.fabricante.strip() == "":
+                results[index] = {"index": index, "status": "error", "error": "Fabricante cannot be empty"}
+            else:
+                valid_indexes.append(index)
+        
+        created = await MedicamentoRepository.create_many([medicamentos[i] for i in valid_indexes])
+        created_medicamentos = []
+        for index, result in zip(valid_indexes, created):
+            result["index"] = index
+            results[index] = result
+            if result["status"] == "created":
+                created_medicamentos.append(medicamentos[index].model_copy(update={"id": result["id"]}))
+        
+        if MaterializedViewRepository.enabled:
+            await MaterializedViewRepository.insert_medicamentos(created_medicamentos)
+        await StatsService.record(StatsService.medicamento_deltas(Counter(m.fabricante for m in created_medicamentos)))
+        for created in created_medicamentos:
+            MedicamentoService.autocomplete.put(created.id, created.nombre)
+        return results
+    
+    @staticmethod
+    async def add_compuestos_to_medicamentos(relaciones: List[CompuestoPorMedicamento]) -> List[Dict[str, Any]]:
+        """Link several compuestos to medicamentos, checking references with one $in per collection"""
+        if len(relaciones) > BULK_MAX_ITEMS:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Medicamento name cannot be empty"
+                detail=f"At most {BULK_MAX_ITEMS} items per request"
             )
         
-        if not medicamento.fabricante or medicamento.fabricante.strip() == "":
+        existing_medicamentos = await MedicamentoRepository.existing_ids([r.medicamento_id for r in relaciones])
+        existing_compuestos = await CompuestoRepository.existing_ids([r.compuesto_id for r in relaciones])
+        
+        results = [None] * len(relaciones)
+        valid_indexes = []
+        for index, relacion in enumerate(relaciones):
+            if relacion.medicamento_id not in existing_medicamentos:
+                error = f"Medicamento with ID {relacion.medicamento_id} not found"
+            elif relacion.compuesto_id not in existing_compuestos:
+                error = f"Compuesto with ID {relacion.compuesto_id} not found"
+            elif relacion.concentracion <= 0:
+                error = "Concentration must be greater than zero"
+            elif not relacion.unidad_medida or relacion.unidad_medida.strip() == "":
+                error = "Unit of measure cannot be empty"
+            else:
+                valid_indexes.append(index)
+                continue
+            results[index] = {"index": index, "status": "error", "error": error}
+        
+        created = await CompuestoPorMedicamentoRepository.create_many(
+            [relaciones[i].dict() for i in valid_indexes]
+        )
+        created_indexes = []
+        for index, result in zip(valid_indexes, created):
+            result["index"] = index
+            results[index] = result
+            if result["status"] == "created":
+                created_indexes.append(index)
+        
+        if created_indexes:
+            await MedicamentoRepository.touch([relaciones[i].medicamento_id for i in created_indexes])
+            await CompuestoRepository.touch([relaciones[i].compuesto_id for i in created_indexes])
+            await StatsService.record(StatsService.relation_deltas(
+                StatsService.summarize_relations(relaciones[i] for i in created_indexes)
+            ))
+        if MaterializedViewRepository.enabled and created_indexes:
+            await MedicamentoService._embed_relations([relaciones[i] for i in created_indexes])
+        if MedicamentoService.composition is not None and created_indexes:
+            MedicamentoService.composition.add(
+                (normalize_id(relaciones[i].compuesto_id), normalize_id(relaciones[i].medicamento_id)) for i in created_indexes
+            )
+        return results
+    
+    @staticmethod
+    async def _embed_relations(relaciones: List[CompuestoPorMedicamento]) -> None:
+        """Copy new relations into the materialized views, fetching names with one $in per collection"""
+        medicamentos = {m.id: m for m in await MedicamentoRepository.get_many([r.medicamento_id for r in relaciones])}
+        compuestos = {c.id: c for c in await CompuestoRepository.get_many([r.compuesto_id for r in relaciones])}
+        # get_many devuelve los ids en hex minuscula; el cliente pudo enviarlos en otra forma
+        pairs = [(normalize_id(r.medicamento_id), normalize_id(r.compuesto_id), r) for r in relaciones]
+        await MaterializedViewRepository.add_relations([
+            {
+                "medicamento": medicamentos[medicamento_id],
+                "compuesto": compuestos[compuesto_id],
+                "concentracion": r.concentracion,
+                "unidad_medida": r.unidad_medida
+            }
+            for medicamento_id, compuesto_id, r in pairs
+            if medicamento_id in medicamentos and compuesto_id in compuestos
+        ])
+    
+    @staticmethod
+    async def update_medicamento(medicamento_id: str, medicamento: Medicamento, if_match: Optional[str] = None) -> Medicamento:
+        """Update an existing medicamento with validation; If-Match makes it conditional on the ETag"""
+        invalid = None
+        if not medicamento.nombre or medicamento.nombre.strip() == "":
+            invalid = "Medicamento name cannot be empty"
+        elif not medicamento.fabricante or medicamento.fabricante.strip() == "":
+            invalid = "Fabricante cannot be empty"
+        if invalid is not None:
+            # un id inexistente es 404 antes que 400; la lectura solo se hace si el cuerpo no es valido
+            await MedicamentoService.get_medicamento_version(medicamento_id)
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Fabricante cannot be empty"
+                detail=invalid
             )
         
-        return await MedicamentoRepository.update(medicamento_id, medicamento)
-    
-    @staticmethod
-    async def delete_medicamento(medicamento_id: str) -> Dict[str, Any]:
-        """Delete a medicamento with validation and cascade deletion"""
-        existing_medicamento = await MedicamentoRepository.get_by_id(medicamento_id)
-        if not existing_medicamento:
+        expected_version = await MedicamentoService._expected_version(medicamento_id, if_match)
+        result = await MedicamentoRepository.update(medicamento_id, medicamento, expected_version)
+        if not result:
+            if expected_version is not None:
+                # existia al validar el If-Match: otra escritura cambio la version entre medias
+                raise HTTPException(
+                    status_code=status.HTTP_412_PRECONDITION_FAILED,
+                    detail="Resource was modified; fetch it again to get the current ETag"
+                )
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Medicamento with ID {medicamento_id} not found"
             )
+        # la imagen previa de la misma escritura dice de que fabricante mover el contador
+        previous, updated_medicamento = result
+        if MaterializedViewRepository.enabled:
+            await MaterializedViewRepository.save_medicamento(updated_medicamento)
+        if previous.fabricante != updated_medicamento.fabricante:
+            deltas = StatsService.medicamento_deltas({previous.fabricante: 1}, -1)
+            deltas.update(StatsService.medicamento_deltas({updated_medicamento.fabricante: 1}))
+            await StatsService.record(deltas)
+        if any(getattr(previous, field) != getattr(updated_medicamento, field) for field in RELATED_FIELDS):
+            await MedicamentoService.touch_related("medicamento_id", medicamento_id, updated_medicamento.updated_at)
+        MedicamentoService.autocomplete.put(updated_medicamento.id, updated_medicamento.nombre)
+        return updated_medicamento
+    
+    @staticmethod
+    async def patch_medicamento(medicamento_id: str, patch: Dict[str, Any], if_match: Optional[str] = None) -> Medicamento:
+        """Apply a JSON Merge Patch that writes only the fields it changes; If-Match makes it conditional on the ETag"""
+        for attempt in range(PATCH_MAX_ATTEMPTS):
+            # primer intento con la copia en cache; con If-Match o tras un conflicto, desde el primario
+            if attempt > 0 or if_match is not None:
+                current = await MedicamentoRepository.get_fresh(medicamento_id)
+            else:
+                current = await MedicamentoRepository.get_by_id(medicamento_id)
+            if not current:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Medicamento with ID {medicamento_id} not found"
+                )
+            if if_match is not None:
+                require_match(if_match, make_etag(medicamento_id, version_of(current)))
+            
+            try:
+                changes = merge_patch_changes(current, patch, MedicamentoRepository.FIELDS)
+            except ValueError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=str(e)
+                )
+            if "nombre" in changes and changes["nombre"].strip() == "":
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Medicamento name cannot be empty"
+                )
+            if "fabricante" in changes and changes["fabricante"].strip() == "":
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Fabricante cannot be empty"
+                )
+            if not changes:
+                # nada cambia: no se escribe (ni oplog ni replicacion)
+                return current
+            
+            patched = await MedicamentoRepository.patch(medicamento_id, changes, current.version or 0)
+            if patched:
+                break
+            if if_match is not None:
+                raise HTTPException(
+                    status_code=status.HTTP_412_PRECONDITION_FAILED,
+                    detail="Resource was modified; fetch it again to get the current ETag"
+                )
+            # otra escritura cambio la version entre la lectura y el patch: se recalcula el diff
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Medicamento with ID {medicamento_id} is being modified concurrently; retry the patch"
+            )
         
-        # borrar relaciones primero en cascada 
-        deleted_relations = await CompuestoPorMedicamentoRepository.delete_by_medicamento_id(medicamento_id)
+        if MaterializedViewRepository.enabled:
+            await MaterializedViewRepository.save_medicamento(patched)
+        if "fabricante" in changes:
+            deltas = StatsService.medicamento_deltas({current.fabricante: 1}, -1)
+            deltas.update(StatsService.medicamento_deltas({patched.fabricante: 1}))
+            await StatsService.record(deltas)
+        if any(field in changes for field in RELATED_FIELDS):
+            await MedicamentoService.touch_related("medicamento_id", medicamento_id, patched.updated_at)
+        if "nombre" in changes:
+            MedicamentoService.autocomplete.put(patched.id, patched.nombre)
+        return patched
+    
+    @staticmethod
+    async def delete_medicamento(medicamento_id: str, if_match: Optional[str] = None) -> Dict[str, Any]:
+        """Delete a medicamento and its relations atomically in one transaction; If-Match makes it conditional"""
+        expected_version = await MedicamentoService._expected_version(medicamento_id, if_match)
         
-        #borrar medicamento
-        result = await MedicamentoRepository.delete(medicamento_id)
+        async def cascade(session) -> Dict[str, Any]:
+            if StatsRepository.enabled:
+                fabricantes = await MedicamentoRepository.count_fabricantes([medicamento_id], session=session)
+                relations = await CompuestoPorMedicamentoRepository.summarize("medicamento_id", [medicamento_id], session=session)
+            # borrar el medicamento; si no existia no hay nada que borrar en cascada
+            deleted = await MedicamentoRepository.delete(medicamento_id, session=session, expected_version=expected_version)
+            if not deleted:
+                if expected_version is not None:
+                    raise HTTPException(
+                        status_code=status.HTTP_412_PRECONDITION_FAILED,
+                        detail="Resource was modified; fetch it again to get the current ETag"
+                    )
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Medicamento with ID {medicamento_id} not found"
+                )
+            
+            # borrar las relaciones en la misma transaccion
+            related_ids = await CompuestoPorMedicamentoRepository.compuesto_ids_for([medicamento_id], session=session)
+            deleted_relations = await CompuestoPorMedicamentoRepository.delete_by_medicamento_id(medicamento_id, session=session)
+            await CompuestoRepository.touch(related_ids, session=session)
+            if MaterializedViewRepository.enabled:
+                await MaterializedViewRepository.remove_medicamentos([medicamento_id], session=session)
+            if StatsRepository.enabled:
+                deltas = StatsService.medicamento_deltas(fabricantes, -1)
+                deltas.update(StatsService.relation_deltas(relations, -1))
+                await StatsService.record(deltas, session=session)
+            
+            return {
+                "deleted": deleted,
+                "id": medicamento_id,
+                "related_records_deleted": deleted_relations
+            }
         
-        return {
-            "deleted": result,
-            "id": medicamento_id,
-            "related_records_deleted": deleted_relations
-        }
+        result = await run_in_transaction(cascade)
+        # los indices en memoria usan el id en su forma canonica
+        MedicamentoService.autocomplete.remove([normalize_id(medicamento_id)])
+        if MedicamentoService.composition is not None:
+            MedicamentoService.composition.remove_medicamentos([normalize_id(medicamento_id)])
+        return result
+    
+    @staticmethod
+    async def delete_medicamentos(medicamento_ids: List[str]) -> Dict[str, Any]:
+        """Delete several medicamentos and their relations with one $in per collection; large cascades become a job"""
+        deferred_total = await JobService.cascade_size("medicamento_id", medicamento_ids)
+        
+        async def cascade(session) -> Dict[str, Any]:
+            if StatsRepository.enabled:
+                fabricantes = await MedicamentoRepository.count_fabricantes(medicamento_ids, session=session)
+            deleted_ids = await MedicamentoRepository.delete_many(medicamento_ids, session=session)
+            found = set(deleted_ids)
+            if deferred_total is not None and deleted_ids:
+                # las relaciones se borran por lotes en segundo plano (delete_relations_step)
+                if MaterializedViewRepository.enabled:
+                    await MaterializedViewRepository.remove_medicamentos(deleted_ids, session=session, pull=False)
+                if StatsRepository.enabled:
+                    await StatsService.record(StatsService.medicamento_deltas(fabricantes, -1), session=session)
+                return {
+                    "deleted": deleted_ids,
+                    "not_found": [id for id in medicamento_ids if id not in found],
+                    "job": await JobService.enqueue_cascade("medicamento_id", deleted_ids, deferred_total, session=session)
+                }
+            related_ids = await CompuestoPorMedicamentoRepository.compuesto_ids_for(deleted_ids, session=session)
+            if StatsRepository.enabled:
+                relations = await CompuestoPorMedicamentoRepository.summarize("medicamento_id", deleted_ids, session=session)
+            deleted_relations = await CompuestoPorMedicamentoRepository.delete_by_medicamento_ids(deleted_ids, session=session)
+            await CompuestoRepository.touch(related_ids, session=session)
+            if MaterializedViewRepository.enabled:
+                await MaterializedViewRepository.remove_medicamentos(deleted_ids, session=session)
+            if StatsRepository.enabled:
+                deltas = StatsService.medicamento_deltas(fabricantes, -1)
+                deltas.update(StatsService.relation_deltas(relations, -1))
+                await StatsService.record(deltas, session=session)
+            return {
+                "deleted": deleted_ids,
+                "not_found": [id for id in medicamento_ids if id not in found],
+                "related_records_deleted": deleted_relations
+            }
+        
+        result = await run_in_transaction(cascade)
+        if "job" in result:
+            JobService.notify()
+        MedicamentoService.autocomplete.remove(result["deleted"])
+        if MedicamentoService.composition is not None:
+            MedicamentoService.composition.remove_medicamentos(result["deleted"])
+        return result
+    
+    @staticmethod
+    @JobService.step("delete_relations")
+    async def delete_relations_step(params: Dict[str, Any], limit: int, session=None) -> int:
+        """One batch of a deferred cascade: delete up to limit relations of the deleted ids and what depends on them"""
+        relaciones = await CompuestoPorMedicamentoRepository.delete_batch(params["field"], params["ids"], limit, session=session)
+        if not relaciones:
+            return 0
+        summary = StatsService.summarize_relations(relaciones)
+        medicamento_ids = list(summary["medicamento"])
+        compuesto_ids = list(summary["compuesto"])
+        # solo cambian los documentos del otro lado de la relacion; los borrados ya no existen
+        if params["field"] == "compuesto_id":
+            await MedicamentoRepository.touch(medicamento_ids, session=session)
+            if MaterializedViewRepository.enabled:
+                await MaterializedViewRepository.pull_compuestos(compuesto_ids, medicamento_ids, session=session)
+        else:
+            await CompuestoRepository.touch(compuesto_ids, session=session)
+            if MaterializedViewRepository.enabled:
+                await MaterializedViewRepository.pull_medicamentos(medicamento_ids, compuesto_ids, session=session)
+        await StatsService.record(StatsService.relation_deltas(summary, -1), session=session)
+        if MedicamentoService.composition is not None:
+            MedicamentoService.composition.remove((relacion.compuesto_id, relacion.medicamento_id) for relacion in relaciones)
+        return len(relaciones)
+    
+    @staticmethod
+    async def touch_related(field: str, id: str, since: datetime) -> None:
+        """Bump the versions of the documents whose sub-routes show this one, so their ETags change; a large fan-out becomes a job"""
+        total = await JobService.cascade_size(field, [id])
+        if total is not None:
+            await JobService.enqueue_touch(field, [id], since, total)
+            JobService.notify()
+        elif field == "medicamento_id":
+            await CompuestoRepository.touch(await CompuestoPorMedicamentoRepository.compuesto_ids_for([id]))
+        else:
+            await MedicamentoRepository.touch(await CompuestoPorMedicamentoRepository.medicamento_ids_for([id]))
     
     @staticmethod
-    async def get_compuestos_by_medicamento(medicamento_id: str) -> List[Dict[str, Any]]:
+    @JobService.step("touch_related")
+    async def touch_related_step(params: Dict[str, Any], limit: int, session=None) -> int:
+        """One batch of a deferred touch: bump up to limit related documents not written since the change"""
+        # se eligen por updated_at: un lote repetido tras un fallo no vuelve a tocar los ya tocados
+        if params["field"] == "medicamento_id":
+            related_ids = await CompuestoPorMedicamentoRepository.compuesto_ids_for(params["ids"], session=session)
+            return await CompuestoRepository.touch_stale(related_ids, params["since"], limit, session=session)
+        related_ids = await CompuestoPorMedicamentoRepository.medicamento_ids_for(params["ids"], session=session)
+        return await MedicamentoRepository.touch_stale(related_ids, params["since"], limit, session=session)
+    
+    @staticmethod
+    async def get_compuestos_by_medicamento(medicamento_id: str, fields: Optional[str] = None) -> List[Dict[str, Any]]:
         """Get all compuestos that are in this medicamento"""
+        field_list = parse_fields_or_400(fields, SUB_RESOURCE_FIELDS)
+        if MaterializedViewRepository.enabled:
+            # una sola lectura indexada sobre la vista materializada
+            compuestos = await MaterializedViewRepository.get_compuestos(medicamento_id, field_list)
+            if compuestos is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Medicamento with ID {medicamento_id} not found"
+                )
+            return compuestos
+        
         existing_medicamento = await MedicamentoRepository.get_by_id(medicamento_id)
         if not existing_medicamento:
             raise HTTPException(
@@ -98,7 +558,21 @@ class MedicamentoService:
                 detail=f"Medicamento with ID {medicamento_id} not found"
             )
         
-        return await MedicamentoRepository.get_compuestos_by_medicamento_id(medicamento_id)
+        return await MedicamentoRepository.get_compuestos_by_medicamento_id(medicamento_id, field_list)
+    
+    @staticmethod
+    async def get_medicamento_detail(medicamento_id: str) -> MedicamentoDetalle:
+        """Get a medicamento with its compuestos without a separate existence check"""
+        if MaterializedViewRepository.enabled:
+            detail = await MaterializedViewRepository.get_medicamento_detail(medicamento_id)
+        else:
+            detail = await MedicamentoRepository.get_detail(medicamento_id)
+        if not detail:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Medicamento with ID {medicamento_id} not found"
+            )
+        return detail
     
     @staticmethod
     async def add_compuesto_to_medicamento(
@@ -143,4 +617,24 @@ class MedicamentoService:
             "unidad_medida": unidad
         }
         
-        return await CompuestoPorMedicamentoRepository.create(compuesto_med_data)
\ No newline at end of file
+        try:
+            created_relation = await CompuestoPorMedicamentoRepository.create(compuesto_med_data)
+        except DuplicateKeyError:
+            # indice unico medicamento_id + compuesto_id
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Compuesto {compuesto_id} is already in medicamento {medicamento_id}"
+            )
+        await MedicamentoRepository.touch([medicamento_id])
+        await CompuestoRepository.touch([compuesto_id])
+        await StatsService.record(StatsService.relation_deltas(StatsService.summarize_relations([created_relation])))
+        if MaterializedViewRepository.enabled:
+            await MaterializedViewRepository.add_relations([{
+                "medicamento": existing_medicamento,
+                "compuesto": existing_compuesto,
+                "concentracion": concentracion,
+                "unidad_medida": unidad
+            }])
+        if MedicamentoService.composition is not None:
+            MedicamentoService.composition.add([(existing_compuesto.id, existing_medicamento.id)])
+        return created_relation
\ No newline at end of file
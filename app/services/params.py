@@ -0,0 +1,13 @@
+from typing import List, Optional, Sequence
+from fastapi import HTTPException, status
+from app.repositories.projection import parse_fields
+
+def parse_fields_or_400(fields: Optional[str], allowed: Sequence[str]) -> Optional[List[str]]:
+    """Parse the fields= query parameter, mapping unknown fields to a 400"""
+    try:
+        return parse_fields(fields, allowed)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
@@ -0,0 +1,38 @@
+"""
+JSON Merge Patch (RFC 7396) bodies for PATCH endpoints.
+
+A patch is diffed against the current document so only the fields whose
+value actually changes are written; a patch that changes nothing produces
+no write at all. null removes a field, which the models only allow for
+optional fields.
+"""
+
+from typing import Any, Dict, Sequence
+from pydantic import BaseModel, ValidationError
+from app.repositories.versioning import VERSION_FIELDS
+
+# el id y la version los fija el servidor; se aceptan (y se ignoran) si el cliente reenvia el documento
+IGNORED_FIELDS = ("_id", "id", *VERSION_FIELDS)
+
+
+def merge_patch_changes(current: BaseModel, patch: Any, allowed: Sequence[str]) -> Dict[str, Any]:
+    """Fields the patch changes as {field: new value}, None meaning $unset; ValueError if invalid"""
+    if not isinstance(patch, dict):
+        raise ValueError("Patch body must be a JSON object")
+    unknown = [field for field in patch if field not in allowed and field not in IGNORED_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    changes = {
+        field: patch[field]
+        for field in allowed
+        if field in patch and patch[field] != getattr(current, field)
+    }
+    if changes:
+        # el documento resultante debe seguir cumpliendo el modelo
+        try:
+            type(current).model_validate({**current.model_dump(by_alias=True), **changes})
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+            raise ValueError(f"Invalid patch: {errors}") from e
+    return changes
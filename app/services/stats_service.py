@@ -0,0 +1,104 @@
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Mapping
+from fastapi import HTTPException, status
+from app.models.compuesto_med import CompuestoPorMedicamento
+from app.repositories.compuesto_repo import CompuestoRepository
+from app.repositories.ids import normalize_id
+from app.repositories.medicamentos_repo import MedicamentoRepository
+from app.repositories.stats_repo import StatsRepository
+
+class StatsService:
+    """Service class for the statistics endpoints and the counter updates done on writes"""
+
+    @staticmethod
+    def medicamento_deltas(fabricantes: Mapping[str, int], sign: int = 1) -> Counter:
+        """Counter changes for medicamentos created (sign 1) or deleted (sign -1), given their count per fabricante"""
+        deltas = Counter({("total", "medicamentos"): sign * sum(fabricantes.values())})
+        for fabricante, n in fabricantes.items():
+            deltas[("fabricante", fabricante)] += sign * n
+        return deltas
+
+    @staticmethod
+    def compuesto_deltas(count: int, sign: int = 1) -> Counter:
+        return Counter({("total", "compuestos"): sign * count})
+
+    @staticmethod
+    def relation_deltas(summary: Mapping[str, Mapping[str, int]], sign: int = 1) -> Counter:
+        """Counter changes for relations created or deleted, from a summary as built by summarize()"""
+        deltas = Counter({("total", "relaciones"): sign * sum(summary["unidad"].values())})
+        for tipo in ("compuesto", "medicamento", "unidad"):
+            for clave, n in summary[tipo].items():
+                deltas[(tipo, clave)] += sign * n
+        return deltas
+
+    @staticmethod
+    def summarize_relations(relaciones: Iterable[CompuestoPorMedicamento]) -> Dict[str, Dict[str, int]]:
+        """Same shape as CompuestoPorMedicamentoRepository.summarize for relations about to be written"""
+        summary = {"compuesto": Counter(), "medicamento": Counter(), "unidad": Counter()}
+        for relacion in relaciones:
+            # en hex minuscula, como los lee summarize al borrar en cascada
+            summary["compuesto"][normalize_id(relacion.compuesto_id)] += 1
+            summary["medicamento"][normalize_id(relacion.medicamento_id)] += 1
+            summary["unidad"][relacion.unidad_medida] += 1
+        return summary
+
+    @staticmethod
+    async def record(deltas: Counter, session=None) -> None:
+        """Apply counter changes; with a session they commit together with the write that caused them"""
+        if StatsRepository.enabled:
+            await StatsRepository.increment(deltas, session=session)
+
+    @staticmethod
+    def _require_enabled() -> None:
+        if not StatsRepository.enabled:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Statistics are disabled; set STATS=1 and run the recompute command"
+            )
+
+    @staticmethod
+    async def get_summary() -> Dict[str, Any]:
+        """Totals and mean relation counts"""
+        StatsService._require_enabled()
+        totals = await StatsRepository.get_totals()
+        medicamentos = totals.get("medicamentos", 0)
+        compuestos = totals.get("compuestos", 0)
+        relaciones = totals.get("relaciones", 0)
+        return {
+            "medicamentos": medicamentos,
+            "compuestos": compuestos,
+            "relaciones": relaciones,
+            "compuestos_por_medicamento": round(relaciones / medicamentos, 3) if medicamentos else 0.0,
+            "medicamentos_por_compuesto": round(relaciones / compuestos, 3) if compuestos else 0.0
+        }
+
+    @staticmethod
+    async def get_ranking(tipo: str, key: str, limit: int) -> List[Dict[str, Any]]:
+        """Top counters of one type as [{key: clave, "total": n}]"""
+        StatsService._require_enabled()
+        return [{key: counter["clave"], "total": counter["n"]} for counter in await StatsRepository.top(tipo, limit)]
+
+    @staticmethod
+    async def _named_ranking(tipo: str, repository, limit: int) -> List[Dict[str, Any]]:
+        StatsService._require_enabled()
+        counters = await StatsRepository.top(tipo, limit)
+        names = {item.id: item.nombre for item in await repository.get_many([c["clave"] for c in counters])}
+        return [
+            {"_id": counter["clave"], "nombre": names.get(counter["clave"]), "total": counter["n"]}
+            for counter in counters
+        ]
+
+    @staticmethod
+    async def get_top_compuestos(limit: int) -> List[Dict[str, Any]]:
+        """Compuestos present in the most medicamentos"""
+        return await StatsService._named_ranking("compuesto", CompuestoRepository, limit)
+
+    @staticmethod
+    async def get_top_medicamentos(limit: int) -> List[Dict[str, Any]]:
+        """Medicamentos with the most compuestos"""
+        return await StatsService._named_ranking("medicamento", MedicamentoRepository, limit)
+
+    @staticmethod
+    async def recompute() -> Dict[str, Any]:
+        """Rebuild every counter from the source collections"""
+        return {"enabled": StatsRepository.enabled, "counters": await StatsRepository.rebuild()}
@@ -0,0 +1,147 @@
+"""
+Synthetic catalog generator for load tests.
+
+Writes compuestos.ndjson, medicamentos.ndjson and compuestos_medicamentos.ndjson
+(Extended JSON, one document per line) that app/db/scripts/import_data.py loads
+with --data-dir. Output is deterministic for a given --seed, and documents are
+streamed to disk, so 10^7 medicamentos do not need to fit in memory.
+
+Compuesto popularity follows a Zipf-like distribution: a few compuestos
+(acetaminofén, cafeína, ...) appear in many medicamentos and most in few, so
+sub-resource and composition queries see realistic skew.
+
+Usage: python benchmarks/generate_data.py --medicamentos 100000 --fanout 3 --out datos/bench
+"""
+
+import argparse
+import itertools
+import os
+import random
+import time
+from bisect import bisect_left
+
+import orjson
+
+PREFIXES = ("Acet", "Ibu", "Amoxi", "Loso", "Metfor", "Omep", "Sertra", "Atorva", "Clopi", "Dexa",
+            "Fluco", "Keto", "Levo", "Napro", "Panto", "Ranit", "Salbu", "Tama", "Vala", "Zolpi")
+MIDDLES = ("mino", "pro", "ci", "sar", "fen", "lina", "tro", "va", "ce", "do", "xo", "ri")
+SUFFIXES = ("fén", "feno", "lina", "tán", "mina", "zol", "prazol", "statina", "dol", "cilina", "ona", "ato")
+BRANDS = ("Dolex", "Noxpirin", "Advil", "Winadol", "Apronax", "Buscapina", "Sevedol", "Mareol",
+          "Genfar", "Bonfiest", "Ibuflash", "Acetax", "Dolofen", "Febrax", "Gripex", "Respirol")
+FORMS = ("Forte", "Plus", "Max", "Niños", "Noche", "Día", "Jarabe", "Tabletas", "Gotas", "Retard")
+FABRICANTES = ("Laboratorios Siegfried", "Tecnoquímicas", "Genfar", "Bayer", "Pfizer", "Sanofi",
+               "La Santé", "Procaps", "MK", "Abbott", "Novartis", "GSK", "Lafrancol", "Bussié")
+UNIDADES = (("mg", (5, 1000)), ("ml", (1, 100)), ("g", (1, 5)), ("UI", (100, 5000)), ("mcg", (50, 500)))
+
+# Prefijo fijo de los ObjectId (2024-01-01) y un byte por coleccion: ids deterministas y ordenados
+OID_TIMESTAMP = 0x65920080
+COMPUESTO, MEDICAMENTO, RELACION = 1, 2, 3
+
+
+def object_id(kind: int, index: int) -> dict:
+    return {"$oid": f"{OID_TIMESTAMP:08x}{kind:04x}{index:012x}"}
+
+
+def compuesto_names(rng: random.Random, count: int):
+    """Unique generic-drug style names; a numeric suffix disambiguates once combinations run out"""
+    combos = [p + m + s for p, m, s in itertools.product(PREFIXES, MIDDLES, SUFFIXES)]
+    rng.shuffle(combos)
+    for index in range(count):
+        name = combos[index % len(combos)]
+        round_ = index // len(combos)
+        yield name if round_ == 0 else f"{name} {round_ + 1}"
+
+
+def popularity_weights(count: int, skew: float):
+    """Cumulative Zipf-like weights: compuesto i is chosen proportionally to 1 / (i + 1) ** skew"""
+    total = 0.0
+    cumulative = []
+    for index in range(count):
+        total += 1.0 / (index + 1) ** skew
+        cumulative.append(total)
+    return cumulative
+
+
+def pick_compuestos(rng: random.Random, cumulative, fanout: int):
+    """1..2*fanout-1 distinct compuestos (mean ~fanout), drawn by popularity"""
+    wanted = min(rng.randint(1, 2 * fanout - 1), len(cumulative))
+    total = cumulative[-1]
+    chosen = set()
+    while len(chosen) < wanted:
+        chosen.add(bisect_left(cumulative, rng.random() * total))
+    return sorted(chosen)
+
+
+def write_lines(path: str, documents) -> int:
+    count = 0
+    with open(path, "wb") as f:
+        buffer = []
+        for document in documents:
+            buffer.append(orjson.dumps(document))
+            count += 1
+            if len(buffer) >= 10000:
+                f.write(b"\n".join(buffer) + b"\n")
+                buffer = []
+        if buffer:
+            f.write(b"\n".join(buffer) + b"\n")
+    return count
+
+
+def generate(out_dir: str, medicamentos: int, compuestos: int, fanout: int, skew: float, seed: int) -> dict:
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    counts = {}
+
+    counts["compuestos"] = write_lines(
+        os.path.join(out_dir, "compuestos.ndjson"),
+        ({"_id": object_id(COMPUESTO, i), "nombre": name} for i, name in enumerate(compuesto_names(rng, compuestos)))
+    )
+
+    def medicamento_documents():
+        for index in range(medicamentos):
+            nombre = f"{rng.choice(BRANDS)} {rng.choice(FORMS)} {index}"
+            yield {"_id": object_id(MEDICAMENTO, index), "nombre": nombre, "fabricante": rng.choice(FABRICANTES)}
+
+    counts["medicamentos"] = write_lines(os.path.join(out_dir, "medicamentos.ndjson"), medicamento_documents())
+
+    cumulative = popularity_weights(compuestos, skew)
+
+    def relation_documents():
+        relation = 0
+        for index in range(medicamentos):
+            for compuesto in pick_compuestos(rng, cumulative, fanout):
+                unidad, (low, high) = rng.choice(UNIDADES)
+                yield {
+                    "_id": object_id(RELACION, relation),
+                    "compuesto_id": object_id(COMPUESTO, compuesto),
+                    "medicamento_id": object_id(MEDICAMENTO, index),
+                    "concentracion": rng.randint(low, high),
+                    "unidad_medida": unidad,
+                }
+                relation += 1
+
+    counts["compuestos_por_medicamento"] = write_lines(
+        os.path.join(out_dir, "compuestos_medicamentos.ndjson"), relation_documents()
+    )
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic catalog for load tests")
+    parser.add_argument("--medicamentos", type=int, default=10000, help="number of medicamentos (10^3 to 10^7)")
+    parser.add_argument("--compuestos", type=int, default=None, help="number of compuestos (default: medicamentos / 10, at least 50)")
+    parser.add_argument("--fanout", type=int, default=3, help="mean compuestos per medicamento")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of compuesto popularity (0 = uniform)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default=os.path.join("datos", "bench"), help="output directory")
+    args = parser.parse_args()
+
+    compuestos = args.compuestos or max(50, args.medicamentos // 10)
+    started = time.perf_counter()
+    counts = generate(args.out, args.medicamentos, compuestos, args.fanout, args.skew, args.seed)
+    print(f"Wrote {counts} to {args.out} in {time.perf_counter() - started:.1f}s")
+    print(f"Load it with: python app/db/scripts/import_data.py --data-dir {args.out}")
+
+
+if __name__ == "__main__":
+    main()
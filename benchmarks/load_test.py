@@ -0,0 +1,337 @@
+"""
+Load test for every route of the medicamentos and compuestos routers.
+
+Runs against a live API (python -m app.main on a local mongod loaded with
+benchmarks/generate_data.py output). Each scenario hammers one route with
+--concurrency keep-alive connections for --duration seconds and reports
+throughput and p50/p95/p99 latency. Results are written as JSON to
+benchmarks/results/, and --baseline compares them with an earlier run.
+
+Write scenarios create their own documents and then update or delete those
+documents, so the loaded dataset stays the same between runs.
+
+Usage:
+  python benchmarks/load_test.py --url http://localhost:8000 --duration 10 --concurrency 16
+  python benchmarks/load_test.py --only get_medicamento,detail --baseline benchmarks/results/<previous>.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# Un cambio mayor que este en p50/p99 o throughput se marca como regresion
+REGRESSION_THRESHOLD = 0.10
+
+Request = Tuple[str, str, Optional[object]]
+
+
+class Context:
+    """Ids sampled from the dataset plus ids created by the write scenarios"""
+
+    def __init__(self, medicamento_ids: List[str], compuesto_ids: List[str], nombres: List[str]):
+        self.medicamento_ids = medicamento_ids
+        self.compuesto_ids = compuesto_ids
+        self.nombres = nombres
+        self.created_medicamentos: List[str] = []
+        self.created_compuestos: List[str] = []
+        self.lock = threading.Lock()
+
+    def medicamento(self) -> str:
+        return random.choice(self.medicamento_ids)
+
+    def compuesto(self) -> str:
+        return random.choice(self.compuesto_ids)
+
+    def prefix(self) -> str:
+        nombre = random.choice(self.nombres)
+        return nombre[:random.randint(2, min(5, len(nombre)))]
+
+    def take(self, pool: List[str], count: int = 1) -> List[str]:
+        with self.lock:
+            taken = pool[-count:]
+            del pool[-count:]
+            return taken
+
+
+def created(pool_name: str) -> Callable[[Context, int, bytes], None]:
+    """Record ids returned by create routes so later scenarios can update or delete them"""
+    def record(ctx: Context, status: int, body: bytes) -> None:
+        if status not in (200, 201):
+            return
+        data = json.loads(body)
+        items = data if isinstance(data, list) else [data]
+        ids = [item.get("_id") or item.get("id") for item in items if item.get("status", "created") == "created"]
+        with ctx.lock:
+            getattr(ctx, pool_name).extend(id for id in ids if id)
+    return record
+
+
+def taken_or_skip(ctx: Context, pool: List[str], build: Callable[[str], Request]) -> Optional[Request]:
+    ids = ctx.take(pool)
+    return build(ids[0]) if ids else None
+
+
+# nombre -> (funcion que arma la peticion, callback opcional con la respuesta)
+SCENARIOS: Dict[str, Tuple[Callable[[Context], Optional[Request]], Optional[Callable]]] = {
+    # medicamentos: lecturas
+    "list_medicamentos": (lambda c: ("GET", "/api/medicamentos/?limit=100", None), None),
+    "list_medicamentos_by_nombre": (lambda c: ("GET", "/api/medicamentos/?limit=100&sort=nombre&fields=nombre", None), None),
+    "list_medicamentos_by_ids": (lambda c: ("GET", "/api/medicamentos/?ids=" + ",".join(c.medicamento() for _ in range(20)), None), None),
+    "export_medicamentos": (lambda c: ("GET", "/api/medicamentos/export?batch_size=1000", None), None),
+    "search_medicamentos": (lambda c: ("GET", f"/api/medicamentos/search?q={c.prefix()}", None), None),
+    "autocomplete_medicamentos": (lambda c: ("GET", f"/api/medicamentos/autocomplete?q={c.prefix()}", None), None),
+    "by_compuestos_all": (lambda c: ("GET", f"/api/medicamentos/by-compuestos?ids={c.compuesto()},{c.compuesto()}", None), None),
+    "by_compuestos_any": (lambda c: ("GET", f"/api/medicamentos/by-compuestos?ids={c.compuesto()},{c.compuesto()}&match=any&limit=100", None), None),
+    "get_medicamento": (lambda c: ("GET", f"/api/medicamentos/{c.medicamento()}", None), None),
+    "get_medicamento_fields": (lambda c: ("GET", f"/api/medicamentos/{c.medicamento()}?fields=nombre", None), None),
+    "detail": (lambda c: ("GET", f"/api/medicamentos/{c.medicamento()}/detail", None), None),
+    "compuestos_of_medicamento": (lambda c: ("GET", f"/api/medicamentos/{c.medicamento()}/compuestos", None), None),
+    # compuestos: lecturas
+    "list_compuestos": (lambda c: ("GET", "/api/compuestos/?limit=100", None), None),
+    "export_compuestos": (lambda c: ("GET", "/api/compuestos/export?batch_size=1000", None), None),
+    "search_compuestos": (lambda c: ("GET", f"/api/compuestos/search?q={c.prefix()}", None), None),
+    "autocomplete_compuestos": (lambda c: ("GET", f"/api/compuestos/autocomplete?q={c.prefix()}", None), None),
+    "get_compuesto": (lambda c: ("GET", f"/api/compuestos/{c.compuesto()}", None), None),
+    "medicamentos_of_compuesto": (lambda c: ("GET", f"/api/compuestos/{c.compuesto()}/medicamentos?fields=nombre", None), None),
+    # escrituras: crean sus propios documentos y despues los modifican o borran
+    "create_medicamento": (
+        lambda c: ("POST", "/api/medicamentos/", {"nombre": f"Bench {random.random():.8f}", "fabricante": "Bench"}),
+        created("created_medicamentos")),
+    "create_medicamentos_bulk": (
+        lambda c: ("POST", "/api/medicamentos/bulk", [{"nombre": f"Bench {random.random():.8f}", "fabricante": "Bench"} for _ in range(100)]),
+        created("created_medicamentos")),
+    "create_compuesto": (
+        lambda c: ("POST", "/api/compuestos/", {"nombre": f"Bench {random.random():.8f}"}),
+        created("created_compuestos")),
+    "create_compuestos_bulk": (
+        lambda c: ("POST", "/api/compuestos/bulk", [{"nombre": f"Bench {random.random():.8f}"} for _ in range(100)]),
+        created("created_compuestos")),
+    "add_compuesto": (
+        lambda c: ("POST", f"/api/medicamentos/{random.choice(c.created_medicamentos)}/compuestos",
+                   {"compuesto_id": c.compuesto(), "concentracion": 500, "unidad": "mg"}) if c.created_medicamentos else None,
+        None),
+    "add_compuestos_bulk": (
+        lambda c: ("POST", "/api/medicamentos/compuestos/bulk", [
+            {"medicamento_id": random.choice(c.created_medicamentos), "compuesto_id": c.compuesto(),
+             "concentracion": 5, "unidad_medida": "mg"} for _ in range(50)
+        ]) if c.created_medicamentos else None,
+        None),
+    "update_medicamento": (
+        lambda c: ("PUT", f"/api/medicamentos/{random.choice(c.created_medicamentos)}",
+                   {"nombre": f"Bench {random.random():.8f}", "fabricante": "Bench"}) if c.created_medicamentos else None,
+        None),
+    "update_compuesto": (
+        lambda c: ("PUT", f"/api/compuestos/{random.choice(c.created_compuestos)}",
+                   {"nombre": f"Bench {random.random():.8f}"}) if c.created_compuestos else None,
+        None),
+    "delete_medicamento": (
+        lambda c: taken_or_skip(c, c.created_medicamentos, lambda id: ("DELETE", f"/api/medicamentos/{id}", None)), None),
+    "delete_compuesto": (
+        lambda c: taken_or_skip(c, c.created_compuestos, lambda id: ("DELETE", f"/api/compuestos/{id}", None)), None),
+    "delete_medicamentos_bulk": (
+        lambda c: ("POST", "/api/medicamentos/bulk-delete", {"ids": ids}) if (ids := c.take(c.created_medicamentos, 100)) else None,
+        None),
+    "delete_compuestos_bulk": (
+        lambda c: ("POST", "/api/compuestos/bulk-delete", {"ids": ids}) if (ids := c.take(c.created_compuestos, 100)) else None,
+        None),
+}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_scenario(base_url: str, ctx: Context, name: str, concurrency: int, duration: float) -> dict:
+    build, on_response = SCENARIOS[name]
+    parts = urlsplit(base_url)
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        local_latencies = []
+        local_statuses = {}
+        while time.perf_counter() < deadline:
+            request = build(ctx)
+            if request is None:
+                # no quedan documentos creados que modificar o borrar
+                break
+            method, path, body = request
+            payload = json.dumps(body).encode() if body is not None else None
+            headers = {"Content-Type": "application/json"} if payload is not None else {}
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+                data, status = b"", 0
+            local_latencies.append(time.perf_counter() - started)
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+            if on_response is not None:
+                on_response(ctx, status, data)
+        connection.close()
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if status == 0 or status >= 400)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": sum(latencies) * 1000 / len(latencies) if latencies else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def fetch_json(base_url: str, path: str):
+    parts = urlsplit(base_url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+    connection.request("GET", path)
+    response = connection.getresponse()
+    data = json.loads(response.read())
+    connection.close()
+    return data
+
+
+def sample_context(base_url: str, sample_size: int) -> Context:
+    """Sample ids and names from the first pages of each collection"""
+    medicamentos = fetch_json(base_url, f"/api/medicamentos/?limit={sample_size}&fields=nombre")["items"]
+    compuestos = fetch_json(base_url, f"/api/compuestos/?limit={sample_size}&fields=nombre")["items"]
+    if not medicamentos or not compuestos:
+        raise SystemExit("The API has no data; load benchmarks/generate_data.py output first")
+    return Context(
+        [m["_id"] for m in medicamentos],
+        [c["_id"] for c in compuestos],
+        [m["nombre"] for m in medicamentos] + [c["nombre"] for c in compuestos],
+    )
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(RESULTS_DIR), text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict) -> List[str]:
+    """Lines describing changes against a baseline run, flagging regressions"""
+    lines = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        changes = []
+        regression = False
+        for metric, higher_is_better in (("throughput_rps", True), ("p50_ms", False), ("p99_ms", False)):
+            if not previous[metric]:
+                continue
+            change = (current[metric] - previous[metric]) / previous[metric]
+            worse = change < -REGRESSION_THRESHOLD if higher_is_better else change > REGRESSION_THRESHOLD
+            regression = regression or worse
+            changes.append(f"{metric} {change:+.0%}")
+        lines.append(f"{'REGRESSION ' if regression else ''}{name}: {', '.join(changes)}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test every medicamentos and compuestos route")
+    parser.add_argument("--url", default="http://localhost:8000", help="base URL of a running API")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent keep-alive connections")
+    parser.add_argument("--sample", type=int, default=1000, help="ids sampled from each collection")
+    parser.add_argument("--only", help="comma-separated scenarios to run (default: all)")
+    parser.add_argument("--skip", default="", help="comma-separated scenarios to skip, e.g. export_medicamentos at 10^7")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", help="earlier results JSON to compare against")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>-<commit>.json)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    names = args.only.split(",") if args.only else list(SCENARIOS)
+    skipped = set(filter(None, args.skip.split(",")))
+    unknown = [name for name in names + list(skipped) if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}; available: {', '.join(SCENARIOS)}")
+
+    baseline = None
+    if args.baseline:
+        # se lee antes de escribir: --output puede ser el mismo archivo
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    ctx = sample_context(args.url, args.sample)
+    commit = git_commit()
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": commit,
+            "url": args.url,
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "scenarios": {},
+    }
+    print(f"{'scenario':<28}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name in names:
+        if name in skipped:
+            continue
+        result = run_scenario(args.url, ctx, name, args.concurrency, args.duration)
+        results["scenarios"][name] = result
+        print(f"{name:<28}{result['throughput_rps']:>10.1f}{result['p50_ms']:>10.2f}"
+              f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['errors']:>8}")
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{commit or 'nocommit'}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if baseline is not None:
+        print(f"\nCompared with {args.baseline} (commit {baseline.get('meta', {}).get('commit')}):")
+        for line in compare(results, baseline):
+            print("  " + line)
+
+
+if __name__ == "__main__":
+    main()
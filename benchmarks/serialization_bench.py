@@ -0,0 +1,90 @@
+"""
+Micro-benchmark for the list endpoint response path.
+
+"before" reproduces the original path: Medicamento(**document) per document in the
+repository, a second validation of the whole list against List[Medicamento] and
+stdlib JSON encoding. "after" is the current path: documents projected by Mongo
+(_id already a string) encoded directly with orjson.
+
+Usage: python benchmarks/serialization_bench.py --docs 1000 --requests 200
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List
+
+import orjson
+from bson import ObjectId
+from pydantic import TypeAdapter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.medicamento import Medicamento
+
+
+def make_raw_documents(count: int) -> List[dict]:
+    """Documents as the driver returns them without projection"""
+    return [
+        {"_id": ObjectId(), "nombre": f"Medicamento {i}", "fabricante": f"Laboratorio {i % 50}"}
+        for i in range(count)
+    ]
+
+
+def before(raw_documents: List[dict], adapter: TypeAdapter) -> bytes:
+    medicamentos = []
+    for document in raw_documents:
+        document = dict(document)
+        document["_id"] = str(document["_id"])
+        medicamentos.append(Medicamento(**document))
+    validated = adapter.validate_python(medicamentos)
+    content = adapter.dump_python(validated, mode="json", by_alias=True)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def after(projected_documents: List[dict], next_cursor: str) -> bytes:
+    return orjson.dumps({"items": projected_documents, "next_cursor": next_cursor})
+
+
+def measure(label: str, fn, requests: int) -> dict:
+    fn()  # calentamiento
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(requests):
+        fn()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    return {
+        "path": label,
+        "requests_per_second": requests / wall,
+        "cpu_ms_per_request": cpu * 1000 / requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the list endpoint serialization path")
+    parser.add_argument("--docs", type=int, default=1000, help="documents per response")
+    parser.add_argument("--requests", type=int, default=200, help="responses to serialize per path")
+    args = parser.parse_args()
+
+    raw_documents = make_raw_documents(args.docs)
+    projected_documents = [
+        {"_id": str(d["_id"]), "nombre": d["nombre"], "fabricante": d["fabricante"]}
+        for d in raw_documents
+    ]
+    adapter = TypeAdapter(List[Medicamento])
+
+    results = [
+        measure("before", lambda: before(raw_documents, adapter), args.requests),
+        measure("after", lambda: after(projected_documents, "cursor"), args.requests),
+    ]
+    for result in results:
+        print(f"{result['path']:>6}: {result['requests_per_second']:10.1f} req/s  "
+              f"{result['cpu_ms_per_request']:8.3f} ms CPU/request  ({args.docs} docs/response)")
+    print(f"speedup: {results[1]['requests_per_second'] / results[0]['requests_per_second']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,9 @@
 import asyncio
-from app.db.mongo import client
+from app.db.mongo import get_client
 
 async def ping():
     try:
-        await client.admin.command("ping")
+        await get_client().admin.command("ping")
         print(":) connected to MongoDB successfully!")
     except Exception as e:
         print("damn failed to connect:", e)
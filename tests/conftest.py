@@ -0,0 +1,65 @@
+import os
+
+# antes de importar la app: sin transacciones ni revision de indices contra mongomock
+os.environ.setdefault("MONGO_TRANSACTIONS", "0")
+os.environ.setdefault("INDEX_CHECK", "off")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+import httpx
+import mongomock.collection
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from app.db import mongo
+from app.main import app
+from app.repositories.compuesto_repo import CompuestoRepository
+from app.repositories.medicamentos_repo import MedicamentoRepository
+from app.services.job_service import JobService
+
+# mongomock no acepta el argumento sort que pymongo 4.12 pasa a UpdateOne en bulk_write
+_add_update = mongomock.collection.BulkOperationBuilder.add_update
+mongomock.collection.BulkOperationBuilder.add_update = lambda self, *args, sort=None, **kwargs: _add_update(self, *args, **kwargs)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """Empty in-memory database behind the app's client"""
+    monkeypatch.setattr(mongo, "_client", AsyncMongoMockClient())
+    mongo._collections.clear()
+    MedicamentoRepository.cache.clear()
+    CompuestoRepository.cache.clear()
+    yield mongo.get_database()
+    mongo._collections.clear()
+
+
+@pytest.fixture
+async def client(db):
+    """HTTP client for the app, without running the lifespan"""
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+        yield http
+
+
+async def linked_medicamentos(client, count):
+    """A compuesto related to count new medicamentos, created through the API"""
+    compuesto_id = (await client.post("/api/compuestos/", json={"nombre": "Acetaminofen"})).json()["_id"]
+    medicamento_ids = [
+        (await client.post("/api/medicamentos/", json={"nombre": f"M{i}", "fabricante": "Genfar"})).json()["_id"]
+        for i in range(count)
+    ]
+    response = await client.post("/api/medicamentos/compuestos/bulk", json=[
+        {"medicamento_id": id, "compuesto_id": compuesto_id, "concentracion": 500, "unidad": "mg"}
+        for id in medicamento_ids
+    ])
+    assert response.status_code == 200
+    return compuesto_id, medicamento_ids
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    """Background jobs on, with cascades of more than 2 relations deferred"""
+    monkeypatch.setattr(JobService, "enabled", True)
+    monkeypatch.setattr(JobService, "cascade_threshold", 2)
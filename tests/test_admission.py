@@ -0,0 +1,136 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app.services import admission
+from app.services.admission import AdmissionLimiter, Saturated, admitted_stream
+from app.services.compuesto_service import CompuestoService
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_acquire_takes_free_slots_then_queues():
+    limiter = AdmissionLimiter("t", 1, 1, 1)
+    await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+
+    assert limiter.stats()["queued"] == 1
+    limiter.release()
+    await waiter
+    # el turno pasa directo al que esperaba
+    assert (limiter.stats()["active"], limiter.stats()["queued"]) == (1, 0)
+
+
+async def test_full_queue_is_rejected_immediately():
+    limiter = AdmissionLimiter("t", 1, 0, 1)
+    await limiter.acquire()
+
+    with pytest.raises(Saturated) as error:
+        await limiter.acquire()
+
+    assert error.value.reason == "queue_full"
+
+
+async def test_wait_past_the_deadline_is_rejected_and_leaves_the_queue():
+    limiter = AdmissionLimiter("t", 1, 1, 0.01)
+    await limiter.acquire()
+
+    with pytest.raises(Saturated) as error:
+        await limiter.acquire()
+
+    assert error.value.reason == "timeout"
+    assert limiter.stats()["queued"] == 0
+    limiter.release()
+    assert limiter.stats()["active"] == 0
+
+
+async def test_cancelled_waiter_does_not_leak_a_slot():
+    limiter = AdmissionLimiter("t", 1, 1, 1)
+    await limiter.acquire()
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+
+    limiter.release()
+
+    assert (limiter.stats()["active"], limiter.stats()["queued"]) == (0, 0)
+
+
+async def test_saturated_route_answers_503_with_retry_after(client, monkeypatch):
+    limiter = AdmissionLimiter("point", 1, 0, 1)
+    monkeypatch.setitem(admission.LIMITERS, "point", limiter)
+    await limiter.acquire()
+
+    response = await client.get("/api/compuestos/60d21b4f67d0d8992e610fa1")
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == admission.RETRY_AFTER_SECONDS
+
+
+async def test_stream_holds_its_slot_until_the_body_is_sent(monkeypatch):
+    limiter = AdmissionLimiter("heavy", 1, 0, 1)
+    monkeypatch.setitem(admission.LIMITERS, "heavy", limiter)
+    active_while_streaming = []
+
+    async def body():
+        for chunk in (b"a\n", b"b\n"):
+            active_while_streaming.append(limiter.stats()["active"])
+            yield chunk
+
+    response = await admitted_stream("heavy", body(), media_type="application/x-ndjson")
+    # una segunda exportacion no entra mientras la primera no termina
+    with pytest.raises(HTTPException) as error:
+        await admitted_stream("heavy", body())
+    assert error.value.status_code == 503
+
+    sent = []
+
+    async def receive():
+        await asyncio.sleep(10)
+
+    async def send(message):
+        sent.append(message)
+
+    await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+
+    assert active_while_streaming == [1, 1]
+    assert b"".join(message.get("body", b"") for message in sent) == b"a\nb\n"
+    assert limiter.stats()["active"] == 0
+
+
+async def test_stream_releases_its_slot_when_the_client_disconnects(monkeypatch):
+    limiter = AdmissionLimiter("heavy", 1, 0, 1)
+    monkeypatch.setitem(admission.LIMITERS, "heavy", limiter)
+
+    async def body():
+        yield b"a\n"
+
+    response = await admitted_stream("heavy", body())
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("connection reset")
+
+    with pytest.raises(Exception):
+        await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+    assert limiter.stats()["active"] == 0
+
+
+async def test_export_route_streams_and_gives_the_slot_back(client, monkeypatch):
+    limiter = AdmissionLimiter("heavy", 1, 0, 1)
+    monkeypatch.setitem(admission.LIMITERS, "heavy", limiter)
+
+    # mongomock no soporta el $toString de la proyeccion de la exportacion
+    async def export(batch_size):
+        yield b'{"nombre":"Ibuprofeno"}\n'
+    monkeypatch.setattr(CompuestoService, "export_compuestos", export)
+
+    response = await client.get("/api/compuestos/export")
+
+    assert response.status_code == 200
+    assert b"Ibuprofeno" in response.content
+    assert limiter.stats()["active"] == 0
@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from app.services.autocomplete import AutocompleteIndex
+
+pytestmark = pytest.mark.anyio
+
+
+class _Source:
+    """In-memory (id, nombre) source that counts full scans and can be held mid-scan"""
+
+    def __init__(self, names):
+        self.names = dict(names)
+        self.scans = 0
+        self.gate = None
+
+    async def __call__(self):
+        self.scans += 1
+        for id, nombre in list(self.names.items()):
+            yield id, nombre
+        if self.gate is not None:
+            await self.gate.wait()
+
+
+async def test_writes_update_the_index_without_a_rescan():
+    source = _Source({"1": "Acetaminofén", "2": "Ibuprofeno"})
+    index = AutocompleteIndex(source, ttl=300)
+    assert await index.suggest("aceta") == [{"_id": "1", "nombre": "Acetaminofén"}]
+
+    index.put("3", "Acido acetilsalicilico")
+    index.put("1", "Paracetamol")
+    index.remove(["2"])
+
+    assert await index.suggest("ac") == [{"_id": "3", "nombre": "Acido acetilsalicilico"}]
+    assert await index.suggest("PARA") == [{"_id": "1", "nombre": "Paracetamol"}]
+    assert await index.suggest("ibu") == []
+    assert source.scans == 1
+
+
+async def test_expired_index_is_rebuilt_in_the_background():
+    source = _Source({"1": "Amoxicilina"})
+    index = AutocompleteIndex(source, ttl=0)
+    await index.suggest("a")
+    source.names["2"] = "Ampicilina"
+    source.gate = asyncio.Event()
+
+    # mientras se recorre la coleccion se sigue respondiendo con el indice anterior
+    assert await index.suggest("am") == [{"_id": "1", "nombre": "Amoxicilina"}]
+    await asyncio.sleep(0)
+    assert source.scans == 2
+    # una escritura local durante la reconstruccion no se pierde al cambiar de indice
+    index.put("3", "Amikacina")
+    source.gate.set()
+    await index._rebuild
+
+    assert [entry["_id"] for entry in await index.suggest("am", 5)] == ["3", "1", "2"]
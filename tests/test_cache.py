@@ -0,0 +1,82 @@
+import time
+import pytest
+from app.db import mongo
+from app.models.medicamento import Medicamento
+from app.repositories.cache import TTLCache
+from app.repositories.medicamentos_repo import MedicamentoRepository
+
+pytestmark = pytest.mark.anyio
+
+
+def test_fill_started_before_a_write_is_dropped():
+    cache = TTLCache(ttl=60)
+    started = time.monotonic()
+    cache.set("a", "v2")
+
+    # la lectura empezo antes de la escritura: lo que trae puede ser la version anterior
+    cache.fill("a", "v1", started)
+
+    assert cache.get("a") == "v2"
+    cache.invalidate("a")
+    cache.fill("a", "v1", started)
+    assert cache.get("a") is None
+    assert cache.stats()["stale_fills"] == 2
+
+
+def test_fill_started_after_the_last_write_is_kept():
+    cache = TTLCache(ttl=60)
+    cache.invalidate("a")
+    started = time.monotonic()
+
+    cache.fill("a", "v2", started)
+
+    assert cache.get("a") == "v2"
+
+
+class _Session:
+    cluster_time = operation_time = None
+
+    def __init__(self, attempts):
+        self.attempts = attempts
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def with_transaction(self, callback):
+        # cada intento fallido simula un error transitorio antes del commit
+        for _ in range(self.attempts):
+            result = await callback(self)
+        return result
+
+
+class _Client:
+    def __init__(self, attempts):
+        self.attempts = attempts
+
+    async def start_session(self):
+        return _Session(self.attempts)
+
+
+async def test_invalidation_waits_for_the_commit(monkeypatch):
+    monkeypatch.setattr(mongo, "USE_TRANSACTIONS", True)
+    monkeypatch.setattr(mongo, "get_client", lambda: _Client(attempts=2))
+    MedicamentoRepository.cache.clear()
+    MedicamentoRepository.cache.set("m1", Medicamento(nombre="Dolex", fabricante="GSK"))
+    invalidated = []
+    monkeypatch.setattr(MedicamentoRepository.cache, "invalidate", invalidated.append)
+
+    async def write(session):
+        MedicamentoRepository._invalidate(["m1"], session)
+        # dentro de la transaccion, otra lectura aun debe ver la entrada anterior
+        assert invalidated == []
+        return "ok"
+
+    assert await mongo.run_in_transaction(write) == "ok"
+    # una sola vez aunque el callback se reintento
+    assert invalidated == ["m1"]
+
+    MedicamentoRepository._invalidate(["m2"])
+    assert invalidated == ["m1", "m2"]
@@ -0,0 +1,31 @@
+import pytest
+from app.repositories.stats_repo import StatsRepository
+from tests.conftest import linked_medicamentos
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("stats", [False, True])
+async def test_bulk_delete_over_threshold_queues_a_job(client, db, jobs, monkeypatch, stats):
+    monkeypatch.setattr(StatsRepository, "enabled", stats)
+    _, medicamento_ids = await linked_medicamentos(client, 4)
+
+    response = await client.post("/api/medicamentos/bulk-delete", json={"ids": medicamento_ids})
+
+    assert response.status_code == 202
+    job = response.json()["job"]
+    assert response.headers["location"] == f"/api/jobs/{job['id']}"
+    assert (job["status"], job["total"]) == ("queued", 4)
+    assert await db.medicamentos.count_documents({}) == 0
+    # las relaciones quedan para el trabajo
+    assert await db.compuestos_por_medicamento.count_documents({}) == 4
+
+
+async def test_delete_compuesto_under_threshold_stays_inline(client, db, jobs):
+    compuesto_id, _ = await linked_medicamentos(client, 2)
+
+    response = await client.delete(f"/api/compuestos/{compuesto_id}")
+
+    assert response.status_code == 200
+    assert response.json()["related_records_deleted"] == 2
+    assert await db.jobs.count_documents({}) == 0
@@ -0,0 +1,56 @@
+import asyncio
+import pytest
+from app.services.composition import CompositionIndex
+
+pytestmark = pytest.mark.anyio
+
+
+class _Source:
+    """In-memory (compuesto_id, medicamento_id) source that counts full scans and can be held mid-scan"""
+
+    def __init__(self, pairs):
+        self.pairs = list(pairs)
+        self.scans = 0
+        self.gate = None
+
+    async def __call__(self):
+        self.scans += 1
+        for pair in list(self.pairs):
+            yield pair
+        if self.gate is not None:
+            await self.gate.wait()
+
+
+async def test_writes_update_only_the_changed_postings():
+    source = _Source([("c1", "m1"), ("c2", "m1"), ("c1", "m2")])
+    index = CompositionIndex(source, ttl=300)
+    assert await index.find(["c1", "c2"]) == ["m1"]
+
+    index.add([("c2", "m2")])
+    assert await index.find(["c1", "c2"]) == ["m1", "m2"]
+    index.remove_medicamentos(["m1"])
+    assert await index.find(["c1", "c2"], match_all=False) == ["m2"]
+    index.remove_compuestos(["c2"])
+    assert await index.find(["c1", "c2"]) == []
+    index.remove([("c1", "m2")])
+    assert await index.find(["c1"]) == []
+    assert source.scans == 1
+
+
+async def test_expired_index_is_rebuilt_in_the_background():
+    source = _Source([("c1", "m1")])
+    index = CompositionIndex(source, ttl=0)
+    await index.find(["c1"])
+    source.pairs.append(("c1", "m2"))
+    source.gate = asyncio.Event()
+
+    # mientras se recorre la coleccion se sigue respondiendo con el indice anterior
+    assert await index.find(["c1"]) == ["m1"]
+    await asyncio.sleep(0)
+    assert source.scans == 2
+    # una escritura local durante la reconstruccion no se pierde al cambiar de indice
+    index.remove_medicamentos(["m1"])
+    source.gate.set()
+    await index._rebuild
+
+    assert await index.find(["c1"]) == ["m2"]
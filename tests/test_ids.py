@@ -0,0 +1,27 @@
+import pytest
+from app.repositories.ids import normalize_id
+
+pytestmark = pytest.mark.anyio
+
+
+def test_normalize_id():
+    assert normalize_id("64B0000000000000000000AF") == "64b0000000000000000000af"
+    assert normalize_id("not-an-id") is None
+
+
+async def test_uppercase_ids_find_the_same_documents(client, db):
+    medicamento = (await client.post("/api/medicamentos/", json={"nombre": "Dolex", "fabricante": "GSK"})).json()
+    compuesto = (await client.post("/api/compuestos/", json={"nombre": "Acetaminofen"})).json()
+    upper_medicamento, upper_compuesto = medicamento["_id"].upper(), compuesto["_id"].upper()
+
+    response = await client.get(f"/api/medicamentos/{upper_medicamento}")
+    assert (response.status_code, response.json()["_id"]) == (200, medicamento["_id"])
+    # la relacion se valida con existing_ids sobre los ids tal como llegaron
+    response = await client.post("/api/medicamentos/compuestos/bulk", json=[
+        {"medicamento_id": upper_medicamento, "compuesto_id": upper_compuesto, "concentracion": 500, "unidad": "mg"}
+    ])
+    assert [item["status"] for item in response.json()] == ["created"]
+
+    # el PUT con el id en mayusculas actualiza la entrada de la cache que leen los demas
+    await client.put(f"/api/medicamentos/{upper_medicamento}", json={"nombre": "Dolex Forte", "fabricante": "GSK"})
+    assert (await client.get(f"/api/medicamentos/{medicamento['_id']}")).json()["nombre"] == "Dolex Forte"
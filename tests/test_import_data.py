@@ -0,0 +1,49 @@
+import io
+import json
+import pytest
+from bson import ObjectId
+from app.db.scripts import import_data
+from app.db.scripts.import_data import iter_json_array
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # bloques diminutos para que casi todo documento quede partido entre dos lecturas
+    monkeypatch.setattr(import_data, "CHUNK_SIZE", 7)
+
+
+def test_documents_split_across_chunks_are_decoded(small_chunks):
+    text = ' \n[ {"_id": {"$oid": "64b000000000000000000001"}, "nombre": "Acetaminofén"} ,\n {"nombre": "Ibuprofeno"},{"nombre": "x"}\n]\n'
+
+    documents = list(iter_json_array(io.StringIO(text)))
+
+    assert documents == [
+        {"_id": ObjectId("64b000000000000000000001"), "nombre": "Acetaminofén"},
+        {"nombre": "Ibuprofeno"},
+        {"nombre": "x"},
+    ]
+
+
+def test_empty_array(small_chunks):
+    assert list(iter_json_array(io.StringIO("  [ \n ]"))) == []
+
+
+def test_truncated_array_fails(small_chunks):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO('[{"nombre": "a"}, {"nombre": ')))
+
+
+def test_malformed_document_fails_once_past_the_bound(monkeypatch, small_chunks):
+    monkeypatch.setattr(import_data, "MAX_DOCUMENT_CHARS", 64)
+    text = '[{"nombre": oops}' + ", " * 10_000 + "]"
+    source = io.StringIO(text)
+
+    with pytest.raises(ValueError, match="malformed"):
+        list(iter_json_array(source))
+    # falla sin leer el archivo hasta el final
+    assert source.tell() < 200
+
+
+def test_not_an_array():
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(json.dumps({"nombre": "a"}))))
@@ -0,0 +1,92 @@
+from datetime import timedelta
+import pytest
+from app.repositories.jobs_repo import JobRepository, _now
+from app.services.job_runner import JobRunner
+
+pytestmark = pytest.mark.anyio
+
+
+def _runner(steps, **kwargs):
+    options = {"batch_size": 2, "batch_pause": 0, "poll_seconds": 0, "lease_seconds": 60, "max_attempts": 2}
+    options.update(kwargs)
+    return JobRunner(steps, **options)
+
+
+def _counting_step(items):
+    """Step over a shared list: removes up to limit items per batch"""
+    async def step(params, limit, session):
+        batch = items[:limit]
+        del items[:limit]
+        return len(batch)
+    return step
+
+
+async def test_claim_takes_the_oldest_queued_job(db):
+    first = await JobRepository.create("a", {}, 1)
+    await JobRepository.create("b", {}, 1)
+
+    claimed = await JobRepository.claim(60)
+
+    assert claimed["_id"] == first["_id"]
+    assert (claimed["status"], claimed["attempts"]) == ("running", 1)
+    assert claimed["started_at"] is not None
+
+
+async def test_claim_skips_running_jobs_with_a_live_lease(db):
+    await JobRepository.create("a", {}, 1)
+    await JobRepository.claim(60)
+
+    assert await JobRepository.claim(60) is None
+
+
+async def test_claim_resumes_a_job_whose_lease_expired(db):
+    job = await JobRepository.create("a", {}, 1)
+    claimed = await JobRepository.claim(60)
+    await db.jobs.update_one({"_id": job["_id"]}, {"$set": {"lease_until": _now() - timedelta(seconds=1)}})
+
+    resumed = await JobRepository.claim(60)
+
+    assert resumed["_id"] == job["_id"]
+    assert resumed["attempts"] == 2
+    # started_at es el de la primera vez
+    assert resumed["started_at"] == claimed["started_at"]
+
+
+async def test_process_runs_batches_until_the_step_returns_zero(db):
+    items = list(range(5))
+    runner = _runner({"count": _counting_step(items)})
+    await JobRepository.create("count", {}, 5)
+
+    await runner._process(await JobRepository.claim(60))
+
+    job = await db.jobs.find_one({})
+    assert (job["status"], job["processed"], job["lease_until"]) == ("done", 5, None)
+    assert items == []
+    assert runner.batches == 3
+
+
+async def test_failed_job_is_requeued_then_marked_failed(db):
+    async def broken(params, limit, session):
+        raise RuntimeError("boom")
+    runner = _runner({"broken": broken})
+    await JobRepository.create("broken", {}, 1)
+
+    await runner._process(await JobRepository.claim(60))
+    job = await db.jobs.find_one({})
+    assert (job["status"], job["error"]) == ("queued", "boom")
+
+    await runner._process(await JobRepository.claim(60))
+    job = await db.jobs.find_one({})
+    assert job["status"] == "failed"
+    assert runner.failed == 1
+
+
+async def test_unknown_job_type_fails_without_retry(db):
+    runner = _runner({})
+    await JobRepository.create("missing", {}, 1)
+
+    await runner._process(await JobRepository.claim(60))
+
+    job = await db.jobs.find_one({})
+    assert job["status"] == "failed"
+    assert "missing" in job["error"]
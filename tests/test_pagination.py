@@ -0,0 +1,57 @@
+import pytest
+from bson import ObjectId
+from app.repositories.pagination import DEFAULT_LIMIT, MAX_LIMIT, build_keyset_query, clamp_limit, decode_cursor, encode_cursor
+
+pytestmark = pytest.mark.anyio
+
+
+async def _pages(collection, sort, limit):
+    """Every page of the collection following the cursors, as lists of nombres"""
+    pages, after = [], None
+    while True:
+        query, sort_spec = build_keyset_query(sort, after)
+        documents = await collection.find(query).sort(sort_spec).limit(limit).to_list(limit)
+        if not documents:
+            return pages
+        pages.append([document["nombre"] for document in documents])
+        after = encode_cursor(sort, documents[-1])
+
+
+def test_cursor_round_trip():
+    document = {"_id": ObjectId(), "nombre": "Ibuprofeno ñ"}
+    cursor = encode_cursor("nombre", document)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor, "nombre") == (document["_id"], "Ibuprofeno ñ")
+    assert decode_cursor(encode_cursor("_id", document), "_id") == (document["_id"], None)
+
+
+@pytest.mark.parametrize("cursor", ["", "no-es-base64!", encode_cursor("_id", {"_id": "abc"})])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError, match="Invalid pagination cursor"):
+        decode_cursor(cursor, "_id")
+
+
+def test_cursor_is_bound_to_its_sort():
+    cursor = encode_cursor("nombre", {"_id": ObjectId(), "nombre": "A"})
+
+    with pytest.raises(ValueError, match="does not match"):
+        build_keyset_query("_id", cursor)
+    with pytest.raises(ValueError, match="Sort field"):
+        build_keyset_query("fabricante", None)
+
+
+def test_clamp_limit():
+    assert [clamp_limit(None), clamp_limit(0), clamp_limit(5), clamp_limit(MAX_LIMIT + 1)] == [DEFAULT_LIMIT, DEFAULT_LIMIT, 5, MAX_LIMIT]
+
+
+async def test_pages_cover_ties_on_the_sort_key_once(db):
+    # nombres repetidos: el _id desempata y ningun documento se repite ni se salta entre paginas
+    nombres = ["B", "A", "B", "C", "A", "B", "D"]
+    await db.medicamentos.insert_many([{"nombre": nombre, "fabricante": "X"} for nombre in nombres])
+
+    pages = await _pages(db.medicamentos, "nombre", 2)
+
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+    assert [nombre for page in pages for nombre in page] == sorted(nombres)
+    assert [nombre for page in await _pages(db.medicamentos, "_id", 3) for nombre in page] == nombres
@@ -0,0 +1,53 @@
+import pytest
+from app.models.compuesto import Compuesto
+from app.models.medicamento import Medicamento
+from app.services.patch import merge_patch_changes
+
+pytestmark = pytest.mark.anyio
+
+CURRENT = Medicamento(_id="a" * 24, nombre="Dolex", fabricante="GSK", version=3)
+
+
+def test_only_changed_fields_are_returned():
+    patch = {"nombre": "Dolex", "fabricante": "Haleon", "_id": "otro", "version": 9}
+
+    assert merge_patch_changes(CURRENT, patch, ("nombre", "fabricante")) == {"fabricante": "Haleon"}
+    assert merge_patch_changes(CURRENT, {"nombre": "Dolex"}, ("nombre", "fabricante")) == {}
+
+
+@pytest.mark.parametrize("patch, message", [
+    (["nombre"], "JSON object"),
+    ({"precio": 1}, "Unknown fields: precio"),
+    # null quita el campo, y el modelo lo exige
+    ({"fabricante": None}, "Invalid patch: fabricante"),
+    ({"nombre": 5}, "Invalid patch: nombre"),
+])
+def test_invalid_patches_are_rejected(patch, message):
+    with pytest.raises(ValueError, match=message):
+        merge_patch_changes(CURRENT, patch, ("nombre", "fabricante"))
+
+
+async def test_patch_writes_only_when_something_changes(client, db):
+    compuesto = (await client.post("/api/compuestos/", json={"nombre": "Paracetamol"})).json()
+    url = f"/api/compuestos/{compuesto['_id']}"
+
+    unchanged = await client.patch(url, json={"nombre": "Paracetamol"})
+    assert (unchanged.status_code, unchanged.json()["version"]) == (200, 1)
+
+    patched = await client.patch(url, json={"nombre": "Acetaminofen"})
+    assert (patched.json()["nombre"], patched.json()["version"]) == ("Acetaminofen", 2)
+    assert (await client.patch(url, json={"nombre": " "})).status_code == 400
+    assert (await client.patch(url, json={"dosis": 1})).status_code == 400
+
+
+async def test_patch_recomputes_the_diff_after_a_concurrent_write(client, db):
+    compuesto = (await client.post("/api/compuestos/", json={"nombre": "Paracetamol"})).json()
+    url = f"/api/compuestos/{compuesto['_id']}"
+    await client.get(url)
+    # escritura por fuera de la cache: el primer intento parte de una version vieja
+    await db.compuestos.update_one({"nombre": "Paracetamol"}, {"$set": {"nombre": "Acetaminofen"}, "$inc": {"version": 1}})
+
+    patched = await client.patch(url, json={"nombre": "Ibuprofeno"})
+
+    assert (patched.status_code, patched.json()["nombre"], patched.json()["version"]) == (200, "Ibuprofeno", 3)
+    assert Compuesto(**(await client.get(url)).json()).version == 3
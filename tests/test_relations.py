@@ -0,0 +1,71 @@
+import pytest
+from bson import ObjectId
+from app.db.indexes import index_keys, index_options, load_index_definitions
+from app.repositories.stats_repo import StatsRepository
+from app.repositories.views_repo import MaterializedViewRepository
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def relation_indexes(db):
+    for definition in load_index_definitions("compuestos_por_medicamento"):
+        await db.compuestos_por_medicamento.create_index(index_keys(definition), **index_options(definition))
+
+
+async def test_adding_the_same_compuesto_twice_is_a_conflict(client, db, relation_indexes):
+    medicamento_id = (await client.post("/api/medicamentos/", json={"nombre": "Dolex", "fabricante": "GSK"})).json()["_id"]
+    compuesto_id = (await client.post("/api/compuestos/", json={"nombre": "Acetaminofen"})).json()["_id"]
+    body = {"compuesto_id": compuesto_id, "concentracion": 500, "unidad": "mg"}
+
+    first = await client.post(f"/api/medicamentos/{medicamento_id}/compuestos", json=body)
+    second = await client.post(f"/api/medicamentos/{medicamento_id}/compuestos", json=body)
+
+    assert first.status_code == 201
+    assert second.status_code == 409
+    assert await db.compuestos_por_medicamento.count_documents({}) == 1
+
+
+async def test_bulk_link_reports_duplicates_per_item(client, db, relation_indexes):
+    medicamento_id = (await client.post("/api/medicamentos/", json={"nombre": "Dolex", "fabricante": "GSK"})).json()["_id"]
+    compuesto_id = (await client.post("/api/compuestos/", json={"nombre": "Acetaminofen"})).json()["_id"]
+    item = {"medicamento_id": medicamento_id, "compuesto_id": compuesto_id, "concentracion": 500, "unidad": "mg"}
+
+    response = await client.post("/api/medicamentos/compuestos/bulk", json=[item, item])
+
+    assert [result["status"] for result in response.json()] == ["created", "error"]
+
+
+async def _create(client):
+    medicamento_id = (await client.post("/api/medicamentos/", json={"nombre": "Dolex", "fabricante": "GSK"})).json()["_id"]
+    compuesto_id = (await client.post("/api/compuestos/", json={"nombre": "Acetaminofen"})).json()["_id"]
+    return medicamento_id, compuesto_id
+
+
+async def _bulk_link_uppercase(client, medicamento_id, compuesto_id):
+    item = {"medicamento_id": medicamento_id.upper(), "compuesto_id": compuesto_id.upper(), "concentracion": 500, "unidad": "mg"}
+    response = await client.post("/api/medicamentos/compuestos/bulk", json=[item])
+    assert [result["status"] for result in response.json()] == ["created"]
+
+
+async def test_bulk_link_with_uppercase_ids_leaves_no_counters_after_delete(client, db, monkeypatch):
+    monkeypatch.setattr(StatsRepository, "enabled", True)
+    medicamento_id, compuesto_id = await _create(client)
+    await _bulk_link_uppercase(client, medicamento_id, compuesto_id)
+    assert await db.estadisticas.count_documents({"_id": f"compuesto:{compuesto_id}"}) == 1
+
+    assert (await client.delete(f"/api/medicamentos/{medicamento_id}")).status_code == 200
+
+    assert await db.estadisticas.count_documents({"tipo": {"$in": ["compuesto", "medicamento"]}}) == 0
+
+
+async def test_bulk_link_with_uppercase_ids_reaches_the_views(client, db, monkeypatch):
+    medicamento_id, compuesto_id = await _create(client)
+    # las vistas se activan despues de crear: mongomock no implementa los array_filters de save_medicamento
+    monkeypatch.setattr(MaterializedViewRepository, "enabled", True)
+    await _bulk_link_uppercase(client, medicamento_id, compuesto_id)
+
+    view = await db.medicamentos_view.find_one({"_id": ObjectId(medicamento_id)})
+
+    assert [str(compuesto["_id"]) for compuesto in view["compuestos"]] == [compuesto_id]
+    assert await db.compuestos_view.count_documents({"medicamentos._id": ObjectId(medicamento_id)}) == 1
@@ -0,0 +1,35 @@
+import asyncio
+import pytest
+from app.monitoring.slow_queries import SlowQueryLog
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeDatabase:
+    def __init__(self, started: asyncio.Event, release: asyncio.Event):
+        self.started = started
+        self.release = release
+
+    async def command(self, command):
+        self.started.set()
+        await self.release.wait()
+        return {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}, "executionStats": {"nReturned": 3}}
+
+
+async def test_explain_task_is_kept_until_done():
+    started, release = asyncio.Event(), asyncio.Event()
+    log = SlowQueryLog(threshold_ms=1, explains_per_minute=10, size=10)
+    log.bind(asyncio.get_running_loop(), {"farmacia": FakeDatabase(started, release)})
+
+    log.observe("farmacia", "medicamentos", "find", {"find": "medicamentos", "filter": {"nombre": "x"}, "lsid": 1}, 0.5)
+    await asyncio.wait_for(started.wait(), 1)
+
+    # la explain en curso tiene una referencia fuerte
+    assert len(log._tasks) == 1
+    release.set()
+    await asyncio.gather(*log._tasks)
+    await asyncio.sleep(0)
+
+    assert not log._tasks
+    explain = log.records()[0]["explain"]
+    assert explain["collection_scan"] and explain["n_returned"] == 3
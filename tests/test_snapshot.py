@@ -0,0 +1,123 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from pymongo.errors import AutoReconnect, OperationFailure
+from app.repositories import snapshot as snapshot_module
+from app.repositories.snapshot import CollectionSnapshot
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeStream:
+    """Change stream that yields its events, then raises error (or waits forever)"""
+
+    def __init__(self, events, error=None, resume_token="t0"):
+        self.events = list(events)
+        self.error = error
+        self.resume_token = resume_token
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def _pop(self):
+        event = self.events.pop(0)
+        self.resume_token = event["_id"]
+        return event
+
+    async def try_next(self):
+        return self._pop() if self.events else None
+
+    async def next(self):
+        if self.events:
+            return self._pop()
+        if self.error is not None:
+            raise self.error
+        await asyncio.Event().wait()
+
+
+class FakeCollection:
+    def __init__(self, documents, streams):
+        self.documents = documents
+        self.streams = streams
+        self.resumed_after = []
+
+    def watch(self, full_document, resume_after):
+        self.resumed_after.append(resume_after)
+        return self.streams.pop(0)
+
+    async def find(self, query):
+        for document in list(self.documents):
+            yield document
+
+
+def _change(token, operation, id, version=1):
+    document = None if operation == "delete" else {"_id": id, "version": version}
+    return {"_id": token, "operationType": operation, "documentKey": {"_id": id}, "fullDocument": document}
+
+
+@pytest.fixture
+async def tail(monkeypatch):
+    started = []
+
+    def run(collection):
+        monkeypatch.setattr(snapshot_module, "get_collection", lambda name: collection)
+        snapshot = CollectionSnapshot("compuestos", lambda document: SimpleNamespace(id=document["_id"], version=document["version"]), retry_seconds=0)
+        started.append(snapshot)
+        return snapshot
+
+    yield run
+    for snapshot in started:
+        await snapshot.stop()
+
+
+async def _until(condition):
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0)
+    raise AssertionError("condition not reached")
+
+
+async def test_resumes_from_the_last_token_without_reloading(tail):
+    collection = FakeCollection([{"_id": "a", "version": 1}], [
+        # el insert llega antes de la carga y se reaplica despues de ella
+        FakeStream([_change("t1", "insert", "b")], AutoReconnect("red caida")),
+        FakeStream([_change("t2", "update", "a", version=2), _change("t3", "delete", "b")]),
+    ])
+    snapshot = tail(collection)
+
+    await snapshot.start()
+    await _until(lambda: snapshot.resumes == 1 and snapshot.get("b") is None)
+
+    assert collection.resumed_after == [None, "t1"]
+    assert (snapshot.reloads, snapshot.get("a").version, len(snapshot)) == (1, 2, 1)
+    assert snapshot.ready
+
+
+async def test_lost_resume_token_reloads_everything(tail):
+    collection = FakeCollection([{"_id": "a", "version": 1}], [
+        FakeStream([], OperationFailure("history lost", code=286)),
+        FakeStream([]),
+    ])
+    snapshot = tail(collection)
+
+    await snapshot.start()
+    collection.documents.append({"_id": "b", "version": 1})
+    await _until(lambda: snapshot.reloads == 2)
+
+    assert collection.resumed_after == [None, None]
+    assert (snapshot.resumes, len(snapshot)) == (0, 2)
+
+
+async def test_stale_events_do_not_overwrite_newer_local_writes():
+    snapshot = CollectionSnapshot("compuestos", lambda document: SimpleNamespace(id=document["_id"], version=document["version"]))
+    snapshot.put(SimpleNamespace(id="a", version=3))
+    snapshot.invalidate("b")
+
+    snapshot._apply(_change("t1", "update", "a", version=2))
+
+    assert snapshot.get("a").version == 3
+    assert snapshot._is_pending("b")
@@ -0,0 +1,80 @@
+import pytest
+from bson import ObjectId
+from app.repositories.jobs_repo import JobRepository
+from app.repositories.medicamentos_repo import MedicamentoRepository
+from app.repositories.stats_repo import StatsRepository
+from app.services.job_runner import JobRunner
+from app.services.job_service import JobService
+from tests.conftest import linked_medicamentos
+
+pytestmark = pytest.mark.anyio
+
+
+async def _fabricantes():
+    return {row["clave"]: row["n"] for row in await StatsRepository.top("fabricante", 10)}
+
+
+async def test_put_moves_the_fabricante_counter(client, monkeypatch):
+    monkeypatch.setattr(StatsRepository, "enabled", True)
+    medicamento = (await client.post("/api/medicamentos/", json={"nombre": "Dolex", "fabricante": "GSK"})).json()
+
+    response = await client.put(f"/api/medicamentos/{medicamento['_id']}", json={"nombre": "Dolex", "fabricante": "Haleon"})
+
+    assert response.status_code == 200
+    assert (response.json()["fabricante"], response.json()["version"]) == ("Haleon", 2)
+    assert await _fabricantes() == {"Haleon": 1}
+    # la respuesta y la cache muestran la version nueva
+    assert (await client.get(f"/api/medicamentos/{medicamento['_id']}")).json()["version"] == 2
+
+
+async def test_304_reads_only_the_version(client):
+    medicamento = (await client.post("/api/medicamentos/", json={"nombre": "Dolex", "fabricante": "GSK"})).json()
+    etag = (await client.get(f"/api/medicamentos/{medicamento['_id']}")).headers["etag"]
+    MedicamentoRepository.cache.clear()
+
+    response = await client.get(f"/api/medicamentos/{medicamento['_id']}", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    # el documento completo no se cargo (ni quedo en la cache) para responder el 304
+    assert MedicamentoRepository.cache.get(medicamento["_id"]) is None
+
+
+async def _related_versions(db, compuesto_id):
+    relations = await db.compuestos_por_medicamento.find({"compuesto_id": ObjectId(compuesto_id)}).to_list(None)
+    documents = await db.medicamentos.find({"_id": {"$in": [r["medicamento_id"] for r in relations]}}).to_list(None)
+    return sorted(document["version"] for document in documents)
+
+
+async def test_put_without_visible_changes_does_not_touch_related(client, db):
+    compuesto_id, _ = await linked_medicamentos(client, 2)
+    before = await _related_versions(db, compuesto_id)
+
+    assert (await client.put(f"/api/compuestos/{compuesto_id}", json={"nombre": "Acetaminofen"})).status_code == 200
+    assert await _related_versions(db, compuesto_id) == before
+
+    assert (await client.patch(f"/api/compuestos/{compuesto_id}", json={"nombre": "Paracetamol"})).status_code == 200
+    assert await _related_versions(db, compuesto_id) == [version + 1 for version in before]
+
+
+async def test_rename_with_many_related_is_touched_by_a_job(client, db, jobs):
+    compuesto_id, _ = await linked_medicamentos(client, 3)
+    before = await _related_versions(db, compuesto_id)
+
+    response = await client.put(f"/api/compuestos/{compuesto_id}", json={"nombre": "Paracetamol"})
+
+    assert response.status_code == 200
+    assert await _related_versions(db, compuesto_id) == before
+    job = await JobRepository.claim(60)
+    assert (job["tipo"], job["total"]) == ("touch_related", 3)
+    await JobRunner(JobService.steps, batch_size=2, batch_pause=0, poll_seconds=0)._process(job)
+    assert await _related_versions(db, compuesto_id) == [version + 1 for version in before]
+    assert (await JobRepository.get_by_id(str(job["_id"])))["status"] == "done"
+
+
+async def test_put_to_a_missing_id_is_404_even_with_an_invalid_body(client):
+    missing = str(ObjectId())
+    medicamento = (await client.post("/api/medicamentos/", json={"nombre": "Dolex", "fabricante": "GSK"})).json()
+
+    assert (await client.put(f"/api/medicamentos/{missing}", json={"nombre": "", "fabricante": "GSK"})).status_code == 404
+    assert (await client.put(f"/api/compuestos/{missing}", json={"nombre": " "})).status_code == 404
+    assert (await client.put(f"/api/medicamentos/{medicamento['_id']}", json={"nombre": "Dolex", "fabricante": ""})).status_code == 400